@@ -20,6 +20,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'challenges.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -27,6 +28,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'challenges.middleware.JobMessagesMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -49,13 +51,53 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'challengehub.wsgi.application'
 
+# Боевой профиль SQLite (WAL, busy_timeout, BEGIN IMMEDIATE для записи) - см. challengehub/sqlite
+CHALLENGES_SQLITE_PRODUCTION = os.environ.get('CHALLENGES_SQLITE_PRODUCTION', '') == '1'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': 'challengehub.sqlite' if CHALLENGES_SQLITE_PRODUCTION else 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('CHALLENGES_DB_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Соединение только для чтения для статистики, достижений и списков в админке.
+# По умолчанию - тот же файл, открытый с mode=ro; можно указать снимок базы.
+DATABASES['readonly'] = {
+    **DATABASES['default'],
+    'NAME': 'file:{}?mode=ro'.format(os.environ.get('CHALLENGES_READONLY_DB_PATH', DATABASES['default']['NAME'])),
+    'TEST': {'MIRROR': 'default'},
+}
+if CHALLENGES_SQLITE_PRODUCTION:
+    DATABASES['readonly']['OPTIONS'] = {'pragmas': {'journal_mode': None, 'query_only': 'ON'}}
+
+DATABASE_ROUTERS = ['challenges.routers.ReadOnlyRouter']
+
+# Кеш страниц пользователей (challenges/page_cache.py) работает только с кешем,
+# общим для процессов: CHALLENGES_CACHE_DIR включает файловый кеш для всех воркеров
+# и run_jobs. С локальной памятью (по умолчанию) страницы не кешируются.
+if os.environ.get('CHALLENGES_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CHALLENGES_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CHALLENGES_PAGE_CACHE_TIMEOUT = int(os.environ.get('CHALLENGES_PAGE_CACHE_TIMEOUT', 3600))
+
+# Метрики запросов для /metrics (challenges/metrics.py). Каталог нужен, чтобы
+# суммировать метрики всех воркеров gunicorn; токен - для сборщика Prometheus
+# (заголовок Authorization: Bearer <токен>), без него страница только для staff.
+CHALLENGES_METRICS_DIR = os.environ.get('CHALLENGES_METRICS_DIR') or None
+CHALLENGES_METRICS_TOKEN = os.environ.get('CHALLENGES_METRICS_TOKEN') or None
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -82,12 +124,21 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'challenges/static'),
 ]
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    # plotly.js из пакета plotly, см. challenges/finders.py
+    'challenges.finders.PlotlyJSFinder',
+]
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Фоновая очередь задач после отметок (нужен запущенный `manage.py run_jobs`)
+CHALLENGES_ASYNC_JOBS = os.environ.get('CHALLENGES_ASYNC_JOBS', '') == '1'
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = '/profile/'
 LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
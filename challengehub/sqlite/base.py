@@ -0,0 +1,47 @@
+"""
+SQLite-бэкенд для боевого режима.
+
+Отличается от стандартного django.db.backends.sqlite3 двумя вещами:
+на каждом новом соединении выставляются PRAGMA (WAL, busy_timeout и
+т.д.), а транзакции, открытые через challenges.transactions.immediate_atomic,
+начинаются с BEGIN IMMEDIATE - блокировка на запись берется сразу, и
+параллельный писатель ждет busy_timeout вместо ошибки "database is locked"
+при попытке повысить блокировку посреди транзакции.
+
+PRAGMA можно переопределить в DATABASES[...]['OPTIONS']['pragmas'];
+значение None отключает PRAGMA (например, journal_mode для соединения
+только для чтения - режим журнала задает пишущее соединение).
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',       # читатели не блокируются писателем
+    'busy_timeout': 5000,        # мс ожидания блокировки вместо немедленной ошибки
+    'synchronous': 'NORMAL',     # в режиме WAL безопасно и без fsync на каждый коммит
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,        # отрицательное значение - в КиБ (около 20 МБ)
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Включается immediate_atomic на время открытия внешней транзакции
+        self.immediate_transactions = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            if value is None:
+                continue
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.immediate_transactions else 'BEGIN')
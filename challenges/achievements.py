@@ -1,289 +1,252 @@
 # achievements.py
 from django.utils import timezone
-from datetime import timedelta
+from django.db import IntegrityError, transaction
 from django.db.models import F
-from .models import Achievement, UserChallenge, DailyCheckin
+from django.utils.functional import SimpleLazyObject
+from .models import Achievement, UserChallenge
+from .activity import current_streak, longest_streak
+from .summary import get_user_stats
+from .page_cache import invalidate_user_pages
 
-def check_and_create_achievements(user):
-    """Проверяет и создает достижения для пользователя"""
-    
-    achievements_created = []
-    
-    # 1. Проверяем достижение "Первая отметка"
-    first_checkin = DailyCheckin.objects.filter(
-        user_challenge__user=user
-    ).order_by('date').first()
-    
-    if first_checkin:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='streak',
-            title='Первый шаг',
-            defaults={
-                'description': 'Сделал первую отметку в челлендже',
-                'icon': '👣',
-                'progress': 1,
-                'target': 1
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 2. Проверяем достижение "Неделя подряд"
-    today = timezone.now().date()
-    
-    # Считаем, сколько дней подряд пользователь отмечался
-    consecutive_days = 0
-    current_date = today
-    
-    while True:
-        has_checkin = DailyCheckin.objects.filter(
-            user_challenge__user=user,
-            date=current_date,
-            is_completed=True
-        ).exists()
-        
-        if has_checkin:
-            consecutive_days += 1
-            current_date -= timedelta(days=1)
-        else:
-            break
-    
-    if consecutive_days >= 7:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='streak',
-            title='Неделя дисциплины',
-            defaults={
-                'description': 'Отмечался 7 дней подряд',
-                'icon': '🔥',
-                'progress': consecutive_days,
-                'target': 7
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 3. Проверяем достижение "Завершил первый челлендж УСПЕШНО"
-    successful_challenges = UserChallenge.objects.filter(
-        user=user,
-        status='completed'
-    ).count()
-    
-    if successful_challenges >= 1:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='completion',
-            title='Первый успех',
-            defaults={
-                'description': 'Успешно завершил первый челлендж',
-                'icon': '🎯',
-                'progress': successful_challenges,
-                'target': 1
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 4. Проверяем достижение "Мастер разнообразия"
-    categories = UserChallenge.objects.filter(user=user).values_list('category', flat=True)
-    unique_categories = len(set(categories))
-    
-    if unique_categories >= 3:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='variety',
-            title='Мастер разнообразия',
-            defaults={
-                'description': 'Пробовал челленджи в 3+ категориях',
-                'icon': '🌈',
-                'progress': unique_categories,
-                'target': 3
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 5. Проверяем достижение "5 челленджей завершено"
-    if successful_challenges >= 5:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='completion',
-            title='Опытный игрок',
-            defaults={
-                'description': 'Успешно завершил 5 челленджей',
-                'icon': '🏅',
-                'progress': successful_challenges,
-                'target': 5
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 6. Проверяем достижение "Месяц активности"
-    from django.contrib.auth.models import User
-    user_obj = User.objects.get(username=user.username)
-    days_since_join = (timezone.now() - user_obj.date_joined).days
-    
-    if days_since_join >= 30:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='consistency',
-            title='Месяц с нами',
-            defaults={
-                'description': 'Ты с нами уже 30 дней!',
-                'icon': '📅',
-                'progress': days_since_join,
-                'target': 30
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 7. Проверяем достижение "100 дней отметок"
-    total_checkins = DailyCheckin.objects.filter(
-        user_challenge__user=user,
-        is_completed=True
-    ).count()
-    
-    if total_checkins >= 100:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='streak',
-            title='Сотня отметок',
-            defaults={
-                'description': 'Сделал 100 отметок выполнения',
-                'icon': '💯',
-                'progress': total_checkins,
-                'target': 100
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 8. Проверяем достижение "Суперсерия" (максимальная серия за все время)
-    all_checkin_dates = DailyCheckin.objects.filter(
-        user_challenge__user=user,
-        is_completed=True
-    ).values_list('date', flat=True).order_by('date').distinct()
-    
-    max_streak = 0
-    if all_checkin_dates:
-        dates_list = list(all_checkin_dates)
-        current_streak = 1
-        
-        for i in range(1, len(dates_list)):
-            prev_date = dates_list[i-1]
-            curr_date = dates_list[i]
-            
-            if (curr_date - prev_date).days == 1:
-                current_streak += 1
-            else:
-                max_streak = max(max_streak, current_streak)
-                current_streak = 1
-        
-        max_streak = max(max_streak, current_streak)
-    
-    if max_streak >= 30:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='streak',
-            title='Суперсерия',
-            defaults={
-                'description': '30 дней подряд без пропусков',
-                'icon': '⚡',
-                'progress': max_streak,
-                'target': 30
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 9. Проверяем достижение "Марафонец" (длинный челлендж)
-    long_challenges = UserChallenge.objects.filter(
+# События, после которых имеет смысл перепроверять достижения
+EVENT_CHECKIN = 'checkin'      # создана или изменена ежедневная отметка
+EVENT_STATUS = 'status'        # у челленджа изменился статус
+EVENT_CHALLENGE = 'challenge'  # создан новый челлендж
+
+ALL_EVENTS = frozenset({EVENT_CHECKIN, EVENT_STATUS, EVENT_CHALLENGE})
+
+# Правила достижений: какая метрика и какой порог открывают достижение.
+# events - события, которые могут изменить метрику правила. Правила
+# без событий (стаж на сайте) не требуют запросов и проверяются всегда.
+ACHIEVEMENT_RULES = [
+    {
+        'title': 'Первый шаг',
+        'type': 'streak',
+        'description': 'Сделал первую отметку в челлендже',
+        'icon': '👣',
+        'metric': 'has_checkins',
+        'target': 1,
+        'events': {EVENT_CHECKIN},
+    },
+    {
+        'title': 'Неделя дисциплины',
+        'type': 'streak',
+        'description': 'Отмечался 7 дней подряд',
+        'icon': '🔥',
+        'metric': 'current_streak',
+        'target': 7,
+        'events': {EVENT_CHECKIN},
+    },
+    {
+        'title': 'Первый успех',
+        'type': 'completion',
+        'description': 'Успешно завершил первый челлендж',
+        'icon': '🎯',
+        'metric': 'successful_challenges',
+        'target': 1,
+        'events': {EVENT_STATUS},
+    },
+    {
+        'title': 'Мастер разнообразия',
+        'type': 'variety',
+        'description': 'Пробовал челленджи в 3+ категориях',
+        'icon': '🌈',
+        'metric': 'unique_categories',
+        'target': 3,
+        'events': {EVENT_CHALLENGE},
+    },
+    {
+        'title': 'Опытный игрок',
+        'type': 'completion',
+        'description': 'Успешно завершил 5 челленджей',
+        'icon': '🏅',
+        'metric': 'successful_challenges',
+        'target': 5,
+        'events': {EVENT_STATUS},
+    },
+    {
+        'title': 'Месяц с нами',
+        'type': 'consistency',
+        'description': 'Ты с нами уже 30 дней!',
+        'icon': '📅',
+        'metric': 'days_since_join',
+        'target': 30,
+        'events': set(),
+    },
+    {
+        'title': 'Сотня отметок',
+        'type': 'streak',
+        'description': 'Сделал 100 отметок выполнения',
+        'icon': '💯',
+        'metric': 'total_checkins',
+        'target': 100,
+        'events': {EVENT_CHECKIN},
+    },
+    {
+        'title': 'Суперсерия',
+        'type': 'streak',
+        'description': '30 дней подряд без пропусков',
+        'icon': '⚡',
+        'metric': 'max_streak',
+        'target': 30,
+        'events': {EVENT_CHECKIN},
+    },
+    {
+        'title': 'Марафонец',
+        'type': 'consistency',
+        'description': 'Начал челлендж на 90+ дней',
+        'icon': '🏃‍♂️',
+        'metric': 'long_challenges',
+        'target': 1,
+        'events': {EVENT_CHALLENGE},
+    },
+    {
+        'title': 'Идеальное выполнение',
+        'type': 'completion',
+        'description': 'Завершил челлендж на 100%',
+        'icon': '⭐',
+        'metric': 'perfect_challenges',
+        'target': 1,
+        'events': {EVENT_STATUS},
+    },
+    {
+        'title': 'Ветеран',
+        'type': 'consistency',
+        'description': 'Ты с нами уже 200 дней!',
+        'icon': '👴',
+        'metric': 'days_since_join',
+        'target': 200,
+        'events': set(),
+    },
+    {
+        'title': 'Мастер челленджей',
+        'type': 'completion',
+        'description': 'Успешно завершил 10 челленджей',
+        'icon': '👑',
+        'metric': 'successful_challenges',
+        'target': 10,
+        'events': {EVENT_STATUS},
+    },
+]
+
+
+def _has_checkins(user, summary):
+    return int(summary.total_checkins > 0)
+
+
+def _current_streak(user, summary):
+    return current_streak(user)
+
+
+def _successful_challenges(user, summary):
+    return summary.completed_challenges
+
+
+def _unique_categories(user, summary):
+    return UserChallenge.objects.with_progress().filter(user=user).exclude(
+        effective_category=''
+    ).values('effective_category').distinct().count()
+
+
+def _days_since_join(user, summary):
+    return (timezone.now() - user.date_joined).days
+
+
+def _total_checkins(user, summary):
+    return summary.completed_checkins
+
+
+def _max_streak(user, summary):
+    return longest_streak(user)
+
+
+def _long_challenges(user, summary):
+    return UserChallenge.objects.with_progress().filter(
         user=user,
-        custom_duration__gte=90
+        effective_duration__gte=90
     ).count()
-    
-    if long_challenges >= 1:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='consistency',
-            title='Марафонец',
-            defaults={
-                'description': 'Начал челлендж на 90+ дней',
-                'icon': '🏃‍♂️',
-                'progress': long_challenges,
-                'target': 1
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 10. Проверяем достижение "Идеальное выполнение" (челлендж на 100%)
-    perfect_challenges = UserChallenge.objects.filter(
+
+
+def _perfect_challenges(user, summary):
+    return UserChallenge.objects.with_progress().filter(
         user=user,
         status='completed',
-        completed_days=F('duration_days')
+        completed_days__gte=F('effective_duration')
     ).count()
-    
-    if perfect_challenges >= 1:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='completion',
-            title='Идеальное выполнение',
-            defaults={
-                'description': 'Завершил челлендж на 100%',
-                'icon': '⭐',
-                'progress': perfect_challenges,
-                'target': 1
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 11. Проверяем достижение "200 дней с нами"
-    if days_since_join >= 200:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='consistency',
-            title='Ветеран',
-            defaults={
-                'description': 'Ты с нами уже 200 дней!',
-                'icon': '👴',
-                'progress': days_since_join,
-                'target': 200
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    # 12. Проверяем достижение "10 завершенных челленджей"
-    if successful_challenges >= 10:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            type='completion',
-            title='Мастер челленджей',
-            defaults={
-                'description': 'Успешно завершил 10 челленджей',
-                'icon': '👑',
-                'progress': successful_challenges,
-                'target': 10
-            }
-        )
-        if created:
-            achievements_created.append(achievement)
-    
-    return achievements_created
+
+
+METRICS = {
+    'has_checkins': _has_checkins,
+    'current_streak': _current_streak,
+    'successful_challenges': _successful_challenges,
+    'unique_categories': _unique_categories,
+    'days_since_join': _days_since_join,
+    'total_checkins': _total_checkins,
+    'max_streak': _max_streak,
+    'long_challenges': _long_challenges,
+    'perfect_challenges': _perfect_challenges,
+}
+
+
+def evaluate_achievements(user, events=ALL_EVENTS):
+    """
+    Инкрементально проверяет достижения пользователя.
+
+    Проверяются только еще не полученные достижения, чьи метрики могли
+    измениться из-за переданных событий. Каждая метрика считается не
+    больше одного раза. Возвращает список только что открытых достижений.
+    """
+    events = set(events)
+    # Счетчики из сводки пользователя читаются одним запросом и только при необходимости
+    summary = SimpleLazyObject(lambda: get_user_stats(user))
+    earned_titles = set(
+        Achievement.objects.filter(user=user).order_by().values_list('title', flat=True)
+    )
+
+    metric_values = {}
+    unlocked = []
+    for rule in ACHIEVEMENT_RULES:
+        if rule['title'] in earned_titles:
+            continue
+        if rule['events'] and not rule['events'] & events:
+            continue
+
+        metric = rule['metric']
+        if metric not in metric_values:
+            metric_values[metric] = METRICS[metric](user, summary)
+        value = metric_values[metric]
+
+        if value >= rule['target']:
+            unlocked.append(Achievement(
+                user=user,
+                type=rule['type'],
+                title=rule['title'],
+                description=rule['description'],
+                icon=rule['icon'],
+                progress=value,
+                target=rule['target'],
+            ))
+
+    created = []
+    for achievement in unlocked:
+        # Достижение, уже записанное параллельной проверкой, не считается новым
+        try:
+            with transaction.atomic():
+                Achievement.objects.bulk_create([achievement])
+        except IntegrityError:
+            continue
+        created.append(achievement)
+    if created:
+        # bulk_create не вызывает сигналы
+        invalidate_user_pages(user.pk)
+    return created
+
+
+def check_and_create_achievements(user):
+    """Проверяет и создает достижения для пользователя"""
+    return evaluate_achievements(user, ALL_EVENTS)
+
 
 def recalculate_all_achievements(user):
-    """Удаляет и пересоздает все достижения пользователя"""
-    from .models import Achievement
-    
-    deleted_count = Achievement.objects.filter(user=user).delete()[0]
-    print(f"Удалено {deleted_count} старых достижений для {user.username}")
-    
-    new_achievements = check_and_create_achievements(user)
-    
-    print(f"Создано {len(new_achievements)} новых достижений для {user.username}")
-    return new_achievements
\ No newline at end of file
+    """Полная перепроверка всех правил без удаления уже полученных достижений"""
+    return evaluate_achievements(user, ALL_EVENTS)
@@ -0,0 +1,127 @@
+# activity.py
+"""
+Индекс дней активности пользователя.
+
+Для каждого дня с хотя бы одной выполненной отметкой хранится строка
+ActivityDay, а в поле streak - длина серии дней подряд, заканчивающейся
+этим днем. Текущая серия читается одной строкой, максимальная - одним
+агрегатом, без обхода всех отметок пользователя.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import ActivityDay, DailyCheckin
+
+
+def _shift_following_run(user_id, day, delta):
+    """Сдвигает серии дней, идущих подряд сразу после day"""
+    following = ActivityDay.objects.filter(
+        user_id=user_id,
+        date__gt=day
+    ).order_by('date').values_list('date', flat=True)
+
+    run_end = None
+    expected = day + timedelta(days=1)
+    for following_day in following.iterator():
+        if following_day != expected:
+            break
+        run_end = following_day
+        expected += timedelta(days=1)
+
+    if run_end:
+        ActivityDay.objects.filter(
+            user_id=user_id,
+            date__gt=day,
+            date__lte=run_end
+        ).update(streak=F('streak') + delta)
+
+
+def sync_activity_day(user_id, day):
+    """
+    Приводит строку ActivityDay за день в соответствие с отметками.
+    Возвращает изменение числа активных дней: 1, -1 или 0.
+    """
+    with transaction.atomic():
+        completed = DailyCheckin.objects.filter(
+            user_challenge__user_id=user_id,
+            date=day,
+            is_completed=True
+        ).count()
+        row = ActivityDay.objects.filter(user_id=user_id, date=day).first()
+
+        if completed:
+            if row:
+                if row.completed_checkins != completed:
+                    row.completed_checkins = completed
+                    row.save(update_fields=['completed_checkins'])
+                return 0
+
+            previous_streak = ActivityDay.objects.filter(
+                user_id=user_id,
+                date=day - timedelta(days=1)
+            ).values_list('streak', flat=True).first() or 0
+            streak = previous_streak + 1
+            ActivityDay.objects.create(
+                user_id=user_id,
+                date=day,
+                completed_checkins=completed,
+                streak=streak
+            )
+            _shift_following_run(user_id, day, streak)
+            return 1
+
+        if row:
+            row.delete()
+            _shift_following_run(user_id, day, -row.streak)
+            return -1
+        return 0
+
+
+def build_activity_days(rows):
+    """
+    Строит объекты ActivityDay из строк (user_id, date, completed_checkins),
+    отсортированных по пользователю и дате.
+    """
+    previous_user = previous_date = None
+    streak = 0
+    for user_id, day, completed in rows:
+        if user_id == previous_user and previous_date and (day - previous_date).days == 1:
+            streak += 1
+        else:
+            streak = 1
+        previous_user, previous_date = user_id, day
+        yield ActivityDay(user_id=user_id, date=day, completed_checkins=completed, streak=streak)
+
+
+def rebuild_activity_days(user_ids=None):
+    """Полностью пересобирает индекс дней активности (для ремонта и массовых загрузок)"""
+    checkins = DailyCheckin.objects.filter(is_completed=True)
+    days = ActivityDay.objects.all()
+    if user_ids is not None:
+        checkins = checkins.filter(user_challenge__user_id__in=user_ids)
+        days = days.filter(user_id__in=user_ids)
+
+    rows = checkins.values_list('user_challenge__user_id', 'date').annotate(
+        completed=Count('id')
+    ).order_by('user_challenge__user_id', 'date')
+
+    with transaction.atomic():
+        days.delete()
+        ActivityDay.objects.bulk_create(build_activity_days(rows.iterator()), batch_size=500)
+
+
+def current_streak(user, today=None):
+    """Сколько дней подряд, заканчивая сегодняшним, есть выполненные отметки"""
+    today = today or timezone.now().date()
+    return ActivityDay.objects.filter(
+        user=user,
+        date=today
+    ).values_list('streak', flat=True).first() or 0
+
+
+def longest_streak(user):
+    """Максимальная серия дней подряд за все время"""
+    return ActivityDay.objects.filter(user=user).aggregate(longest=Max('streak'))['longest'] or 0
@@ -1,8 +1,44 @@
 from django.contrib import admin
-from .models import ChallengeTemplate, UserChallenge, DailyCheckin, Achievement
+from .models import ChallengeTemplate, UserChallenge, DailyCheckin, Achievement, ActivityDay, UserStats, Job
+from .routers import read_only_db
+from .search import index_ready, matching_ids
+
+
+class ReadOnlyChangelistAdmin(admin.ModelAdmin):
+    """Списки объектов читаются через соединение только для чтения"""
+    
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with read_only_db():
+            response = super().changelist_view(request, extra_context)
+            # TemplateResponse рендерится позже - сделаем это внутри блока
+            return response.render() if hasattr(response, 'render') else response
+
+
+class FullTextSearchAdminMixin:
+    """
+    Поиск в списке дополнительно находит объекты по полнотекстовому индексу
+    (challenges/search.py) вместо LIKE '%...%' по длинным текстовым полям.
+    Без индекса ищет по fts_fallback_fields через LIKE.
+    """
+    fts_kind = None
+    fts_fallback_fields = ()
+    
+    def get_search_fields(self, request):
+        fields = tuple(super().get_search_fields(request))
+        return fields if index_ready() else fields + tuple(self.fts_fallback_fields)
+    
+    def get_search_results(self, request, queryset, search_term):
+        queryset_found, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        ids = matching_ids(self.fts_kind, search_term) if search_term else None
+        if ids is not None:
+            queryset_found |= queryset.filter(pk__in=ids)
+        return queryset_found, may_have_duplicates
+
 
 @admin.register(ChallengeTemplate)
-class ChallengeTemplateAdmin(admin.ModelAdmin):
+class ChallengeTemplateAdmin(ReadOnlyChangelistAdmin):
     list_display = ('title', 'category', 'duration_days', 'difficulty_stars', 'is_active', 'created_at')
     list_filter = ('category', 'difficulty', 'is_active', 'created_at')
     search_fields = ('title', 'description')
@@ -15,27 +51,36 @@ class ChallengeTemplateAdmin(admin.ModelAdmin):
 
 
 @admin.register(UserChallenge)
-class UserChallengeAdmin(admin.ModelAdmin):
+class UserChallengeAdmin(FullTextSearchAdminMixin, ReadOnlyChangelistAdmin):
     list_display = ('user', 'title_display', 'category', 'start_date', 'status', 
                    'completion_percentage', 'current_streak')
     list_filter = ('status', 'start_date', 'template__category')
-    search_fields = ('user__username', 'template__title', 'custom_title')
+    search_fields = ('user__username',)
+    fts_kind = 'challenge'
+    fts_fallback_fields = ('template__title', 'custom_title')
     readonly_fields = ('completion_percentage', 'days_passed', 'days_left')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_progress().select_related('user')
+    
     def title_display(self, obj):
         return obj.title
     title_display.short_description = 'Название'
+    title_display.admin_order_field = 'effective_title'
     
     def category(self, obj):
         return obj.category
     category.short_description = 'Категория'
+    category.admin_order_field = 'effective_category'
 
 
 @admin.register(DailyCheckin)
-class DailyCheckinAdmin(admin.ModelAdmin):
+class DailyCheckinAdmin(FullTextSearchAdminMixin, ReadOnlyChangelistAdmin):
     list_display = ('user_challenge', 'date', 'is_completed', 'rating_display', 'created_at')
     list_filter = ('is_completed', 'date', 'rating')
-    search_fields = ('user_challenge__user__username', 'notes')
+    search_fields = ('user_challenge__user__username',)
+    fts_kind = 'checkin'
+    fts_fallback_fields = ('notes',)
     date_hierarchy = 'date'
     
     def rating_display(self, obj):
@@ -46,8 +91,32 @@ class DailyCheckinAdmin(admin.ModelAdmin):
 
 
 @admin.register(Achievement)
-class AchievementAdmin(admin.ModelAdmin):
+class AchievementAdmin(ReadOnlyChangelistAdmin):
     list_display = ('user', 'title', 'type', 'is_completed', 'progress', 'target', 'earned_date')
     list_filter = ('type', 'earned_date')
     search_fields = ('user__username', 'title', 'description')
-    readonly_fields = ('earned_date', 'is_completed', 'progress_percentage')
\ No newline at end of file
+    readonly_fields = ('earned_date', 'is_completed', 'progress_percentage')
+
+
+@admin.register(ActivityDay)
+class ActivityDayAdmin(ReadOnlyChangelistAdmin):
+    list_display = ('user', 'date', 'completed_checkins', 'streak')
+    search_fields = ('user__username',)
+    date_hierarchy = 'date'
+    readonly_fields = ('user', 'date', 'completed_checkins', 'streak')
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(ReadOnlyChangelistAdmin):
+    list_display = ('user', 'total_challenges', 'active_challenges', 'completed_challenges',
+                   'completed_checkins', 'active_days', 'tracked_days', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(Job)
+class JobAdmin(ReadOnlyChangelistAdmin):
+    list_display = ('kind', 'user', 'status', 'attempts', 'run_after', 'created_at', 'updated_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('user__username',)
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,190 @@
+# analytics.py
+"""
+Аналитика и графики для страниц статистики.
+
+pandas и plotly тяжелые: модуль импортируется views только внутри
+представлений статистики, поэтому воркеры не загружают эти библиотеки,
+пока кто-нибудь не откроет страницу с графиками.
+"""
+import pandas as pd
+import plotly.graph_objects as go
+from django.db.models import Count, Q
+
+from .activity import current_streak, longest_streak
+from .charts import render_chart
+from .models import ChallengeTemplate, UserChallenge
+from .summary import get_user_stats
+
+
+def challenge_statistics(user_challenge, checkins):
+    """
+    Графики и показатели одного челленджа по его отметкам (по возрастанию
+    даты); серии берутся из счетчиков челленджа
+    """
+    dates = []
+    ratings = []
+    completed = []
+    notes_lengths = []
+    
+    for checkin in checkins:
+        dates.append(checkin.date)
+        ratings.append(checkin.rating if checkin.rating else 0)
+        completed.append(1 if checkin.is_completed else 0)
+        notes_lengths.append(len(checkin.notes) if checkin.notes else 0)
+    
+    graphs = []
+    
+    fig1 = go.Figure()
+    fig1.add_trace(go.Scatter(
+        x=dates, 
+        y=ratings,
+        mode='lines+markers',
+        name='Оценка дня',
+        line=dict(color='blue', width=2),
+        marker=dict(size=8)
+    ))
+    fig1.update_layout(
+        title='Динамика оценок',
+        xaxis_title='Дата',
+        yaxis_title='Оценка (1-5)',
+        template='plotly_white',
+        height=350
+    )
+    graphs.append(('Оценки', render_chart(fig1)))
+    
+    fig2 = go.Figure(data=[
+        go.Bar(
+            x=dates,
+            y=completed,
+            name='Выполнено',
+            marker_color=['#28a745' if x == 1 else '#dc3545' for x in completed]
+        )
+    ])
+    fig2.update_layout(
+        title='✅ Выполнение по дням',
+        xaxis_title='Дата',
+        yaxis_title='Выполнено (1) / Не выполнено (0)',
+        template='plotly_white',
+        height=350
+    )
+    graphs.append(('📅 Выполнение', render_chart(fig2)))
+    
+    total_days = len(completed)
+    completed_days = sum(completed)
+    completion_rate = (completed_days / total_days * 100) if total_days > 0 else 0
+    
+    ratings_with_values = [r for r in ratings if r > 0]
+    avg_rating = sum(ratings_with_values) / len(ratings_with_values) if ratings_with_values else 0
+    
+    statistics = {
+        'total_days': total_days,
+        'completed_days': completed_days,
+        'completion_rate': round(completion_rate, 1),
+        'avg_rating': round(avg_rating, 2),
+        'current_streak': user_challenge.active_streak,
+        'max_streak': user_challenge.longest_streak,
+        'total_notes_chars': sum(notes_lengths),
+        'avg_notes_length': round(sum(notes_lengths) / len([x for x in notes_lengths if x > 0]), 1) if any(notes_lengths) else 0,
+    }
+    
+    return graphs, statistics
+
+
+def overall_statistics(user):
+    """Графики и сводные показатели по всем челленджам пользователя"""
+    # Одна агрегирующая выборка: по строке на челлендж с хотя бы одной отметкой
+    rows = UserChallenge.objects.with_progress().filter(user=user).annotate(
+        actual_days=Count('checkins'),
+        completed_count=Count('checkins', filter=Q(checkins__is_completed=True)),
+    ).filter(actual_days__gt=0).order_by('-start_date').values(
+        'effective_title', 'effective_category', 'effective_duration', 'status', 'start_date',
+        'current_streak', 'actual_days', 'completed_count',
+    )
+    
+    df = pd.DataFrame.from_records(list(rows))
+    if df.empty:
+        return None
+    
+    df = df.rename(columns={
+        'effective_title': 'title',
+        'effective_category': 'category',
+        'effective_duration': 'duration',
+        'current_streak': 'streak',
+        'completed_count': 'completed_days',
+    })
+    df['completion_rate'] = df['completed_days'] / df['actual_days'] * 100
+    
+    summary = get_user_stats(user)
+    
+    graphs = []
+    
+    fig1 = go.Figure(data=[
+        go.Bar(
+            x=df['title'].str[:20],
+            y=df['completion_rate'],
+            marker_color='lightblue',
+            text=df['completion_rate'].round(1).astype(str) + '%',
+            textposition='auto',
+            width=0.6
+        )
+    ])
+    fig1.update_layout(
+        title='📊 Процент выполнения по челленджам',
+        xaxis_title='Челлендж',
+        yaxis_title='Процент выполнения (%)',
+        template='plotly_white',
+        height=450,
+        margin=dict(l=50, r=50, t=80, b=150),
+        xaxis_tickangle=-45
+    )
+    graphs.append(('Процент выполнения', render_chart(fig1)))
+    
+    category_counts = df['category'].value_counts()
+    fig2 = go.Figure(data=[
+        go.Pie(
+            labels=[dict(ChallengeTemplate.CATEGORY_CHOICES).get(cat, cat) for cat in category_counts.index],
+            values=category_counts.values,
+            hole=.3,
+            textinfo='label+percent',
+            marker=dict(colors=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD']),
+            textfont=dict(size=14)
+        )
+    ])
+    fig2.update_layout(
+        title='🏷️ Распределение по категориям',
+        template='plotly_white',
+        height=500,
+        margin=dict(l=20, r=20, t=80, b=20),
+        showlegend=True,
+        legend=dict(
+            font=dict(size=12),
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    graphs.append(('Категории', render_chart(fig2)))
+    
+    status_counts = df['status'].value_counts()
+    
+    total_challenges = len(df)
+    active_challenges = int(status_counts.get('active', 0))
+    completed_challenges = int(status_counts.get('completed', 0))
+    avg_completion_rate = df['completion_rate'].mean()
+    
+    statistics = {
+        'total_challenges': total_challenges,
+        'active_challenges': active_challenges,
+        'completed_challenges': completed_challenges,
+        'avg_completion_rate': round(avg_completion_rate, 1),
+        'total_days_tracked': summary.tracked_days,
+        'days_since_join': summary.days_since_join,
+        'total_checkins': summary.total_checkins,
+        'total_completed': summary.completed_checkins,
+        'current_streak': current_streak(user),
+        'longest_streak': longest_streak(user),
+    }
+    
+    return graphs, statistics
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ChallengesConfig(AppConfig):
     name = 'challenges'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,9 @@
+# charts.py
+
+
+def render_chart(fig):
+    """
+    HTML-блок графика: только div и JSON фигуры. Сама библиотека plotly.js
+    подключается на странице один раз как статический файл.
+    """
+    return fig.to_html(full_html=False, include_plotlyjs=False)
@@ -0,0 +1,159 @@
+# checkins.py
+"""
+Пакетное сохранение отметок.
+
+Вместо построчных save() и сигналов: владение челленджами проверяется
+одним запросом, отметки вставляются и обновляются через bulk_create /
+bulk_update, а счетчики челленджей, сводка и индекс дней активности
+обновляются один раз на пакет.
+"""
+from datetime import date
+
+from django.db import IntegrityError, transaction
+
+from .activity import sync_activity_day
+from .leaderboard import add_deltas, adjust_entries, checkin_deltas
+from .models import DailyCheckin, UserChallenge
+from .page_cache import invalidate_user_pages
+from .search import reindex_checkins
+from .signals import suppress_derived_updates
+from .streaks import rebuild_challenge_streaks
+from .summary import adjust_user_stats, touch_stats, tracked_days_delta
+
+MAX_BATCH_ITEMS = 100
+
+RATINGS = dict(DailyCheckin.RATING_CHOICES)
+
+
+class BatchError(Exception):
+    """Пакет не прошел проверку; errors - список сообщений по элементам"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+class BatchConflict(BatchError):
+    """Параллельный запрос успел записать отметку за тот же день"""
+
+
+def parse_batch_items(items, today):
+    """Проверяет элементы пакета и приводит их к (challenge_id, date, is_completed, rating, notes)"""
+    if not isinstance(items, list) or not items:
+        raise BatchError(['Ожидается непустой список items'])
+    if len(items) > MAX_BATCH_ITEMS:
+        raise BatchError([f'Не больше {MAX_BATCH_ITEMS} отметок за запрос'])
+
+    parsed, errors, seen = [], [], set()
+    for number, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(f'#{number}: ожидается объект')
+            continue
+        try:
+            # bool - подкласс int: true/false не должны стать id 1/0
+            if isinstance(item['challenge'], bool):
+                raise TypeError
+            challenge_id = int(item['challenge'])
+            day = date.fromisoformat(item['date']) if item.get('date') else today
+            is_completed = item.get('is_completed', True)
+            rating = item.get('rating')
+            notes = item.get('notes') or ''
+        except (KeyError, TypeError, ValueError):
+            errors.append(f'#{number}: нужны challenge (id) и date (ГГГГ-ММ-ДД)')
+            continue
+
+        if not isinstance(is_completed, bool):
+            errors.append(f'#{number}: is_completed должно быть true или false')
+        elif rating is not None and (not isinstance(rating, int) or isinstance(rating, bool) or rating not in RATINGS):
+            errors.append(f'#{number}: rating должен быть от 1 до 5')
+        elif not isinstance(notes, str):
+            errors.append(f'#{number}: notes должно быть строкой')
+        elif day > today:
+            errors.append(f'#{number}: нельзя отметить день в будущем')
+        elif (challenge_id, day) in seen:
+            errors.append(f'#{number}: повтор отметки за {day} в том же пакете')
+        else:
+            seen.add((challenge_id, day))
+            parsed.append((challenge_id, day, is_completed, rating, notes))
+
+    if errors:
+        raise BatchError(errors)
+    return parsed
+
+
+def save_checkins_batch(user, items):
+    """
+    Сохраняет проверенные элементы пакета одной транзакцией вызывающего кода.
+    Возвращает (создано, обновлено, id затронутых челленджей).
+    """
+    challenge_ids = {challenge_id for challenge_id, *_ in items}
+    challenges = {
+        challenge.pk: challenge
+        for challenge in UserChallenge.objects.filter(
+            user=user, pk__in=challenge_ids, status='active'
+        ).select_related('template')
+    }
+    errors = [f'Челлендж {pk} не найден или не активен' for pk in sorted(challenge_ids - set(challenges))]
+    errors += [
+        f'{day}: раньше начала челленджа {challenge_id}'
+        for challenge_id, day, *_ in items
+        if challenge_id in challenges and day < challenges[challenge_id].start_date
+    ]
+    if errors:
+        raise BatchError(errors)
+
+    existing = {
+        (checkin.user_challenge_id, checkin.date): checkin
+        for checkin in DailyCheckin.objects.filter(
+            user_challenge_id__in=challenge_ids,
+            date__in={day for _, day, *_ in items}
+        )
+    }
+
+    to_create, to_update = [], []
+    completed_delta = 0
+    changed_days = set()
+    board = {}
+    for challenge_id, day, is_completed, rating, notes in items:
+        checkin = existing.get((challenge_id, day))
+        if checkin is None:
+            to_create.append(DailyCheckin(
+                user_challenge_id=challenge_id, date=day,
+                is_completed=is_completed, rating=rating, notes=notes
+            ))
+            was_completed = False
+            previous = None
+        else:
+            was_completed = checkin.is_completed
+            previous = (day, was_completed)
+            checkin.is_completed, checkin.rating, checkin.notes = is_completed, rating, notes
+            to_update.append(checkin)
+        add_deltas(board, challenges[challenge_id].category, checkin_deltas(previous, (day, is_completed)))
+        if is_completed != was_completed:
+            completed_delta += int(is_completed) - int(was_completed)
+            changed_days.add(day)
+
+    # Новые дни с отметками - до вставки, пока в них видны только прежние отметки
+    tracked_days = tracked_days_delta(user.pk, added={checkin.date for checkin in to_create})
+    try:
+        # Своя точка сохранения: конфликт не ломает транзакцию вызывающего кода
+        with transaction.atomic(), suppress_derived_updates():
+            DailyCheckin.objects.bulk_create(to_create)
+            DailyCheckin.objects.bulk_update(to_update, ['is_completed', 'rating', 'notes'])
+    except IntegrityError:
+        raise BatchConflict(['Отметки за эти дни уже изменены другим запросом - повторите пакет'])
+
+    reindex_checkins([checkin.pk for checkin in to_create if checkin.notes] + [checkin.pk for checkin in to_update])
+    rebuild_challenge_streaks(challenge_ids)
+    active_days = sum(sync_activity_day(user.pk, day) for day in sorted(changed_days))
+    adjust_user_stats(
+        user.pk,
+        total_checkins=len(to_create),
+        completed_checkins=completed_delta,
+        active_days=active_days,
+        tracked_days=tracked_days,
+    )
+    adjust_entries(user.pk, board)
+    touch_stats([user.pk], challenge_ids)
+    invalidate_user_pages(user.pk)
+    return len(to_create), len(to_update), sorted(challenge_ids)
@@ -0,0 +1,97 @@
+# export.py
+"""
+Потоковая выгрузка челленджей и отметок в CSV или NDJSON.
+
+Одна строка выгрузки - одна отметка вместе с полями ее челленджа
+(челлендж без отметок дает одну строку с пустыми полями отметки).
+Строки читаются одним запросом через QuerySet.iterator(chunk_size=...)
+и сразу отдаются дальше, поэтому память не зависит от объема данных.
+Тот же формат принимает импорт (imports.py).
+"""
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import UserChallenge
+
+FORMATS = ('csv', 'ndjson')
+
+CHUNK_SIZE = 2000
+
+# Колонки выгрузки -> поле запроса
+COLUMNS = {
+    'username': 'user__username',
+    'challenge_id': 'id',
+    'title': 'effective_title',
+    'category': 'effective_category',
+    'duration_days': 'effective_duration',
+    'difficulty': 'custom_difficulty',
+    'start_date': 'start_date',
+    'status': 'status',
+    'date': 'checkins__date',
+    'is_completed': 'checkins__is_completed',
+    'rating': 'checkins__rating',
+    'notes': 'checkins__notes',
+}
+
+
+def export_rows(users=None):
+    """Строки выгрузки для пользователей (None - для всех)"""
+    challenges = UserChallenge.objects.with_progress()
+    if users is not None:
+        challenges = challenges.filter(user__in=users)
+    rows = challenges.order_by('user_id', 'id', 'checkins__date').values_list(*COLUMNS.values())
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(COLUMNS, row))
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: write возвращает строку, а не пишет ее"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(list(COLUMNS))
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row.values()])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def encode(chunks, buffer_size=64 * 1024):
+    """Кодирует строки в UTF-8, склеивая мелкие куски в блоки около buffer_size"""
+    buffer, size = [], 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_stream(blocks):
+    """Сжимает поток байтов в gzip на лету"""
+    compressor = zlib.compressobj(wbits=31)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(fmt, users=None, compress=False):
+    """Итератор байтов выгрузки в формате fmt ('csv' или 'ndjson')"""
+    lines = iter_csv(export_rows(users)) if fmt == 'csv' else iter_ndjson(export_rows(users))
+    blocks = encode(lines)
+    return gzip_stream(blocks) if compress else blocks
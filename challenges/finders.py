@@ -0,0 +1,43 @@
+# finders.py
+import importlib.util
+import os
+
+from django.contrib.staticfiles.finders import BaseFinder
+from django.core.files.storage import FileSystemStorage
+
+
+class PlotlyJSFinder(BaseFinder):
+    """
+    Отдает plotly.min.js из установленного пакета plotly как статический
+    файл js/plotly.min.js. Так версия библиотеки в браузере всегда совпадает
+    с версией plotly на сервере, а collectstatic кладет файл в манифест
+    WhiteNoise с хешем в имени.
+    """
+    prefix = 'js'
+    filename = 'plotly.min.js'
+
+    def __init__(self, app_names=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # find_spec не импортирует сам plotly - на старте воркера это дорого
+        spec = importlib.util.find_spec('plotly')
+        self.location = None
+        if spec and spec.origin:
+            location = os.path.join(os.path.dirname(spec.origin), 'package_data')
+            if os.path.exists(os.path.join(location, self.filename)):
+                self.location = location
+
+    @property
+    def static_path(self):
+        return f'{self.prefix}/{self.filename}'
+
+    def find(self, path, all=False):
+        if self.location and path == self.static_path:
+            match = os.path.join(self.location, self.filename)
+            return [match] if all else match
+        return []
+
+    def list(self, ignore_patterns):
+        if self.location:
+            storage = FileSystemStorage(location=self.location)
+            storage.prefix = self.prefix
+            yield self.filename, storage
@@ -0,0 +1,324 @@
+# imports.py
+"""
+Пакетный импорт истории отметок из CSV или NDJSON.
+
+Формат - тот же, что у выгрузки (export.py): одна строка - одна отметка
+с полями ее челленджа. Строки читаются потоком и сохраняются пакетами:
+челлендж ищется у пользователя по названию (и дате начала, если она
+указана), недостающие создаются, отметки вставляются через
+bulk_create(ignore_conflicts=True) - уже существующие (челлендж, дата)
+пропускаются. Счетчики челленджей, сводка и индекс дней активности
+пересчитываются один раз на весь импорт, а не на каждую строку.
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .achievements import EVENT_CHALLENGE, EVENT_CHECKIN, EVENT_STATUS
+from .models import ChallengeTemplate, DailyCheckin, UserChallenge
+from .search import reindex_checkins
+from .signals import suppress_derived_updates
+from .streaks import rebuild_challenge_streaks
+from .summary import refresh_derived_data, touch_stats
+from .transactions import immediate_atomic
+
+BATCH_SIZE = 1000
+
+# Сколько ошибок по строкам возвращать - остальные только считаются
+MAX_ERRORS = 20
+
+TRUE_VALUES = {'true', '1', 'yes', 'да'}
+FALSE_VALUES = {'false', '0', 'no', 'нет'}
+
+CATEGORIES = dict(ChallengeTemplate.CATEGORY_CHOICES)
+STATUSES = dict(UserChallenge.STATUS_CHOICES)
+DIFFICULTIES = dict(UserChallenge.CUSTOM_DIFFICULTY_CHOICES)
+RATINGS = dict(DailyCheckin.RATING_CHOICES)
+
+# Файл нельзя дочитать: не UTF-8, битый gzip или CSV
+READ_ERRORS = (UnicodeDecodeError, csv.Error, EOFError, OSError)
+
+
+class ImportRowError(ValueError):
+    """Строка импорта не прошла проверку"""
+
+
+def open_upload(fileobj, name='', fmt=None):
+    """
+    Текстовый поток и формат загруженного файла. Сжатие gzip определяется
+    по сигнатуре, формат - по параметру или расширению (по умолчанию csv).
+    """
+    if fileobj.read(2) == b'\x1f\x8b':
+        fileobj.seek(0)
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    else:
+        fileobj.seek(0)
+    if fmt is None:
+        fmt = 'ndjson' if name.removesuffix('.gz').endswith(('.ndjson', '.jsonl')) else 'csv'
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''), fmt
+
+
+def read_rows(stream, fmt):
+    """Словари строк из текстового потока; пустые строки NDJSON пропускаются"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {}
+
+
+def _text(row, name):
+    value = row.get(name)
+    return '' if value is None else str(value).strip()
+
+
+def _int(row, name, choices=None):
+    value = _text(row, name)
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ImportRowError(f'{name} должно быть целым числом')
+    if choices is not None and number not in choices:
+        raise ImportRowError(f'недопустимое значение {name}: {number}')
+    return number
+
+
+def _date(row, name):
+    value = _text(row, name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ImportRowError(f'{name} должно быть датой ГГГГ-ММ-ДД')
+
+
+def _bool(row, name):
+    value = row.get(name)
+    if isinstance(value, bool):
+        return value
+    value = _text(row, name).lower()
+    if not value or value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ImportRowError(f'{name} должно быть true или false')
+
+
+def parse_row(row, today):
+    """Проверяет строку импорта и приводит значения к типам полей"""
+    title = _text(row, 'title')
+    day = _date(row, 'date')
+    if not title:
+        raise ImportRowError('нужно название челленджа (title)')
+    if day is None:
+        # Строка выгрузки для челленджа без отметок
+        raise ImportRowError('нет даты отметки (date)')
+    if day > today:
+        raise ImportRowError('нельзя отметить день в будущем')
+
+    category = _text(row, 'category')
+    if category and category not in CATEGORIES:
+        raise ImportRowError(f'неизвестная категория: {category}')
+    status = _text(row, 'status')
+    if status and status not in STATUSES:
+        raise ImportRowError(f'неизвестный статус: {status}')
+    duration = _int(row, 'duration_days')
+    if duration is not None and duration < 1:
+        raise ImportRowError('duration_days должно быть положительным')
+
+    return {
+        'username': _text(row, 'username'),
+        'title': title[:200],
+        'category': category,
+        'duration': duration,
+        'difficulty': _int(row, 'difficulty', DIFFICULTIES),
+        'start_date': _date(row, 'start_date'),
+        'status': status,
+        'date': day,
+        'is_completed': _bool(row, 'is_completed'),
+        'rating': _int(row, 'rating', RATINGS),
+        'notes': _text(row, 'notes'),
+    }
+
+
+class CheckinImporter:
+    """
+    Импорт строк для одного пользователя (user) или для пользователей
+    из колонки username (user=None - восстановление полной выгрузки).
+    """
+
+    def __init__(self, user=None, today=None, batch_size=BATCH_SIZE):
+        self.user = user
+        self.today = today or timezone.now().date()
+        self.batch_size = batch_size
+        self.rows = self.skipped = 0
+        self.errors = []
+        self.users = {user.username: user} if user else {}
+        # (user_id, название в нижнем регистре) -> [(дата начала, id), ...]
+        self.challenges = {}
+        self.loaded_users = set()
+        self.created = {}  # id созданного челленджа -> задана ли длительность
+        self.checkins_before = {}  # id челленджа -> число отметок до импорта
+        self.user_challenges = {}  # id пользователя -> id затронутых челленджей
+
+    def run(self, rows):
+        pending = []
+        try:
+            for number, row in enumerate(rows, 1):
+                self.rows += 1
+                try:
+                    parsed = parse_row(row, self.today)
+                    parsed['user'] = self.resolve_user(parsed['username'])
+                except ImportRowError as e:
+                    self.skipped += 1
+                    if len(self.errors) < MAX_ERRORS:
+                        self.errors.append(f'Строка {number}: {e}')
+                    continue
+                pending.append(parsed)
+                if len(pending) >= self.batch_size:
+                    self.save_batch(pending)
+                    pending = []
+            if pending:
+                self.save_batch(pending)
+        finally:
+            # Каждый пакет - своя транзакция: при любой ошибке уже сохраненные
+            # остаются в базе, и производные данные для них нужно пересчитать
+            self.finish()
+        return self.result()
+
+    def resolve_user(self, username):
+        if self.user:
+            return self.user
+        if username not in self.users:
+            self.users[username] = User.objects.filter(username=username).first()
+        if self.users[username] is None:
+            raise ImportRowError(f'нет пользователя {username!r}')
+        return self.users[username]
+
+    def load_challenges(self, user):
+        """Челленджи пользователя по названиям - один запрос на пользователя"""
+        self.loaded_users.add(user.pk)
+        for pk, title, start_date in UserChallenge.objects.with_progress().filter(user=user).values_list(
+            'pk', 'effective_title', 'start_date'
+        ):
+            self.challenges.setdefault((user.pk, title.lower()), []).append((start_date, pk))
+
+    def find_challenge(self, user, row):
+        if user.pk not in self.loaded_users:
+            self.load_challenges(user)
+        candidates = self.challenges.get((user.pk, row['title'].lower()), [])
+        if row['start_date']:
+            return next((pk for start_date, pk in candidates if start_date == row['start_date']), None)
+        # Без даты начала - последний челлендж с таким названием, начатый не позже отметки
+        started = [(start_date, pk) for start_date, pk in candidates if start_date <= row['date']]
+        return max(started or candidates, default=(None, None))[1]
+
+    def create_challenge(self, user, row):
+        challenge = UserChallenge.objects.create(
+            user=user,
+            custom_title=row['title'],
+            custom_category=row['category'] or 'other',
+            custom_duration=row['duration'] or 1,
+            custom_difficulty=row['difficulty'] or 2,
+            start_date=row['start_date'] or row['date'],
+            status=row['status'] or 'active',
+        )
+        self.challenges.setdefault((user.pk, row['title'].lower()), []).append((challenge.start_date, challenge.pk))
+        self.created[challenge.pk] = row['duration'] is not None
+        return challenge.pk
+
+    def save_batch(self, rows):
+        """Пакет отметок одной короткой транзакцией"""
+        with immediate_atomic(), suppress_derived_updates():
+            checkins = []
+            for row in rows:
+                user = row['user']
+                challenge_id = self.find_challenge(user, row) or self.create_challenge(user, row)
+                self.user_challenges.setdefault(user.pk, set()).add(challenge_id)
+                checkins.append(DailyCheckin(
+                    user_challenge_id=challenge_id,
+                    date=row['date'],
+                    is_completed=row['is_completed'],
+                    rating=row['rating'],
+                    notes=row['notes'],
+                ))
+
+            new_ids = {checkin.user_challenge_id for checkin in checkins} - set(self.checkins_before)
+            if new_ids:
+                counts = dict(
+                    DailyCheckin.objects.filter(user_challenge_id__in=new_ids).order_by().values('user_challenge')
+                    .annotate(total=Count('id')).values_list('user_challenge', 'total')
+                )
+                for pk in new_ids:
+                    self.checkins_before[pk] = counts.get(pk, 0)
+
+            # Повторы (челлендж, дата) - и с базой, и внутри файла - молча пропускаются
+            DailyCheckin.objects.bulk_create(checkins, ignore_conflicts=True)
+
+    def finish(self):
+        """Пересчет производных данных один раз на импорт"""
+        if not self.checkins_before:
+            return
+        with immediate_atomic(), suppress_derived_updates():
+            if self.created:
+                self.fit_created_challenges()
+            rebuild_challenge_streaks(self.checkins_before)
+            reindex_checkins(
+                DailyCheckin.objects.filter(user_challenge_id__in=self.checkins_before).exclude(notes='')
+                .values_list('pk', flat=True)
+            )
+            touch_stats([], self.checkins_before)
+            refresh_derived_data(self.user_challenges)
+
+    def fit_created_challenges(self):
+        """Дата начала и длительность созданных челленджей - по диапазону импортированных отметок"""
+        spans = DailyCheckin.objects.filter(user_challenge_id__in=self.created).order_by().values(
+            'user_challenge'
+        ).annotate(first=Min('date'), last=Max('date'))
+        challenges = UserChallenge.objects.in_bulk(list(self.created))
+        for span in spans:
+            challenge = challenges[span['user_challenge']]
+            challenge.start_date = min(challenge.start_date, span['first'])
+            if not self.created[challenge.pk]:
+                challenge.custom_duration = max((span['last'] - challenge.start_date).days + 1, 1)
+        UserChallenge.objects.bulk_update(challenges.values(), ['start_date', 'custom_duration'])
+
+    def post_checkin_payloads(self):
+        """Данные задачи post_checkin для каждого затронутого пользователя: одна проверка на импорт"""
+        events = [EVENT_CHECKIN]
+        if self.created:
+            # Созданные челленджи могут прийти уже завершенными
+            events += [EVENT_CHALLENGE, EVENT_STATUS]
+        return {
+            user_id: {'challenge_ids': sorted(challenge_ids), 'events': events}
+            for user_id, challenge_ids in self.user_challenges.items()
+        }
+
+    def result(self):
+        imported = 0
+        if self.checkins_before:
+            total = DailyCheckin.objects.filter(user_challenge_id__in=self.checkins_before).count()
+            imported = total - sum(self.checkins_before.values())
+        return {
+            'rows': self.rows,
+            'imported': imported,
+            'duplicates': self.rows - self.skipped - imported,
+            'skipped': self.skipped,
+            'challenges_created': len(self.created),
+            'errors': self.errors,
+        }
@@ -0,0 +1,203 @@
+# jobs.py
+"""
+Локальная очередь фоновых задач без внешнего брокера.
+
+Задачи хранятся в таблице Job и выполняются командой
+`python manage.py run_jobs`. На пользователя держится не больше одной
+ожидающей задачи каждого типа: повторная постановка сливает данные в
+уже ожидающую задачу. Сообщения, которые вернул обработчик, показываются
+пользователю на следующей загрузке страницы (JobMessagesMiddleware).
+
+Если CHALLENGES_ASYNC_JOBS выключен (по умолчанию), dispatch выполняет
+обработчик сразу, в том же запросе.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Флаг в сессии: у пользователя есть задачи, сообщения которых еще не показаны
+SESSION_FLAG = 'challenges_pending_jobs'
+
+# Базовая задержка перед повтором упавшей задачи (удваивается с каждой попыткой)
+RETRY_DELAY = timedelta(seconds=30)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Регистрирует обработчик задачи: handler(user, payload) -> [(уровень, текст), ...]"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def merge_payload(current, new):
+    """Сливает данные задач: списки объединяются, остальные значения заменяются"""
+    merged = dict(current)
+    for key, value in new.items():
+        if isinstance(value, list) and isinstance(merged.get(key), list):
+            merged[key] = merged[key] + [item for item in value if item not in merged[key]]
+        else:
+            merged[key] = value
+    return merged
+
+
+def enqueue(user, kind, payload=None):
+    """
+    Ставит задачу в очередь или сливает ее с уже ожидающей задачей того же
+    типа. user - пользователь или его id.
+    """
+    user_id = getattr(user, 'pk', user)
+    payload = payload or {}
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                job = Job.objects.select_for_update().filter(user_id=user_id, kind=kind, status='pending').first()
+                if job:
+                    job.payload = merge_payload(job.payload, payload)
+                    job.save(update_fields=['payload', 'updated_at'])
+                    return job
+                return Job.objects.create(user_id=user_id, kind=kind, payload=payload)
+        except IntegrityError:
+            # Параллельный запрос успел создать ожидающую задачу - сливаемся с ней
+            continue
+    raise IntegrityError(f'Не удалось поставить задачу {kind} для {user}')
+
+
+def dispatch(request, kind, payload=None):
+    """Выполняет задачу после запроса: в очереди или сразу, в зависимости от настроек"""
+    if getattr(settings, 'CHALLENGES_ASYNC_JOBS', False):
+        enqueue(request.user, kind, payload)
+        request.session[SESSION_FLAG] = True
+        return
+
+    # Задача выполняется внутри транзакции представления: своя точка
+    # сохранения не дает ее ошибке в БД сломать транзакцию и отметку
+    try:
+        with transaction.atomic():
+            result = JOB_HANDLERS[kind](request.user, payload or {})
+    except Exception:
+        logger.exception('Ошибка при выполнении задачи %s для %s', kind, request.user)
+        return
+    for level, text in result or []:
+        messages.add_message(request, messages.DEFAULT_LEVELS[level.upper()], text)
+
+
+def claim_next_job():
+    """Атомарно забирает следующую готовую задачу; None, если очередь пуста"""
+    while True:
+        job_id = Job.objects.filter(
+            status='pending',
+            run_after__lte=timezone.now()
+        ).order_by('run_after', 'id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+
+        claimed = Job.objects.filter(id=job_id, status='pending').update(
+            status='running',
+            updated_at=timezone.now()
+        )
+        if claimed:
+            return Job.objects.select_related('user').get(id=job_id)
+
+
+def run_job(job):
+    """Выполняет забранную задачу и записывает результат или планирует повтор"""
+    job.attempts += 1
+    try:
+        result = JOB_HANDLERS[job.kind](job.user, job.payload)
+    except Exception as e:
+        job.last_error = f'{type(e).__name__}: {e}'
+        if job.attempts < job.max_attempts:
+            _retry(job)
+        else:
+            job.status = 'failed'
+            job.save(update_fields=['status', 'attempts', 'last_error', 'updated_at'])
+        return False
+
+    job.status = 'done'
+    job.messages = [list(item) for item in result or []]
+    job.delivered = not job.messages
+    job.save(update_fields=['status', 'attempts', 'messages', 'delivered', 'updated_at'])
+    return True
+
+
+def _retry(job):
+    job.status = 'pending'
+    job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+    try:
+        with transaction.atomic():
+            job.save(update_fields=['status', 'attempts', 'run_after', 'last_error', 'updated_at'])
+    except IntegrityError:
+        # Пока задача выполнялась, поставили новую такую же - отдаем данные ей
+        with transaction.atomic():
+            pending = Job.objects.select_for_update().get(user=job.user, kind=job.kind, status='pending')
+            pending.payload = merge_payload(job.payload, pending.payload)
+            pending.save(update_fields=['payload', 'updated_at'])
+            Job.objects.filter(pk=job.pk).update(
+                status='failed',
+                attempts=job.attempts,
+                last_error=job.last_error,
+                updated_at=timezone.now()
+            )
+
+
+def requeue_stale_jobs(older_than):
+    """Возвращает в очередь задачи, зависшие в статусе running (например, после падения воркера)"""
+    stale = Job.objects.filter(status='running', updated_at__lt=timezone.now() - older_than)
+    requeued = 0
+    for job in stale:
+        try:
+            with transaction.atomic():
+                requeued += Job.objects.filter(pk=job.pk, status='running').update(status='pending')
+        except IntegrityError:
+            Job.objects.filter(pk=job.pk).update(status='failed', last_error='Вытеснена новой задачей')
+    return requeued
+
+
+def pop_job_messages(user):
+    """Забирает непоказанные сообщения выполненных задач пользователя"""
+    with transaction.atomic():
+        jobs = list(Job.objects.select_for_update().filter(user=user, status='done', delivered=False))
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(delivered=True)
+    return [message for job in jobs for message in job.messages]
+
+
+def has_unfinished_jobs(user):
+    return Job.objects.filter(user=user, status__in=['pending', 'running']).exists()
+
+
+@job_handler('post_checkin')
+def post_checkin(user, payload):
+    """Проверка завершения челленджей и достижений после отметки или смены статуса"""
+    from .achievements import EVENT_STATUS, evaluate_achievements
+    from .models import UserChallenge
+
+    events = set(payload.get('events', []))
+    result = []
+    for challenge in UserChallenge.objects.filter(
+        user=user,
+        pk__in=payload.get('challenge_ids', []),
+        status='active'
+    ).select_related('template'):
+        changed, status = challenge.check_and_complete()
+        if changed:
+            events.add(EVENT_STATUS)
+            if status == 'completed':
+                result.append(('success', f'🏁 Челлендж "{challenge.title}" успешно завершен!'))
+            else:
+                result.append(('warning', f'Челлендж "{challenge.title}" завершился: выполнены не все дни.'))
+
+    for achievement in evaluate_achievements(user, events):
+        result.append(('success', f'🎉 Новое достижение: "{achievement.title}"! {achievement.description}'))
+    return result
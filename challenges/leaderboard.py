@@ -0,0 +1,302 @@
+# leaderboard.py
+"""
+Таблицы лидеров по категориям и периодам.
+
+Показатели хранятся в LeaderboardEntry: по строке на пользователя,
+категорию (пустая - все челленджи) и период. Отметки и смена статуса
+челленджа меняют строки своей категории и строки "все категории"
+дельтами через F() (adjust_entries), поэтому цена записи не зависит от
+истории пользователя. Страница таблицы и место пользователя - это по
+одному запросу по индексу показателя, без обхода всех отметок.
+
+Строки нет - значит, все показатели за период нулевые: дельта к
+отсутствующей строке или к строке прошедшего периода начинает новую с
+нуля. Полный пересчет по отметкам (refresh_user_entries) нужен только
+командам: rebuild_leaderboards раз в сутки удаляет строки прошедших
+недель и месяцев и пересчитывает серии, которые могли прерваться.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from .models import DailyCheckin, LeaderboardEntry, UserChallenge
+
+METRICS = {
+    'streak': 'Текущая серия',
+    'completion_rate': 'Доля выполненных отметок',
+    'completed_challenges': 'Завершенные челленджи',
+}
+
+PERIODS = dict(LeaderboardEntry.PERIOD_CHOICES)
+
+# С меньшим числом отметок доля выполненных ничего не говорит
+MIN_CHECKINS_FOR_RATE = 5
+
+PAGE_SIZE = 50
+
+# Страницы листаются через OFFSET, поэтому глубина ограничена: дальше
+# первой тысячи строк пользователь видит только свое место (user_rank)
+MAX_PAGE = 20
+
+
+def period_starts(today):
+    return {
+        'week': today - timedelta(days=today.weekday()),
+        'month': today.replace(day=1),
+        'all': None,
+    }
+
+
+def _empty_counters():
+    return {'total': 0, 'completed': 0, 'completed_challenges': 0, 'streak': 0}
+
+
+def compute_user_entries(user_id, today=None):
+    """Строки таблиц лидеров пользователя по его челленджам и отметкам - два запроса"""
+    today = today or timezone.now().date()
+    starts = period_starts(today)
+    counters = {}
+
+    def add(category, period, **values):
+        # Челлендж без категории не должен попасть в строку "все категории" дважды
+        for key in (category or 'other', ''):
+            current = counters.setdefault((key, period), _empty_counters())
+            for name, value in values.items():
+                current[name] = max(current[name], value) if name == 'streak' else current[name] + value
+
+    challenges = UserChallenge.objects.with_progress(today).filter(user_id=user_id).values_list(
+        'effective_category', 'status', 'start_date', 'effective_duration', 'current_streak', 'last_completed_date'
+    )
+    for category, status, start_date, duration, streak, last_completed in challenges:
+        end_date = start_date + timedelta(days=max((duration or 1) - 1, 0))
+        active = status == 'active' and last_completed and (today - last_completed).days <= 1
+        for period, start in starts.items():
+            add(
+                category, period,
+                completed_challenges=int(status == 'completed' and (start is None or end_date >= start)),
+                streak=streak if active else 0,
+            )
+
+    category = Case(
+        When(user_challenge__template__isnull=False, then=F('user_challenge__template__category')),
+        default=F('user_challenge__custom_category'),
+    )
+    aggregates = {}
+    for period, start in starts.items():
+        in_period = Q(date__gte=start) if start else Q()
+        aggregates[f'total_{period}'] = Count('pk', filter=in_period)
+        aggregates[f'completed_{period}'] = Count('pk', filter=in_period & Q(is_completed=True))
+    rows = DailyCheckin.objects.filter(user_challenge__user_id=user_id).annotate(
+        challenge_category=category
+    ).order_by().values('challenge_category').annotate(**aggregates)
+    for row in rows:
+        for period in starts:
+            add(row['challenge_category'], period, total=row[f'total_{period}'], completed=row[f'completed_{period}'])
+
+    entries = []
+    for (category, period), values in counters.items():
+        if not (values['total'] or values['completed_challenges'] or values['streak']):
+            continue
+        rate = None
+        if values['total'] >= MIN_CHECKINS_FOR_RATE:
+            rate = round(values['completed'] * 100 / values['total'], 1)
+        entries.append(LeaderboardEntry(
+            user_id=user_id,
+            category=category,
+            period=period,
+            period_start=starts[period],
+            streak=values['streak'],
+            completion_rate=rate,
+            completed_challenges=values['completed_challenges'],
+            total_checkins=values['total'],
+            completed_checkins=values['completed'],
+        ))
+    return entries
+
+
+def refresh_user_entries(user_id, today=None):
+    """
+    Заменяет строки пользователя свежими (их не больше 3 периодов x 7
+    категорий). Обходит все отметки пользователя - только для команд
+    """
+    entries = compute_user_entries(user_id, today)
+    with transaction.atomic():
+        LeaderboardEntry.objects.filter(user_id=user_id).delete()
+        LeaderboardEntry.objects.bulk_create(entries)
+    return entries
+
+
+def _as_date(value):
+    # У только что созданных объектов даты - еще datetime из default=timezone.now
+    return timezone.localdate(value) if isinstance(value, datetime) else value
+
+
+def last_day(start_date, duration):
+    return _as_date(start_date) + timedelta(days=max((duration or 1) - 1, 0))
+
+
+def checkin_deltas(previous, current, today=None):
+    """
+    Дельты счетчиков отметок по периодам при переходе отметки из previous
+    в current - (дата, выполнена) или None, если отметки нет
+    """
+    deltas = {}
+    for period, start in period_starts(today or timezone.now().date()).items():
+        counts = Counter(total_checkins=0, completed_checkins=0)
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is not None and (start is None or _as_date(state[0]) >= start):
+                counts['total_checkins'] += sign
+                counts['completed_checkins'] += sign * int(bool(state[1]))
+        deltas[period] = counts
+    return deltas
+
+
+def completion_deltas(end_date, old_status, new_status, today=None):
+    """Дельты числа завершенных челленджей по периодам при смене статуса"""
+    change = int(new_status == 'completed') - int(old_status == 'completed')
+    return {
+        period: Counter(completed_challenges=change if start is None or end_date >= start else 0)
+        for period, start in period_starts(today or timezone.now().date()).items()
+    }
+
+
+def challenge_deltas(challenge, sign=-1, status=None, today=None):
+    """
+    Вклад челленджа со статусом status (по умолчанию текущим) в строки по
+    периодам со знаком sign: один запрос по его отметкам. Для удаления
+    челленджа и смены его категории
+    """
+    today = today or timezone.now().date()
+    status = status or challenge.status
+    starts = period_starts(today)
+    aggregates = {}
+    for period, start in starts.items():
+        in_period = Q(date__gte=start) if start else Q()
+        aggregates[f'total_{period}'] = Count('pk', filter=in_period)
+        aggregates[f'completed_{period}'] = Count('pk', filter=in_period & Q(is_completed=True))
+    counts = DailyCheckin.objects.filter(user_challenge_id=challenge.pk).aggregate(**aggregates)
+
+    deltas = completion_deltas(last_day(challenge.start_date, challenge.duration_days), None, status, today)
+    for period, values in deltas.items():
+        values['total_checkins'] = counts[f'total_{period}']
+        values['completed_checkins'] = counts[f'completed_{period}']
+        for name in values:
+            values[name] *= sign
+    return deltas
+
+
+def add_deltas(deltas, category, periods):
+    """Накапливает дельты периодов periods для категории челленджа category"""
+    target = deltas.setdefault(category, defaultdict(Counter))
+    for period, values in periods.items():
+        target[period].update(values)
+    return deltas
+
+
+def current_streaks(user_id, today):
+    """Серии строк пользователя по челленджам, которые еще могут продолжиться, - без обхода отметок"""
+    streaks = {'': 0}
+    rows = UserChallenge.objects.with_progress(today).filter(
+        user_id=user_id, status='active', current_streak__gt=0, last_completed_date__gte=today - timedelta(days=1)
+    ).values_list('effective_category', 'current_streak')
+    for category, streak in rows:
+        for key in (category or 'other', ''):
+            streaks[key] = max(streaks.get(key, 0), streak)
+    return streaks
+
+
+def _delta_update(values, streak):
+    total = F('total_checkins') + values['total_checkins']
+    completed = F('completed_checkins') + values['completed_checkins']
+    # В UPDATE F() - значения до изменения, поэтому дельты подставлены в выражение
+    rate = Round(ExpressionWrapper(completed * 100.0 / total, output_field=FloatField()), 1)
+    return {
+        'total_checkins': total,
+        'completed_checkins': completed,
+        'completed_challenges': F('completed_challenges') + values['completed_challenges'],
+        'completion_rate': Case(
+            When(total_checkins__gte=MIN_CHECKINS_FOR_RATE - values['total_checkins'], then=rate),
+            default=Value(None),
+        ),
+        'streak': streak,
+        'updated_at': timezone.now(),
+    }
+
+
+def adjust_entries(user_id, deltas, today=None):
+    """
+    Применяет дельты {категория челленджа: {период: Counter}} к строкам
+    категории и "все категории" и обновляет их серии - по UPDATE на
+    строку, без обхода отметок
+    """
+    if not deltas:
+        return
+    today = today or timezone.now().date()
+    starts = period_starts(today)
+    rows = defaultdict(Counter)
+    for category, periods in deltas.items():
+        for key in (category or 'other', ''):
+            for period in starts:
+                rows[key, period].update(periods.get(period, {}))
+    streaks = current_streaks(user_id, today)
+
+    with transaction.atomic():
+        for (key, period), values in rows.items():
+            entry = LeaderboardEntry.objects.filter(user_id=user_id, category=key, period=period)
+            changes = _delta_update(values, streaks.get(key, 0))
+            if entry.filter(period_start=starts[period]).update(**changes):
+                continue
+            # Строки еще нет или она за прошедший период - новая начинается с нуля
+            entry.delete()
+            LeaderboardEntry.objects.bulk_create(
+                [LeaderboardEntry(user_id=user_id, category=key, period=period, period_start=starts[period])],
+                ignore_conflicts=True,
+            )
+            entry.update(**changes)
+
+
+def board(metric, period, category='', today=None):
+    """Строки одной таблицы: в ней только пользователи с ненулевым показателем"""
+    if metric not in METRICS or period not in PERIODS:
+        raise ValueError(f'Неизвестная таблица {metric}/{period}')
+    start = period_starts(today or timezone.now().date())[period]
+    entries = LeaderboardEntry.objects.filter(category=category, period=period, period_start=start)
+    if metric == 'completion_rate':
+        return entries.filter(completion_rate__isnull=False)
+    return entries.filter(**{f'{metric}__gt': 0})
+
+
+def leaderboard_page(metric, period, category='', page=1, today=None):
+    """
+    Страница таблицы - один запрос по индексу показателя, не дальше
+    MAX_PAGE. Возвращает ([(место, строка), ...], есть ли следующая страница).
+    """
+    page = min(max(page, 1), MAX_PAGE)
+    offset = (page - 1) * PAGE_SIZE
+    rows = list(
+        board(metric, period, category, today).select_related('user')
+        .order_by(f'-{metric}', 'user_id')[offset:offset + PAGE_SIZE + 1]
+    )
+    ranked = [(offset + number, entry) for number, entry in enumerate(rows[:PAGE_SIZE], 1)]
+    return ranked, len(rows) > PAGE_SIZE and page < MAX_PAGE
+
+
+def rank_query(user, metric, period, category='', today=None):
+    """Строка пользователя с числом строк выше нее в порядке таблицы"""
+    entries = board(metric, period, category, today)
+    ahead = entries.filter(
+        Q(**{f'{metric}__gt': OuterRef(metric)}) | Q(**{metric: OuterRef(metric), 'user_id__lt': OuterRef('user_id')})
+    ).order_by().values('period').annotate(total=Count('pk')).values('total')
+    return entries.filter(user=user).annotate(ahead=Coalesce(Subquery(ahead), 0)).values(metric, 'ahead')
+
+
+def user_rank(user, metric, period, category='', today=None):
+    """Место пользователя и его показатель - один запрос; None, если его нет в таблице"""
+    row = rank_query(user, metric, period, category, today).first()
+    if row is None:
+        return None
+    return {'rank': row['ahead'] + 1, 'value': row[metric]}
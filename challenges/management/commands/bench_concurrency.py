@@ -0,0 +1,155 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError
+from django.utils import timezone
+
+from challenges.models import DailyCheckin, UserChallenge
+from challenges.transactions import immediate_atomic
+
+from .bench_views import percentile
+
+# Профиль -> значение CHALLENGES_SQLITE_PRODUCTION для дочерних процессов
+PROFILES = {
+    'stock': '',
+    'production': '1',
+}
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность записи в SQLite при параллельных процессах для разных профилей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Процессов, пишущих отметки')
+        parser.add_argument('--readers', type=int, default=2, help='Процессов, читающих статистику')
+        parser.add_argument('--seconds', type=float, default=5, help='Длительность замера')
+        parser.add_argument('--users', type=int, default=10, help='Пользователей в тестовой базе')
+        parser.add_argument('--profile', action='append', dest='profiles', choices=list(PROFILES), help='Профиль (по умолчанию оба)')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результат в JSON-файл')
+        # Служебные параметры дочерних процессов
+        parser.add_argument('--worker', choices=['write', 'read'], help='Запустить один рабочий процесс (служебное)')
+        parser.add_argument('--start-at', type=float, help='Время старта рабочего процесса (служебное)')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора рабочего процесса (служебное)')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options)
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for profile in options['profiles'] or list(PROFILES):
+                results[profile] = self.run_profile(profile, os.path.join(tmp, f'{profile}.sqlite3'), options)
+                row = results[profile]
+                self.stdout.write(
+                    f"{profile:<11} запись {row['writes_per_second']:>8}/с  чтение {row['reads_per_second']:>8}/с  "
+                    f"p95 записи {row['write_p95_ms']:>8} мс  ошибок блокировки {row['lock_errors']}"
+                )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    def manage(self, env, *args, **kwargs):
+        return subprocess.Popen(
+            [sys.executable, 'manage.py', *args],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.PIPE,
+            **kwargs
+        )
+
+    def run_profile(self, profile, path, options):
+        """Готовит отдельную базу для профиля и запускает на ней рабочие процессы"""
+        env = {**os.environ, 'CHALLENGES_DB_PATH': path, 'CHALLENGES_SQLITE_PRODUCTION': PROFILES[profile]}
+        for args in (
+            ['migrate', '-v0'],
+            ['seed_demo', '--users', str(options['users']), '--challenges', '3', '--days', '30'],
+        ):
+            process = self.manage(env, *args)
+            process.communicate()
+            if process.returncode:
+                raise CommandError(f'Не удалось подготовить базу: manage.py {" ".join(args)}')
+
+        # Процессы стартуют одновременно, когда все уже загрузили Django
+        start_at = time.time() + 3
+        workers = [
+            self.manage(
+                env, 'bench_concurrency', '--worker', role, '--seed', str(number),
+                '--start-at', str(start_at), '--seconds', str(options['seconds'])
+            )
+            for number, role in enumerate(['write'] * options['writers'] + ['read'] * options['readers'])
+        ]
+
+        reports = {'write': [], 'read': []}
+        for process in workers:
+            stdout, _ = process.communicate()
+            if process.returncode:
+                raise CommandError('Рабочий процесс завершился с ошибкой')
+            report = json.loads(stdout)
+            reports[report['role']].append(report)
+
+        write_latencies = [value for report in reports['write'] for value in report['latencies_ms']]
+        return {
+            'writes_per_second': round(sum(r['ops'] for r in reports['write']) / options['seconds'], 1),
+            'reads_per_second': round(sum(r['ops'] for r in reports['read']) / options['seconds'], 1),
+            'write_p50_ms': round(statistics.median(write_latencies), 2) if write_latencies else None,
+            'write_p95_ms': round(percentile(write_latencies, 95), 2) if write_latencies else None,
+            'lock_errors': sum(r['errors'] for r in reports['write'] + reports['read']),
+        }
+
+    def run_worker(self, options):
+        rng = random.Random(options['seed'])
+        today = timezone.now().date()
+        challenges = list(UserChallenge.objects.values_list('pk', 'user_id'))
+        if not challenges:
+            raise CommandError('В базе нет челленджей')
+
+        if options['start_at']:
+            time.sleep(max(0, options['start_at'] - time.time()))
+        deadline = time.time() + options['seconds']
+
+        ops = errors = 0
+        latencies = []
+        while time.time() < deadline:
+            challenge_id, user_id = rng.choice(challenges)
+            started = time.perf_counter()
+            try:
+                if options['worker'] == 'write':
+                    self.write_checkin(rng, challenge_id, today - timedelta(days=rng.randint(0, 29)))
+                else:
+                    self.read_stats(user_id)
+            except OperationalError:
+                errors += 1
+                continue
+            latencies.append(round((time.perf_counter() - started) * 1000, 3))
+            ops += 1
+
+        self.stdout.write(json.dumps({
+            'role': options['worker'],
+            'ops': ops,
+            'errors': errors,
+            'latencies_ms': latencies,
+        }))
+
+    def write_checkin(self, rng, challenge_id, day):
+        """Путь записи отметки: чтение, запись и обновление производных данных сигналами"""
+        is_completed = rng.random() < 0.8
+        with immediate_atomic():
+            DailyCheckin.objects.update_or_create(
+                user_challenge_id=challenge_id,
+                date=day,
+                defaults={'is_completed': is_completed, 'rating': rng.randint(1, 5) if is_completed else None},
+            )
+
+    def read_stats(self, user_id):
+        list(UserChallenge.objects.with_progress().filter(user_id=user_id))
+        DailyCheckin.objects.filter(user_challenge__user_id=user_id, is_completed=True).count()
@@ -0,0 +1,84 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Тяжелые библиотеки, которые не должны грузиться при старте воркера
+HEAVY_MODULES = ('pandas', 'plotly', 'numpy')
+
+WSGI_IMPORT_SCRIPT = (
+    'import json, sys\n'
+    'import challengehub.wsgi\n'
+    'import challenges.views\n'
+    'print(json.dumps(sorted(m for m in {modules!r} if m in sys.modules)))\n'
+)
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время старта и потребление памяти (manage.py check и импорт WSGI-приложения)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз запускать каждый сценарий')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результат в JSON-файл')
+
+    def run_once(self, args):
+        """Запускает дочерний процесс и возвращает (секунды, пиковая память в МБ, stdout)"""
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            args,
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        stdout = process.stdout.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code:
+            raise CommandError(f'Команда {" ".join(args)} завершилась с кодом {exit_code}')
+        # ru_maxrss в Linux - килобайты, в macOS - байты
+        rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        return elapsed, rss_mb, stdout.decode()
+
+    def handle(self, *args, **options):
+        scenarios = {
+            'manage_check': [sys.executable, 'manage.py', 'check'],
+            'wsgi_import': [sys.executable, '-c', WSGI_IMPORT_SCRIPT.format(modules=HEAVY_MODULES)],
+        }
+
+        results = {}
+        for name, command in scenarios.items():
+            timings, memory = [], []
+            stdout = ''
+            for _ in range(options['repeat']):
+                elapsed, rss_mb, stdout = self.run_once(command)
+                timings.append(elapsed)
+                memory.append(rss_mb)
+
+            results[name] = {
+                'median_seconds': round(statistics.median(timings), 4),
+                'max_seconds': round(max(timings), 4),
+                'median_rss_mb': round(statistics.median(memory), 1),
+            }
+            if name == 'wsgi_import':
+                results[name]['heavy_modules_loaded'] = json.loads(stdout or '[]')
+
+            self.stdout.write(
+                f"{name}: {results[name]['median_seconds']} с, "
+                f"{results[name]['median_rss_mb']} МБ"
+            )
+
+        loaded = results['wsgi_import']['heavy_modules_loaded']
+        if loaded:
+            self.stdout.write(self.style.WARNING(f'При старте загружены тяжелые модули: {", ".join(loaded)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Тяжелые модули при старте не загружаются'))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
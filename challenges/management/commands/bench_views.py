@@ -0,0 +1,170 @@
+import json
+import math
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, reverse
+
+from challenges import urls as challenge_urls
+from challenges.models import ChallengeTemplate, UserChallenge
+
+# Страницы, которые открываются без входа
+ANONYMOUS_VIEWS = {'register', 'login'}
+# Выход разлогинил бы клиента посреди замера; пакетная отметка принимает только POST
+SKIPPED_VIEWS = {'logout', 'batch_checkin', 'import_data'}
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку, число SQL-запросов и размер ответа для каждой страницы challenges.urls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Пользователь, от имени которого открываются страницы (по умолчанию - с наибольшим числом отметок)')
+        parser.add_argument('--repeat', type=int, default=20, help='Замеров на страницу')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на страницу (минимум 1)')
+        parser.add_argument('--view', action='append', dest='views', help='Замерить только эту страницу (можно несколько раз)')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результат в JSON-файл')
+        parser.add_argument('--no-page-cache', action='store_true', help='Замерять без кеша страниц пользователя')
+        parser.add_argument('--compare', help='JSON предыдущего замера для сравнения')
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден')
+        user = User.objects.annotate(
+            checkin_count=Count('userchallenge__checkins')
+        ).order_by('-checkin_count', 'pk').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей - сначала выполните seed_demo')
+        return user
+
+    def url_for(self, name, user):
+        """Подставляет в URL объекты пользователя; None, если подходящих объектов нет"""
+        pattern = next(p for p in challenge_urls.urlpatterns if p.name == name)
+        kwargs = {}
+        if 'challenge_id' in pattern.pattern.converters:
+            challenge = UserChallenge.objects.filter(user=user).annotate(
+                checkin_count=Count('checkins')
+            ).order_by('-checkin_count', 'pk').first()
+            if challenge is None:
+                return None
+            kwargs['challenge_id'] = challenge.pk
+        if 'pk' in pattern.pattern.converters:
+            template = ChallengeTemplate.objects.first()
+            if template is None:
+                return None
+            kwargs['pk'] = template.pk
+        return reverse(name, kwargs=kwargs)
+
+    def measure(self, client, url, options):
+        # Прогрев заодно открывает все соединения, которые использует страница
+        for _ in range(max(1, options['warmup'])):
+            client.get(url)
+
+        timings = []
+        for _ in range(options['repeat']):
+            # Запросы считаются по всем открытым алиасам: часть страниц читает через readonly
+            with ExitStack() as stack:
+                captured = [
+                    stack.enter_context(CaptureQueriesContext(conn))
+                    for conn in connections.all()
+                    if conn.connection is not None
+                ]
+                started = time.perf_counter()
+                response = client.get(url)
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                timings.append((time.perf_counter() - started) * 1000)
+
+        return {
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'queries': sum(len(queries) for queries in captured),
+            'bytes': len(content),
+        }
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным')
+
+        names = []
+        for pattern in challenge_urls.urlpatterns:
+            if isinstance(pattern, URLPattern) and pattern.name and pattern.name not in names + list(SKIPPED_VIEWS):
+                names.append(pattern.name)
+        if options['views']:
+            unknown = set(options['views']) - set(names)
+            if unknown:
+                raise CommandError(f'Неизвестные страницы: {", ".join(sorted(unknown))}')
+            names = [name for name in names if name in options['views']]
+
+        user = self.get_user(options['user'])
+        results = {}
+        # Тестовому клиенту нужен хост testserver; замер не должен зависеть от collectstatic
+        overrides = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            'STATICFILES_STORAGE': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        }
+        if options['no_page_cache']:
+            overrides['CHALLENGES_PAGE_CACHE_TIMEOUT'] = 0
+        with override_settings(**overrides), transaction.atomic():
+            anonymous, logged_in = Client(), Client()
+            logged_in.force_login(user)
+
+            for name in names:
+                url = self.url_for(name, user)
+                if url is None:
+                    self.stdout.write(self.style.WARNING(f'{name}: нет данных для URL, пропущено'))
+                    continue
+                client = anonymous if name in ANONYMOUS_VIEWS else logged_in
+                results[name] = self.measure(client, url, options)
+                row = results[name]
+                self.stdout.write(
+                    f"{name:<20} {row['status']} p50 {row['p50_ms']:>8} мс  p95 {row['p95_ms']:>8} мс  "
+                    f"запросов {row['queries']:>3}  {row['bytes']} байт"
+                )
+
+            # GET-запросы не должны ничего менять, но сессии и прочее откатываем на всякий случай
+            transaction.set_rollback(True)
+
+        report = {
+            'user': user.username,
+            'repeat': options['repeat'],
+            'views': results,
+        }
+        if options['compare']:
+            self.compare(options['compare'], results)
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)['views']
+
+        self.stdout.write('\nСравнение с предыдущим замером:')
+        for name, row in results.items():
+            old = previous.get(name)
+            if not old:
+                continue
+            change = (row['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+            self.stdout.write(
+                f"{name:<20} p50 {old['p50_ms']} -> {row['p50_ms']} мс ({change:+.0f}%), "
+                f"запросов {old['queries']} -> {row['queries']}, байт {old['bytes']} -> {row['bytes']}"
+            )
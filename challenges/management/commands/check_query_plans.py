@@ -0,0 +1,83 @@
+import re
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from challenges.leaderboard import board, rank_query
+from challenges.models import Achievement, ActivityDay, DailyCheckin, Job, LeaderboardEntry, UserChallenge, UserStats
+
+# Таблицы, которые растут вместе с пользователями: полный проход по ним недопустим
+WATCHED_TABLES = {
+    model._meta.db_table
+    for model in (UserChallenge, DailyCheckin, Achievement, ActivityDay, UserStats, Job, LeaderboardEntry)
+}
+
+SCAN_RE = re.compile(r'\bSCAN (?:TABLE )?(\w+)')
+
+
+def key_queries(user_id=1, challenge_id=1, day=date(2024, 1, 15)):
+    """Запросы горячих путей в том виде, в котором их строит ORM"""
+    month = (day.replace(day=1), day.replace(day=28))
+    return {
+        'profile_challenges': UserChallenge.objects.with_progress().filter(user_id=user_id),
+        'profile_page': UserChallenge.objects.with_progress().filter(
+            user_id=user_id, status='completed', start_date__lt=day
+        ).order_by('status', '-start_date', '-pk')[:21],
+        'active_challenges': UserChallenge.objects.filter(user_id=user_id, status='active').order_by('start_date', 'id'),
+        'status_counts': UserChallenge.objects.filter(user_id=user_id, status='completed').values('id'),
+        'checkin_for_day': DailyCheckin.objects.filter(user_challenge_id=challenge_id, date=day),
+        'completed_checkins_of_challenge': DailyCheckin.objects.filter(
+            user_challenge_id=challenge_id, is_completed=True
+        ).order_by('-date'),
+        'challenge_month': DailyCheckin.objects.filter(user_challenge_id=challenge_id, date__range=month),
+        'user_completed_on_day': DailyCheckin.objects.filter(
+            user_challenge__user_id=user_id, date=day, is_completed=True
+        ),
+        'user_month': DailyCheckin.objects.filter(
+            user_challenge__user_id=user_id, user_challenge__status='active', date__range=month
+        ),
+        'achievement_titles': Achievement.objects.filter(user_id=user_id).order_by().values_list('title', flat=True),
+        'achievement_by_type': Achievement.objects.filter(user_id=user_id, type='streak', title='Первый шаг'),
+        'activity_today': ActivityDay.objects.filter(user_id=user_id, date=day).values_list('streak', flat=True),
+        'activity_longest': ActivityDay.objects.filter(user_id=user_id).order_by('-streak').values('streak')[:1],
+        'user_stats': UserStats.objects.filter(user_id=user_id),
+        'next_job': Job.objects.filter(status='pending', run_after__lte=timezone.now()).order_by('run_after', 'id'),
+        'leaderboard_page': board('completion_rate', 'week', 'sport', day).order_by('-completion_rate', 'user_id')[:51],
+        'leaderboard_rank': rank_query(user_id, 'streak', 'month', '', day),
+    }
+
+
+def full_scans(plan):
+    """Таблицы из WATCHED_TABLES, которые план читает целиком"""
+    return sorted({table for table in SCAN_RE.findall(plan) if table in WATCHED_TABLES})
+
+
+class Command(BaseCommand):
+    help = 'Проверяет планы (EXPLAIN QUERY PLAN) ключевых запросов: ни один не должен сканировать большую таблицу целиком'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Печатать планы всех запросов')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING(f'Проверка планов поддерживает только SQLite, а не {connection.vendor}'))
+            return
+
+        failures = []
+        for name, queryset in key_queries().items():
+            plan = queryset.explain()
+            scans = full_scans(plan)
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: полный проход по {", ".join(scans)}'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(f'{name}: OK')
+                if options['verbose_plans']:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'Запросы без подходящего индекса: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Все ключевые запросы используют индексы'))
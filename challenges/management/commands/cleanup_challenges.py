@@ -1,19 +1,136 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+import gzip
+import json
+import time
+from collections import Counter, defaultdict
 from datetime import timedelta
-from challenges.models import UserChallenge
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from challenges.activity import sync_activity_day
+from challenges.leaderboard import add_deltas, adjust_entries, checkin_deltas, completion_deltas, last_day
+from challenges.models import ChallengeTemplate, DailyCheckin, UserChallenge
+from challenges.page_cache import invalidate_user_pages
+from challenges.signals import suppress_derived_updates
+from challenges.summary import adjust_user_stats, status_deltas, touch_stats, tracked_days_delta
+from challenges.transactions import immediate_atomic
+
 
 class Command(BaseCommand):
-    help = 'Удаляет завершенные челленджи старше 30 дней'
+    help = 'Удаляет завершенные челленджи старше 30 дней (пакетами, не блокируя базу надолго)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Удалять челленджи, начатые раньше, чем столько дней назад')
+        parser.add_argument('--batch-size', type=int, default=200, help='Челленджей в одной транзакции')
+        parser.add_argument('--sleep', type=float, default=0.5, help='Пауза между пакетами в секундах')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, что будет удалено')
+        parser.add_argument('--archive', help='Перед удалением сохранить челленджи и отметки в JSONL (.gz)')
 
-    def handle(self, *args, **kwargs):
-        threshold = timezone.now().date() - timedelta(days=30)
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        threshold = timezone.now().date() - timedelta(days=options['days'])
         old_challenges = UserChallenge.objects.filter(
             status__in=['completed', 'failed'],
             start_date__lt=threshold
         )
-        
-        count = old_challenges.count()
-        old_challenges.delete()
-        
-        self.stdout.write(self.style.SUCCESS(f'Удалено {count} старых челленджей'))
\ No newline at end of file
+
+        if options['dry_run']:
+            count = old_challenges.count()
+            checkins = DailyCheckin.objects.filter(user_challenge__in=old_challenges).count()
+            batches = -(-count // options['batch_size'])
+            self.stdout.write(f'Будет удалено {count} челленджей и {checkins} отметок за {batches} пакетов')
+            return
+
+        archive = gzip.open(options['archive'], 'at', encoding='utf-8') if options['archive'] else None
+        deleted_challenges = deleted_checkins = batch_number = 0
+        last_pk = 0
+        try:
+            while True:
+                ids = list(
+                    old_challenges.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+                )
+                if not ids:
+                    break
+                last_pk = ids[-1]
+
+                challenges, checkins = self.delete_batch(ids, archive)
+                batch_number += 1
+                deleted_challenges += challenges
+                deleted_checkins += checkins
+                self.stdout.write(
+                    f'Пакет {batch_number}: удалено {challenges} челленджей и {checkins} отметок '
+                    f'(всего {deleted_challenges} и {deleted_checkins})'
+                )
+                # Пауза дает пройти отметкам пользователей между пакетами
+                if options['sleep'] and len(ids) == options['batch_size']:
+                    time.sleep(options['sleep'])
+        finally:
+            if archive:
+                archive.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено {deleted_challenges} старых челленджей и {deleted_checkins} отметок'
+        ))
+
+    def delete_batch(self, ids, archive):
+        """Удаляет пакет челленджей с отметками одной короткой транзакцией"""
+        with immediate_atomic():
+            challenges = list(UserChallenge.objects.filter(pk__in=ids).values())
+            checkins = list(DailyCheckin.objects.filter(user_challenge_id__in=ids).values())
+
+            if archive:
+                for kind, rows in (('challenge', challenges), ('checkin', checkins)):
+                    for row in rows:
+                        archive.write(json.dumps({'type': kind, **row}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                # Архив должен быть на диске до того, как данные удалены
+                archive.flush()
+
+            with suppress_derived_updates():
+                UserChallenge.objects.filter(pk__in=ids).delete()
+            self.apply_deltas(challenges, checkins)
+        return len(challenges), len(checkins)
+
+    def apply_deltas(self, challenges, checkins):
+        """
+        Производные данные - дельтами по удаленным строкам: цена зависит от
+        размера пакета, а не от истории пользователей
+        """
+        owners = {row['id']: row['user_id'] for row in challenges}
+        templates = ChallengeTemplate.objects.in_bulk({row['template_id'] for row in challenges if row['template_id']})
+        categories = {}
+        deltas = defaultdict(Counter)
+        board = defaultdict(dict)
+        completed_days = defaultdict(set)
+        checkin_days = defaultdict(set)
+        for row in challenges:
+            deltas[row['user_id']].update(status_deltas(row['status'], None))
+            deltas[row['user_id']]['total_challenges'] -= 1
+            template = templates.get(row['template_id'])
+            categories[row['id']] = template.category if template else row['custom_category']
+            duration = template.duration_days if template else row['custom_duration']
+            add_deltas(
+                board[row['user_id']], categories[row['id']],
+                completion_deltas(last_day(row['start_date'], duration), row['status'], None)
+            )
+        for row in checkins:
+            user_id = owners[row['user_challenge_id']]
+            deltas[user_id]['total_checkins'] -= 1
+            checkin_days[user_id].add(row['date'])
+            if row['is_completed']:
+                deltas[user_id]['completed_checkins'] -= 1
+                completed_days[user_id].add(row['date'])
+            add_deltas(
+                board[user_id], categories[row['user_challenge_id']],
+                checkin_deltas((row['date'], row['is_completed']), None)
+            )
+
+        for user_id, counts in deltas.items():
+            counts['active_days'] += sum(sync_activity_day(user_id, day) for day in sorted(completed_days[user_id]))
+            counts['tracked_days'] += tracked_days_delta(user_id, removed=checkin_days[user_id])
+            adjust_user_stats(user_id, **counts)
+            adjust_entries(user_id, board[user_id])
+            invalidate_user_pages(user_id)
+        touch_stats(deltas)
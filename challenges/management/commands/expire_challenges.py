@@ -0,0 +1,135 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from challenges.achievements import EVENT_STATUS
+from challenges.jobs import JOB_HANDLERS, enqueue
+from challenges.leaderboard import add_deltas, adjust_entries, completion_deltas, last_day
+from challenges.models import DaysBetween, UserChallenge
+from challenges.page_cache import invalidate_user_pages
+from challenges.summary import adjust_user_stats, touch_stats
+from challenges.transactions import immediate_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Завершает активные челленджи, срок которых прошел (для запуска по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Челленджей в одной транзакции')
+        parser.add_argument('--today', type=date.fromisoformat, help='Считать сегодняшней эту дату (ГГГГ-ММ-ДД)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, что будет завершено')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        today = options['today'] or timezone.now().date()
+        # Срок прошел, когда последний день челленджа (start + duration - 1) уже позади.
+        # check_and_complete закрывает челлендж и в последний день, но по расписанию
+        # так делать нельзя: пользователь еще может отметиться сегодня.
+        expired = UserChallenge.objects.annotate(
+            duration=Coalesce('custom_duration', 'template__duration_days'),
+            category=Case(When(template__isnull=False, then=F('template__category')), default=F('custom_category')),
+            age=DaysBetween('start_date', Value(today, output_field=models.DateField())),
+        ).filter(
+            status='active',
+            duration__gt=0,
+            age__gte=F('duration'),
+        ).order_by('pk')
+
+        if options['dry_run']:
+            statuses = Counter(
+                'completed' if completed >= duration else 'failed'
+                for completed, duration in expired.values_list('completed_days', 'duration').iterator()
+            )
+            self.stdout.write(
+                f"Будет завершено: успешно {statuses['completed']}, провалено {statuses['failed']}"
+            )
+            return
+
+        # В памяти только текущий пакет - объем базы не важен
+        totals = Counter()
+        last_pk = 0
+        while True:
+            rows = list(
+                expired.filter(pk__gt=last_pk).values_list(
+                    'pk', 'user_id', 'completed_days', 'duration', 'start_date', 'category'
+                )[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            counts, user_ids = self.expire_batch(rows, today)
+            totals.update(counts)
+            self.run_post_checkin(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Завершено: успешно {totals['completed']}, провалено {totals['failed']}"
+        ))
+
+    def expire_batch(self, rows, today):
+        """Два UPDATE на пакет и по одной дельте сводки и таблиц лидеров на пользователя"""
+        ids = {'completed': [], 'failed': []}
+        challenges = {}
+        for pk, user_id, completed, duration, start_date, category in rows:
+            ids['completed' if completed >= duration else 'failed'].append(pk)
+            challenges[pk] = (category, last_day(start_date, duration))
+
+        deltas = defaultdict(Counter)
+        board = defaultdict(dict)
+        with immediate_atomic():
+            for status, pks in ids.items():
+                if not pks:
+                    continue
+                # Повторная проверка статуса: челлендж могли закрыть, пока шел пакет
+                changed = UserChallenge.objects.filter(pk__in=pks, status='active')
+                for pk, user_id in changed.values_list('pk', 'user_id'):
+                    deltas[user_id][status] += 1
+                    category, end_date = challenges[pk]
+                    add_deltas(board[user_id], category, completion_deltas(end_date, 'active', status, today))
+                changed.update(status=status, stats_updated_at=timezone.now())
+
+            for user_id, counts in deltas.items():
+                adjust_user_stats(
+                    user_id,
+                    active_challenges=-sum(counts.values()),
+                    completed_challenges=counts['completed'],
+                    failed_challenges=counts['failed'],
+                )
+                adjust_entries(user_id, board[user_id], today)
+                invalidate_user_pages(user_id)
+            touch_stats(deltas)
+
+        totals = Counter()
+        for counts in deltas.values():
+            totals.update(counts)
+        return totals, list(deltas)
+
+    def run_post_checkin(self, user_ids):
+        """
+        Задача post_checkin за смену статуса (достижения) - в фоновой
+        очереди или сразу, как dispatch: ошибка одного пользователя
+        записывается в лог и не останавливает остальных
+        """
+        payload = {'events': [EVENT_STATUS]}
+        if getattr(settings, 'CHALLENGES_ASYNC_JOBS', False):
+            for user_id in user_ids:
+                enqueue(user_id, 'post_checkin', payload)
+            return
+
+        for user in User.objects.filter(pk__in=user_ids).iterator():
+            try:
+                with transaction.atomic():
+                    JOB_HANDLERS['post_checkin'](user, payload)
+            except Exception:
+                logger.exception('Ошибка при выполнении задачи post_checkin для %s', user)
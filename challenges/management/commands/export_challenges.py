@@ -0,0 +1,36 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges.export import FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает челленджи и отметки пользователей в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Имя пользователя (можно несколько раз; по умолчанию - все)')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Формат выгрузки')
+        parser.add_argument('--gzip', action='store_true', help='Сжимать выгрузку в gzip')
+        parser.add_argument('-o', '--output', help='Файл для выгрузки (по умолчанию - stdout)')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+            if users.count() != len(set(options['usernames'])):
+                raise CommandError('Некоторые пользователи не найдены')
+
+        stream = export_stream(options['format'], users, options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for block in stream:
+                    f.write(block)
+        else:
+            out = getattr(self.stdout._out, 'buffer', None)
+            if out is None:
+                raise CommandError('Вывод не поддерживает байты - укажите --output')
+            for block in stream:
+                out.write(block)
+            out.flush()
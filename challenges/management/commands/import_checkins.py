@@ -0,0 +1,62 @@
+import io
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges.export import FORMATS
+from challenges.imports import BATCH_SIZE, READ_ERRORS, CheckinImporter, open_upload, read_rows
+from challenges.jobs import JOB_HANDLERS, enqueue
+
+
+class Command(BaseCommand):
+    help = 'Импортирует историю отметок из CSV или NDJSON в формате выгрузки (export_challenges)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Файл выгрузки (можно .gz); "-" - читать из stdin')
+        parser.add_argument('--user', help='Импортировать все строки этому пользователю (иначе - по колонке username)')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Строк в одной транзакции')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        path = options['file']
+        # У stdin нет seek, а open_upload смотрит на сигнатуру gzip - читаем его в память
+        fileobj = io.BytesIO(sys.stdin.buffer.read()) if path == '-' else open(path, 'rb')
+        importer = CheckinImporter(user, batch_size=options['batch_size'])
+        try:
+            stream, fmt = open_upload(fileobj, path, options['format'])
+            result = importer.run(read_rows(stream, fmt))
+        except READ_ERRORS as e:
+            raise CommandError(f'Не удалось прочитать {path}: {e}')
+        finally:
+            fileobj.close()
+
+        self.post_checkin(importer.post_checkin_payloads())
+
+        for error in result['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк: {result['rows']}, импортировано отметок: {result['imported']}, "
+            f"повторов: {result['duplicates']}, пропущено: {result['skipped']}, "
+            f"создано челленджей: {result['challenges_created']}"
+        ))
+
+    def post_checkin(self, payloads):
+        """Завершение челленджей и достижения - один раз на пользователя, в очереди или сразу"""
+        if getattr(settings, 'CHALLENGES_ASYNC_JOBS', False):
+            for user_id, payload in payloads.items():
+                enqueue(user_id, 'post_checkin', payload)
+            return
+
+        for user in User.objects.filter(pk__in=payloads).iterator():
+            JOB_HANDLERS['post_checkin'](user, payloads[user.pk])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from challenges.page_cache import page_cache_stats, reset_page_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает счетчики попаданий и промахов кеша страниц пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = page_cache_stats()
+        self.stdout.write(
+            f"Попаданий: {stats['hits']}, промахов: {stats['misses']}, доля попаданий: {stats['hit_rate']:.1%}"
+        )
+        if options['reset']:
+            reset_page_cache_stats()
+            self.stdout.write('Счетчики обнулены')
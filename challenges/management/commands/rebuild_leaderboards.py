@@ -0,0 +1,53 @@
+from datetime import date, datetime, time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from challenges.leaderboard import period_starts, refresh_user_entries
+from challenges.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = 'Сжимает таблицы лидеров: удаляет прошедшие периоды и пересчитывает прерванные серии (раз в сутки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать строки всех пользователей с челленджами')
+        parser.add_argument('--today', type=date.fromisoformat, help='Считать сегодняшней эту дату (ГГГГ-ММ-ДД)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Пользователей в одном запросе к списку')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        today = options['today'] or timezone.now().date()
+        stale = Q()
+        for period, start in period_starts(today).items():
+            if start is not None:
+                stale |= Q(period=period) & ~Q(period_start=start)
+        deleted, _ = LeaderboardEntry.objects.filter(stale).delete()
+        self.stdout.write(f'Удалено строк прошедших периодов: {deleted}')
+
+        if options['full']:
+            users = User.objects.filter(userchallenge__isnull=False).distinct()
+        else:
+            # Серия могла прерваться только у тех, кто сегодня еще не отмечался
+            day_start = timezone.make_aware(datetime.combine(today, time.min))
+            users = User.objects.filter(
+                leaderboard_entries__streak__gt=0,
+                leaderboard_entries__updated_at__lt=day_start,
+            ).distinct()
+
+        refreshed = 0
+        last_pk = 0
+        while True:
+            ids = list(users.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            for user_id in ids:
+                refresh_user_entries(user_id, today)
+            refreshed += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано пользователей: {refreshed}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from challenges.search import TABLE, install_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересоздает полнотекстовый индекс поиска и заполняет его заново'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Алиас базы данных')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not install_search_index(connection):
+            raise CommandError('База не поддерживает SQLite FTS5 - поиск работает через LIKE')
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {TABLE}')
+            total = cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS(f'Индекс пересоздан, записей: {total}'))
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from challenges.activity import rebuild_activity_days
+from challenges.models import UserChallenge
+from challenges.streaks import rebuild_challenge_streaks
+from challenges.summary import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводки пользователей (UserStats) по данным - для ремонта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Имя пользователя (можно несколько раз)')
+        parser.add_argument('--activity', action='store_true', help='Также пересобрать индекс дней активности')
+        parser.add_argument('--streaks', action='store_true', help='Также пересчитать счетчики и серии челленджей')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('pk', flat=True))
+            if len(user_ids) != len(set(options['usernames'])):
+                raise CommandError('Некоторые пользователи не найдены')
+
+        if options['activity']:
+            rebuild_activity_days(user_ids)
+            self.stdout.write('Индекс дней активности пересобран')
+
+        if options['streaks']:
+            challenges = UserChallenge.objects.order_by('pk')
+            if user_ids is not None:
+                challenges = challenges.filter(user_id__in=user_ids)
+            ids = list(challenges.values_list('pk', flat=True))
+            # Пачками, чтобы IN (...) не упирался в лимит параметров SQLite
+            for start in range(0, len(ids), 500):
+                rebuild_challenge_streaks(ids[start:start + 500])
+            self.stdout.write(f'Серии пересчитаны для {len(ids)} челленджей')
+
+        count = rebuild_user_stats(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано сводок: {count}'))
@@ -0,0 +1,81 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from challenges.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди (таблица Job)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Число потоков-исполнителей')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза (сек), когда очередь пуста')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help='Через сколько минут задача в статусе running считается зависшей')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(timedelta(minutes=options['stale_after']))
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь зависших задач: {requeued}')
+
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.done = self.failed = 0
+
+        try:
+            if options['concurrency'] <= 1:
+                self.work(options)
+            else:
+                self.run_threads(options)
+        except KeyboardInterrupt:
+            self.stop.set()
+
+        self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {self.done}, с ошибкой: {self.failed}'))
+
+    def run_threads(self, options):
+        """Несколько исполнителей, у каждого потока свое соединение с БД"""
+        def thread_main():
+            try:
+                self.work(options)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=thread_main, daemon=True) for _ in range(options['concurrency'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(0.5)
+        except KeyboardInterrupt:
+            self.stop.set()
+            for worker in workers:
+                worker.join()
+
+    def work(self, options):
+        while not self.stop.is_set():
+            if not options['once']:
+                # Долгоживущий воркер обновляет соединения так же, как это делает запрос
+                close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                self.stop.wait(options['poll_interval'])
+                continue
+
+            started = time.perf_counter()
+            ok = run_job(job)
+            with self.lock:
+                if ok:
+                    self.done += 1
+                else:
+                    self.failed += 1
+            if options['verbosity'] > 1:
+                state = 'ok' if ok else f'ошибка: {job.last_error}'
+                self.stdout.write(f'{job.kind} #{job.pk} ({job.user.username}): {time.perf_counter() - started:.3f} с, {state}')
@@ -0,0 +1,171 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from challenges.achievements import evaluate_achievements
+from challenges.activity import rebuild_activity_days
+from challenges.leaderboard import refresh_user_entries
+from challenges.models import ChallengeTemplate, DailyCheckin, UserChallenge
+from challenges.search import reindex_challenges, reindex_checkins
+from challenges.streaks import compute_streaks
+from challenges.summary import rebuild_user_stats
+
+DEMO_TITLES = {
+    'sport': ['Утренняя пробежка', '100 отжиманий', 'Планка каждый день'],
+    'creative': ['Скетч в день', 'Писать 500 слов', 'Новая мелодия'],
+    'study': ['Английский 30 минут', 'Глава книги в день', 'Задача по алгоритмам'],
+    'health': ['2 литра воды', 'Без сахара', 'Сон до 23:00'],
+    'productivity': ['Ранний подъем', 'Планирование дня', 'Без соцсетей до обеда'],
+    'other': ['Дневник благодарности', 'Прогулка 10 000 шагов', 'Звонок близким'],
+}
+DURATIONS = [7, 14, 21, 30, 30, 60, 90]
+# Самооценка чаще бывает хорошей, чем плохой
+RATING_WEIGHTS = [1, 2, 4, 4, 2]
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями, челленджами и отметками (для замеров)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Количество пользователей')
+        parser.add_argument('--challenges', type=int, default=5, help='Челленджей на пользователя')
+        parser.add_argument('--days', type=int, default=60, help='Глубина истории отметок в днях')
+        parser.add_argument('--prefix', default='demo', help='Префикс имен пользователей')
+        parser.add_argument('--password', default='demo12345', help='Пароль всех демо-пользователей')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+        parser.add_argument('--flush', action='store_true', help='Сначала удалить демо-пользователей с тем же префиксом')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['challenges'] < 1 or options['days'] < 1:
+            raise CommandError('--users, --challenges и --days должны быть положительными')
+
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}_')
+        if options['flush']:
+            deleted, _ = existing.delete()
+            self.stdout.write(f'Удалено объектов: {deleted}')
+        elif existing.exists():
+            raise CommandError(f'Пользователи с префиксом "{prefix}_" уже есть - используйте --flush или другой --prefix')
+
+        today = timezone.now().date()
+        with transaction.atomic():
+            users = self.create_users(options)
+            templates = self.get_templates()
+            challenges, checkins = self.build_challenges(users, templates, options, rng, today)
+            UserChallenge.objects.bulk_create(challenges, batch_size=BATCH_SIZE)
+            for challenge, challenge_checkins in checkins:
+                for checkin in challenge_checkins:
+                    checkin.user_challenge_id = challenge.pk
+            DailyCheckin.objects.bulk_create(
+                (checkin for _, challenge_checkins in checkins for checkin in challenge_checkins),
+                batch_size=BATCH_SIZE
+            )
+
+            # bulk_create не вызывает сигналы - производные данные пересчитываются разом
+            user_ids = [user.pk for user in users]
+            challenge_ids = [challenge.pk for challenge in challenges]
+            reindex_challenges(challenge_ids)
+            reindex_checkins(
+                DailyCheckin.objects.filter(user_challenge_id__in=challenge_ids).exclude(notes='')
+                .values_list('pk', flat=True)
+            )
+            rebuild_activity_days(user_ids)
+            rebuild_user_stats(user_ids)
+            for user in users:
+                evaluate_achievements(user)
+                refresh_user_entries(user.pk)
+
+        total_checkins = sum(len(challenge_checkins) for _, challenge_checkins in checkins)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, челленджей {len(challenges)}, отметок {total_checkins}'
+        ))
+
+    def create_users(self, options):
+        # Хеш пароля считается один раз - это самая медленная часть создания пользователя
+        password = make_password(options['password'])
+        joined = timezone.now() - timedelta(days=options['days'])
+        User.objects.bulk_create([
+            User(
+                username=f"{options['prefix']}_{number}",
+                email=f"{options['prefix']}_{number}@example.com",
+                password=password,
+                date_joined=joined,
+            )
+            for number in range(1, options['users'] + 1)
+        ], batch_size=BATCH_SIZE)
+        return list(User.objects.filter(username__startswith=f"{options['prefix']}_").order_by('pk'))
+
+    def get_templates(self):
+        templates = list(ChallengeTemplate.objects.filter(is_active=True))
+        if templates:
+            return templates
+        return ChallengeTemplate.objects.bulk_create([
+            ChallengeTemplate(
+                title=title,
+                description=f'Демо-шаблон: {title.lower()}',
+                category=category,
+                duration_days=duration,
+                difficulty=difficulty,
+            )
+            for category, titles in DEMO_TITLES.items()
+            for title, duration, difficulty in zip(titles, (14, 30, 60), (1, 2, 3))
+        ])
+
+    def build_challenges(self, users, templates, options, rng, today):
+        """Строит челленджи и отметки в памяти, без запросов к базе"""
+        challenges, checkins = [], []
+        for user in users:
+            # У каждого пользователя своя дисциплина: от 35% до 95% выполненных дней
+            discipline = rng.betavariate(5, 2) * 0.6 + 0.35
+            for _ in range(options['challenges']):
+                duration = rng.choice(DURATIONS)
+                start = today - timedelta(days=rng.randint(0, options['days'] - 1))
+                challenge = UserChallenge(
+                    user=user,
+                    start_date=start,
+                    custom_difficulty=rng.randint(1, 3),
+                    notes='',
+                )
+                if rng.random() < 0.5:
+                    challenge.template = rng.choice(templates)
+                else:
+                    category = rng.choice(list(DEMO_TITLES))
+                    challenge.custom_title = rng.choice(DEMO_TITLES[category])
+                    challenge.custom_description = 'Свой челлендж'
+                    challenge.custom_category = category
+                    challenge.custom_duration = duration
+                duration = challenge.custom_duration or challenge.template.duration_days
+
+                days = min(duration, (today - start).days + 1)
+                challenge_checkins = []
+                for offset in range(days):
+                    # Часть дней пользователь просто не открывает сайт
+                    if rng.random() > 0.9:
+                        continue
+                    is_completed = rng.random() < discipline
+                    challenge_checkins.append(DailyCheckin(
+                        date=start + timedelta(days=offset),
+                        is_completed=is_completed,
+                        rating=rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0] if is_completed else None,
+                    ))
+
+                counters = compute_streaks(checkin.date for checkin in challenge_checkins if checkin.is_completed)
+                for name, value in counters.items():
+                    setattr(challenge, name, value)
+                completed = counters['completed_days']
+                if (today - start).days >= duration:
+                    challenge.status = 'completed' if completed >= duration else 'failed'
+                elif rng.random() < 0.05:
+                    challenge.status = 'paused'
+                else:
+                    challenge.status = 'active'
+                challenges.append(challenge)
+                checkins.append((challenge, challenge_checkins))
+        return challenges, checkins
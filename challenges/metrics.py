@@ -0,0 +1,191 @@
+# metrics.py
+"""
+Метрики запросов в формате Prometheus.
+
+MetricsMiddleware (middleware.py) записывает для каждого запроса имя
+представления, время ответа, число и время SQL-запросов, размер ответа
+и код статуса. Каждый процесс копит метрики в памяти и раз в
+FLUSH_INTERVAL секунд сохраняет их в свой файл в CHALLENGES_METRICS_DIR;
+/metrics суммирует файлы всех воркеров gunicorn. Без каталога метрики
+видны только в текущем процессе.
+
+Счетчики завершившихся воркеров остаются в их файлах, поэтому суммы не
+уменьшаются при перезапуске воркера. Каталог стоит очищать при деплое.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .page_cache import page_cache_stats
+
+# Границы корзин гистограммы времени ответа, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FLUSH_INTERVAL = 5
+
+# Прочие методы сводятся в other, чтобы не плодить метки
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+FILE_PREFIX = 'metrics-'
+
+
+def _empty_view():
+    return {
+        'buckets': [0] * (len(DURATION_BUCKETS) + 1),
+        'duration_sum': 0.0,
+        'count': 0,
+        'queries': 0,
+        'query_seconds': 0.0,
+        'response_bytes': 0,
+    }
+
+
+def _empty():
+    return {'requests': {}, 'views': {}}
+
+
+def merge(total, data):
+    """Прибавляет метрики data к total (счетчики и корзины складываются)"""
+    for key, count in data['requests'].items():
+        total['requests'][key] = total['requests'].get(key, 0) + count
+    for view, values in data['views'].items():
+        current = total['views'].setdefault(view, _empty_view())
+        for name, value in values.items():
+            if name == 'buckets':
+                current[name] = [a + b for a, b in zip(current[name], value)]
+            else:
+                current[name] += value
+    return total
+
+
+class MetricsStore:
+    """Метрики текущего процесса с периодическим сбросом в файл"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # После fork (gunicorn --preload) у воркера свои метрики и свой файл
+        self.pid = os.getpid()
+        self.data = _empty()
+        self.filename = f'{FILE_PREFIX}{self.pid}-{uuid.uuid4().hex[:8]}.json'
+        self.last_flush = time.monotonic()
+
+    @property
+    def directory(self):
+        path = getattr(settings, 'CHALLENGES_METRICS_DIR', None)
+        return Path(path) if path else None
+
+    def observe(self, view, method, status, duration, queries, query_seconds, response_bytes):
+        method = method if method in METHODS else 'other'
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset()
+            key = f'{view}\t{method}\t{status}'
+            self.data['requests'][key] = self.data['requests'].get(key, 0) + 1
+            values = self.data['views'].setdefault(view, _empty_view())
+            bucket = next((i for i, bound in enumerate(DURATION_BUCKETS) if duration <= bound), len(DURATION_BUCKETS))
+            values['buckets'][bucket] += 1
+            values['duration_sum'] += duration
+            values['count'] += 1
+            values['queries'] += queries
+            values['query_seconds'] += query_seconds
+            values['response_bytes'] += response_bytes
+            if time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+                self._flush()
+
+    def _flush(self):
+        directory = self.directory
+        self.last_flush = time.monotonic()
+        if directory is None:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        # Запись во временный файл и os.replace: читатель не увидит файл наполовину
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp, directory / self.filename)
+
+    def collect(self):
+        """Сумма метрик всех процессов"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset()
+            self._flush()
+            own = json.loads(json.dumps(self.data))
+        directory = self.directory
+        if directory is None:
+            return own
+
+        total = _empty()
+        for path in directory.glob(f'{FILE_PREFIX}*.json'):
+            try:
+                merge(total, json.loads(path.read_text()))
+            except (OSError, ValueError):
+                # Файл удалили при очистке каталога
+                continue
+        return total
+
+    def clear(self):
+        with self.lock:
+            self._reset()
+
+
+store = MetricsStore()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics(data=None):
+    """Метрики в текстовом формате Prometheus"""
+    data = store.collect() if data is None else data
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f'{name}{suffix}{{{label_text}}} {_number(value)}' if label_text else f'{name}{suffix} {_number(value)}')
+
+    requests = []
+    for key, count in sorted(data['requests'].items()):
+        view, method, status = key.split('\t')
+        requests.append(('', {'view': view, 'method': method, 'status': status}, count))
+    family('challenges_http_requests_total', 'counter', 'Запросы по представлению, методу и статусу', requests)
+
+    views = sorted(data['views'].items())
+    histogram = []
+    for view, values in views:
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + ('+Inf',), values['buckets']):
+            cumulative += count
+            histogram.append(('_bucket', {'view': view, 'le': bound}, cumulative))
+        histogram.append(('_sum', {'view': view}, values['duration_sum']))
+        histogram.append(('_count', {'view': view}, values['count']))
+    family('challenges_http_request_duration_seconds', 'histogram', 'Время ответа', histogram)
+
+    for name, field, help_text in (
+        ('challenges_db_queries_total', 'queries', 'SQL-запросы за время ответа'),
+        ('challenges_db_query_duration_seconds_total', 'query_seconds', 'Время SQL-запросов'),
+        ('challenges_http_response_bytes_total', 'response_bytes', 'Размер ответов (без потоковых)'),
+    ):
+        family(name, 'counter', help_text, [('', {'view': view}, values[field]) for view, values in views])
+
+    cache_stats = page_cache_stats()
+    family('challenges_page_cache_hits_total', 'counter', 'Попадания в кеш страниц', [('', {}, cache_stats['hits'])])
+    family('challenges_page_cache_misses_total', 'counter', 'Промахи кеша страниц', [('', {}, cache_stats['misses'])])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,75 @@
+# middleware.py
+import time
+from contextlib import ExitStack
+
+from django.contrib import messages
+from django.db import connections
+
+from .jobs import SESSION_FLAG, has_unfinished_jobs, pop_job_messages
+from .metrics import store
+
+
+class JobMessagesMiddleware:
+    """
+    Показывает сообщения выполненных фоновых задач на следующей загрузке
+    страницы. В базу обращается только пока в сессии стоит флаг задач.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.user.is_authenticated and request.session.get(SESSION_FLAG):
+            for level, text in pop_job_messages(request.user):
+                messages.add_message(request, messages.DEFAULT_LEVELS[level.upper()], text)
+            if not has_unfinished_jobs(request.user):
+                del request.session[SESSION_FLAG]
+        return self.get_response(request)
+
+
+class QueryTimer:
+    """execute_wrapper, считающий SQL-запросы и их время"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Записывает метрики запроса (metrics.py) по имени представления из
+    urls.py. Стоит первым, чтобы время включало остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        store.observe(
+            view=match.view_name if match else 'unresolved',
+            method=request.method,
+            status=response.status_code,
+            duration=duration,
+            queries=queries.count,
+            query_seconds=queries.seconds,
+            # У потокового ответа размер до отправки неизвестен
+            response_bytes=0 if response.streaming else len(response.content),
+        )
+        return response
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_activity_days(apps, schema_editor):
+    """Заполняет индекс дней активности по уже существующим отметкам"""
+    ActivityDay = apps.get_model('challenges', 'ActivityDay')
+    DailyCheckin = apps.get_model('challenges', 'DailyCheckin')
+
+    rows = DailyCheckin.objects.filter(is_completed=True).values_list(
+        'user_challenge__user_id', 'date'
+    ).annotate(completed=Count('id')).order_by('user_challenge__user_id', 'date')
+
+    days = []
+    previous_user = previous_date = None
+    streak = 0
+    for user_id, day, completed in rows.iterator():
+        if user_id == previous_user and (day - previous_date).days == 1:
+            streak += 1
+        else:
+            streak = 1
+        previous_user, previous_date = user_id, day
+        days.append(ActivityDay(user_id=user_id, date=day, completed_checkins=completed, streak=streak))
+
+    ActivityDay.objects.bulk_create(days, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0003_achievement'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='achievement',
+            name='type',
+            field=models.CharField(choices=[('streak', 'Серия дней'), ('completion', 'Завершение челленджей'), ('consistency', 'Регулярность'), ('variety', 'Разнообразие')], max_length=20, verbose_name='Тип достижения'),
+        ),
+        migrations.CreateModel(
+            name='ActivityDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('completed_checkins', models.PositiveIntegerField(default=1, verbose_name='Выполнено отметок')),
+                ('streak', models.PositiveIntegerField(default=1, verbose_name='Серия дней на эту дату')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_days', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'День активности',
+                'verbose_name_plural': 'Дни активности',
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(fill_activity_days, migrations.RunPython.noop),
+    ]
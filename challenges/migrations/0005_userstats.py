@@ -0,0 +1,35 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0004_activityday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_challenges', models.IntegerField(default=0, verbose_name='Всего челленджей')),
+                ('active_challenges', models.IntegerField(default=0, verbose_name='Активных челленджей')),
+                ('completed_challenges', models.IntegerField(default=0, verbose_name='Завершенных челленджей')),
+                ('failed_challenges', models.IntegerField(default=0, verbose_name='Проваленных челленджей')),
+                ('total_checkins', models.IntegerField(default=0, verbose_name='Всего отметок')),
+                ('completed_checkins', models.IntegerField(default=0, verbose_name='Выполненных отметок')),
+                ('active_days', models.IntegerField(default=0, verbose_name='Дней с выполненными отметками')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats_summary', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сводка пользователя',
+                'verbose_name_plural': 'Сводки пользователей',
+            },
+        ),
+    ]
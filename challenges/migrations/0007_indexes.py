@@ -0,0 +1,25 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0006_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='achievement',
+            index=models.Index(fields=['user', 'type', 'title'], name='achv_user_type_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycheckin',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['user_challenge', 'date'], name='checkin_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userchallenge',
+            index=models.Index(fields=['user', 'status', 'start_date'], name='uc_user_status_start_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:03
+
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations, models
+
+
+def fill_streaks(apps, schema_editor):
+    """Пересчитывает счетчики и серии существующих челленджей по их отметкам"""
+    UserChallenge = apps.get_model('challenges', 'UserChallenge')
+    DailyCheckin = apps.get_model('challenges', 'DailyCheckin')
+
+    rows = DailyCheckin.objects.filter(is_completed=True).order_by(
+        'user_challenge_id', 'date'
+    ).values_list('user_challenge_id', 'date')
+
+    challenges = []
+    for challenge_id, group in groupby(rows.iterator(), key=itemgetter(0)):
+        completed = streak = longest = 0
+        last = None
+        for _, day in group:
+            streak = streak + 1 if last is not None and day - last == timedelta(days=1) else 1
+            longest = max(longest, streak)
+            last = day
+            completed += 1
+        challenges.append(UserChallenge(
+            pk=challenge_id, completed_days=completed, current_streak=streak,
+            longest_streak=longest, last_completed_date=last,
+        ))
+
+    UserChallenge.objects.bulk_update(
+        challenges, ['completed_days', 'current_streak', 'longest_streak', 'last_completed_date'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0007_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userchallenge',
+            name='last_completed_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Последний выполненный день'),
+        ),
+        migrations.AddField(
+            model_name='userchallenge',
+            name='longest_streak',
+            field=models.IntegerField(default=0, verbose_name='Лучшая серия'),
+        ),
+        migrations.RunPython(fill_streaks, migrations.RunPython.noop),
+    ]
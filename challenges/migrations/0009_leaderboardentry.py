@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('challenges', '0008_userchallenge_streaks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(blank=True, max_length=20, verbose_name='Категория')),
+                ('period', models.CharField(choices=[('week', 'Неделя'), ('month', 'Месяц'), ('all', 'Все время')], max_length=10, verbose_name='Период')),
+                ('period_start', models.DateField(blank=True, null=True, verbose_name='Начало периода')),
+                ('streak', models.PositiveIntegerField(default=0, verbose_name='Текущая серия')),
+                ('completion_rate', models.FloatField(blank=True, null=True, verbose_name='Доля выполненных отметок, %')),
+                ('completed_challenges', models.PositiveIntegerField(default=0, verbose_name='Завершено челленджей')),
+                ('completed_checkins', models.PositiveIntegerField(default=0, verbose_name='Выполнено отметок')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Строка таблицы лидеров',
+                'verbose_name_plural': 'Таблицы лидеров',
+                'indexes': [models.Index(fields=['category', 'period', 'period_start', '-streak', 'user'], name='lb_streak_idx'), models.Index(fields=['category', 'period', 'period_start', '-completion_rate', 'user'], name='lb_rate_idx'), models.Index(fields=['category', 'period', 'period_start', '-completed_challenges', 'user'], name='lb_completed_idx')],
+                'unique_together': {('user', 'category', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# Схема индекса на момент этой миграции - намеренно копия, а не импорт из
+# challenges.search: миграция должна работать так же и после его изменений.
+# Индекс синхронизируют сигналы, триггеров нет.
+CREATE_SQL = """
+CREATE VIRTUAL TABLE challenges_search USING fts5(
+    owner, kind UNINDEXED, object_id UNINDEXED, challenge_id UNINDEXED, title, body,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+
+FILL_SQL = [
+    """
+    INSERT INTO challenges_search (rowid, owner, kind, object_id, challenge_id, title, body)
+    SELECT c.id * 2, 'u' || uc.user_id, 'checkin', c.id, c.user_challenge_id, '', c.notes
+    FROM challenges_dailycheckin c JOIN challenges_userchallenge uc ON uc.id = c.user_challenge_id
+    WHERE c.notes != ''
+    """,
+    """
+    INSERT INTO challenges_search (rowid, owner, kind, object_id, challenge_id, title, body)
+    SELECT uc.id * 2 + 1, 'u' || uc.user_id, 'challenge', uc.id, uc.id,
+           COALESCE(t.title, uc.custom_title), uc.custom_description || char(10) || uc.notes
+    FROM challenges_userchallenge uc LEFT JOIN challenges_challengetemplate t ON t.id = uc.template_id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        if not any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall()):
+            # Без FTS5 поиск работает через LIKE
+            return
+        cursor.execute(CREATE_SQL)
+        for sql in FILL_SQL:
+            cursor.execute(sql)
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS challenges_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0009_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userchallenge',
+            name='stats_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Статистика изменена'),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='stats_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Статистика изменена'),
+        ),
+    ]
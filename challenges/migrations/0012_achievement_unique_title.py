@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:34
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_achievements(apps, schema_editor):
+    """Оставляет самую раннюю запись каждого достижения пользователя"""
+    Achievement = apps.get_model('challenges', 'Achievement')
+    keep = Achievement.objects.values('user', 'title').annotate(first=Min('id')).order_by().values_list('first', flat=True)
+    Achievement.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0011_stats_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_achievements, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='achievement',
+            constraint=models.UniqueConstraint(fields=('user', 'title'), name='unique_achievement_per_user_title'),
+        ),
+    ]
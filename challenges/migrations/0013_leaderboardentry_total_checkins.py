@@ -0,0 +1,44 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:42
+
+from django.db import migrations, models
+from django.db.models import Case, F, Q, When
+
+
+def fill_total_checkins(apps, schema_editor):
+    """Число отметок в существующих строках - по тем же правилам, что и completed_checkins"""
+    LeaderboardEntry = apps.get_model('challenges', 'LeaderboardEntry')
+    DailyCheckin = apps.get_model('challenges', 'DailyCheckin')
+
+    category = Case(
+        When(user_challenge__template__isnull=False, then=F('user_challenge__template__category')),
+        default=F('user_challenge__custom_category'),
+    )
+    for entry in LeaderboardEntry.objects.iterator():
+        checkins = DailyCheckin.objects.filter(user_challenge__user_id=entry.user_id).annotate(challenge_category=category)
+        if entry.period_start:
+            checkins = checkins.filter(date__gte=entry.period_start)
+        if entry.category == 'other':
+            # Челленджи без категории попадают в строку "other"
+            checkins = checkins.filter(
+                Q(challenge_category='other') | Q(challenge_category='') | Q(challenge_category__isnull=True)
+            )
+        elif entry.category:
+            checkins = checkins.filter(challenge_category=entry.category)
+        entry.total_checkins = checkins.count()
+        entry.save(update_fields=['total_checkins'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0012_achievement_unique_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='total_checkins',
+            field=models.PositiveIntegerField(default=0, verbose_name='Всего отметок'),
+        ),
+        migrations.RunPython(fill_total_checkins, migrations.RunPython.noop),
+    ]
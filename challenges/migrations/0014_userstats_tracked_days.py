@@ -0,0 +1,35 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_tracked_days(apps, schema_editor):
+    """Число дней с отметками в существующих сводках - одним запросом"""
+    UserStats = apps.get_model('challenges', 'UserStats')
+    DailyCheckin = apps.get_model('challenges', 'DailyCheckin')
+
+    days = dict(
+        DailyCheckin.objects.values('user_challenge__user_id').annotate(days=Count('date', distinct=True))
+        .order_by().values_list('user_challenge__user_id', 'days')
+    )
+    summaries = list(UserStats.objects.filter(user_id__in=days))
+    for summary in summaries:
+        summary.tracked_days = days[summary.user_id]
+    UserStats.objects.bulk_update(summaries, ['tracked_days'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0013_leaderboardentry_total_checkins'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='tracked_days',
+            field=models.IntegerField(default=0, verbose_name='Дней с любыми отметками'),
+        ),
+        migrations.RunPython(fill_tracked_days, migrations.RunPython.noop),
+    ]
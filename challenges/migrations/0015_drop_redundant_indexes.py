@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-18 10:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('challenges', '0014_userstats_tracked_days'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='achievement',
+            name='achv_user_type_title_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='dailycheckin',
+            name='checkin_completed_idx',
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Case, F, FloatField, Func, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Least, Round
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
@@ -41,6 +43,79 @@ class ChallengeTemplate(models.Model):
         return '⭐' * self.difficulty
 
 
+class DaysBetween(Func):
+    """Число дней от даты start до даты end (end - start) на стороне БД"""
+    output_field = IntegerField()
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    
+    def __init__(self, start, end, **extra):
+        super().__init__(end, start, **extra)
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context
+        )
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)', arg_joiner=', ', **extra_context)
+
+
+class UserChallengeQuerySet(models.QuerySet):
+    def with_progress(self, today=None):
+        """
+        Добавляет вычисляемые в БД поля: название, категорию и длительность
+        (из шаблона или кастомные), прошедшие дни и проценты прогресса.
+        Шаблон подтягивается тем же запросом, а по полям можно сортировать
+        и фильтровать. Свойства модели берут значения из этих аннотаций.
+        """
+        today = today or timezone.now().date()
+        days = DaysBetween('start_date', Value(today, output_field=models.DateField())) + 1
+        return self.select_related('template').annotate(
+            effective_title=Case(
+                When(template__isnull=False, then=F('template__title')),
+                default=F('custom_title'),
+            ),
+            effective_category=Case(
+                When(template__isnull=False, then=F('template__category')),
+                default=F('custom_category'),
+            ),
+            effective_duration=Coalesce('custom_duration', 'template__duration_days'),
+        ).annotate(
+            days_elapsed=Case(
+                When(start_date__isnull=True, then=Value(0)),
+                When(Q(effective_duration__isnull=True) | Q(effective_duration=0), then=days),
+                default=Greatest(Value(0), Least(days, F('effective_duration'))),
+                output_field=IntegerField(),
+            ),
+        ).annotate(
+            progress_value=Case(
+                When(effective_duration__gt=0, then=Least(Value(100), F('days_elapsed') * 100 / F('effective_duration'))),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            completion_value=Case(
+                When(effective_duration__gt=0, then=Least(Value(100), F('completed_days') * 100 / F('effective_duration'))),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            display_progress_value=Case(
+                When(
+                    effective_duration__gt=0, completed_days__gt=0,
+                    then=Least(
+                        Value(100.0),
+                        Round(Cast('completed_days', FloatField()) * 100 / F('effective_duration'), 1),
+                    ),
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
+
+
 class UserChallenge(models.Model):
     STATUS_CHOICES = [
         ('active', 'Активен'),
@@ -70,14 +145,26 @@ class UserChallenge(models.Model):
     
     start_date = models.DateField(default=timezone.now, verbose_name="Дата начала")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active', verbose_name="Статус")
+    # Счетчики ведутся сигналами отметок (streaks.py); current_streak - серия,
+    # которая заканчивается в last_completed_date
     current_streak = models.IntegerField(default=0, verbose_name="Текущая серия")
+    longest_streak = models.IntegerField(default=0, verbose_name="Лучшая серия")
+    last_completed_date = models.DateField(null=True, blank=True, verbose_name="Последний выполненный день")
     completed_days = models.IntegerField(default=0, verbose_name="Выполнено дней")
     notes = models.TextField(blank=True, verbose_name="Заметки")
+    # Время последней записи отметок или челленджа - валидатор API статистики
+    stats_updated_at = models.DateTimeField(default=timezone.now, verbose_name="Статистика изменена")
+    
+    objects = UserChallengeQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Челлендж пользователя"
         verbose_name_plural = "Челленджи пользователей"
         ordering = ['-start_date']
+        indexes = [
+            # Челленджи пользователя с фильтром по статусу (профиль, общий календарь, сводки)
+            models.Index(fields=['user', 'status', 'start_date'], name='uc_user_status_start_idx'),
+        ]
     
     def __str__(self):
         if self.template:
@@ -85,8 +172,18 @@ class UserChallenge(models.Model):
         else:
             return f"{self.user.username} - {self.custom_title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные статус и категорию, чтобы сигналы видели их смену
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_category = instance.__dict__.get('custom_category')
+        return instance
+    
     @property
     def title(self):
+        if 'effective_title' in self.__dict__:
+            return self.effective_title
         return self.template.title if self.template else self.custom_title
     
     @property
@@ -95,10 +192,14 @@ class UserChallenge(models.Model):
     
     @property
     def category(self):
+        if 'effective_category' in self.__dict__:
+            return self.effective_category
         return self.template.category if self.template else self.custom_category
     
     @property
     def duration_days(self):
+        if 'effective_duration' in self.__dict__:
+            return self.effective_duration
         return self.template.duration_days if self.template else self.custom_duration
     
     @property
@@ -110,11 +211,20 @@ class UserChallenge(models.Model):
     @property 
     def days_passed(self):
         """Сколько дней прошло с начала челленджа"""
+        if 'days_elapsed' in self.__dict__:
+            return self.days_elapsed
         if self.start_date:
             days = (timezone.now().date() - self.start_date).days + 1
             return max(0, min(days, self.duration_days)) if self.duration_days else days
         return 0
     
+    @property
+    def active_streak(self):
+        """Текущая серия; обнуляется, если вчера и сегодня дни не выполнены"""
+        if self.last_completed_date and (timezone.now().date() - self.last_completed_date).days <= 1:
+            return self.current_streak
+        return 0
+    
     @property
     def days_left(self):
         if self.end_date:
@@ -123,12 +233,16 @@ class UserChallenge(models.Model):
     
     @property
     def progress_percentage(self):
+        if 'progress_value' in self.__dict__:
+            return self.progress_value
         if self.duration_days:
             return min(100, int((self.days_passed / self.duration_days) * 100))
         return 0
     
     @property
     def completion_percentage(self):
+        if 'completion_value' in self.__dict__:
+            return self.completion_value
         if self.duration_days and self.duration_days > 0:
             return min(100, int((self.completed_days / self.duration_days) * 100))
         return 0
@@ -136,6 +250,8 @@ class UserChallenge(models.Model):
     @property
     def display_progress_percentage(self):
         """Корректный процент для отображения"""
+        if 'display_progress_value' in self.__dict__:
+            return self.display_progress_value
         try:
             if self.duration_days and self.duration_days > 0:
                 if self.completed_days > 0:
@@ -188,12 +304,39 @@ class DailyCheckin(models.Model):
     class Meta:
         verbose_name = "Ежедневная отметка"
         verbose_name_plural = "Ежедневные отметки"
+        # Индекс unique_together (user_challenge, date) обслуживает и выборки
+        # выполненных отметок челленджа и дня
         unique_together = ['user_challenge', 'date']
         ordering = ['-date']
     
     def __str__(self):
         status = "✅" if self.is_completed else "❌"
         return f"{self.user_challenge} - {self.date} {status}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное состояние, чтобы сигналы видели переключения
+        instance._loaded_state = (instance.__dict__.get('date'), instance.__dict__.get('is_completed'))
+        return instance
+
+
+class ActivityDay(models.Model):
+    """День, в который у пользователя есть хотя бы одна выполненная отметка"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_days', verbose_name="Пользователь")
+    date = models.DateField(verbose_name="Дата")
+    completed_checkins = models.PositiveIntegerField(default=1, verbose_name="Выполнено отметок")
+    streak = models.PositiveIntegerField(default=1, verbose_name="Серия дней на эту дату")
+    
+    class Meta:
+        verbose_name = "День активности"
+        verbose_name_plural = "Дни активности"
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.date} ({self.streak})"
 
 
 class Achievement(models.Model):
@@ -219,6 +362,10 @@ class Achievement(models.Model):
         verbose_name = "Достижение"
         verbose_name_plural = "Достижения"
         ordering = ['-earned_date']
+        constraints = [
+            # Параллельные проверки не должны выдать одно достижение дважды
+            models.UniqueConstraint(fields=['user', 'title'], name='unique_achievement_per_user_title'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -233,4 +380,116 @@ class Achievement(models.Model):
         """Процент выполнения"""
         if self.target > 0:
             return min(100, int((self.progress / self.target) * 100))
-        return 100
\ No newline at end of file
+        return 100
+
+
+class UserStats(models.Model):
+    """Сводные счетчики пользователя, обновляемые при каждой записи"""
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats_summary', verbose_name="Пользователь")
+    total_challenges = models.IntegerField(default=0, verbose_name="Всего челленджей")
+    active_challenges = models.IntegerField(default=0, verbose_name="Активных челленджей")
+    completed_challenges = models.IntegerField(default=0, verbose_name="Завершенных челленджей")
+    failed_challenges = models.IntegerField(default=0, verbose_name="Проваленных челленджей")
+    total_checkins = models.IntegerField(default=0, verbose_name="Всего отметок")
+    completed_checkins = models.IntegerField(default=0, verbose_name="Выполненных отметок")
+    active_days = models.IntegerField(default=0, verbose_name="Дней с выполненными отметками")
+    tracked_days = models.IntegerField(default=0, verbose_name="Дней с любыми отметками")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+    # Время последней записи отметок или челленджей пользователя - валидатор API статистики
+    stats_updated_at = models.DateTimeField(default=timezone.now, verbose_name="Статистика изменена")
+    
+    class Meta:
+        verbose_name = "Сводка пользователя"
+        verbose_name_plural = "Сводки пользователей"
+    
+    def __str__(self):
+        return f"{self.user.username} - сводка"
+    
+    @property
+    def days_since_join(self):
+        return (timezone.now() - self.user.date_joined).days
+
+
+class Job(models.Model):
+    """Фоновая задача, выполняемая командой run_jobs"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs', verbose_name="Пользователь")
+    kind = models.CharField(max_length=50, verbose_name="Тип задачи")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Данные")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.IntegerField(default=3, verbose_name="Максимум попыток")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Не раньше")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    messages = models.JSONField(default=list, blank=True, verbose_name="Сообщения для пользователя")
+    delivered = models.BooleanField(default=False, verbose_name="Сообщения показаны")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+    
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ['-created_at']
+        constraints = [
+            # Дедупликация: одна ожидающая задача каждого типа на пользователя
+            models.UniqueConstraint(
+                fields=['user', 'kind'],
+                condition=Q(status='pending'),
+                name='unique_pending_job_per_user_kind',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} для {self.user.username} ({self.status})"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Показатели пользователя в таблицах лидеров за период и по категории
+    (пустая категория - все челленджи). Строки обновляются дельтами при
+    отметках и смене статуса челленджа и пересобираются командой
+    rebuild_leaderboards (leaderboard.py).
+    """
+    
+    PERIOD_CHOICES = [
+        ('week', 'Неделя'),
+        ('month', 'Месяц'),
+        ('all', 'Все время'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_entries', verbose_name="Пользователь")
+    category = models.CharField(max_length=20, blank=True, verbose_name="Категория")
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, verbose_name="Период")
+    period_start = models.DateField(null=True, blank=True, verbose_name="Начало периода")
+    streak = models.PositiveIntegerField(default=0, verbose_name="Текущая серия")
+    completion_rate = models.FloatField(null=True, blank=True, verbose_name="Доля выполненных отметок, %")
+    completed_challenges = models.PositiveIntegerField(default=0, verbose_name="Завершено челленджей")
+    total_checkins = models.PositiveIntegerField(default=0, verbose_name="Всего отметок")
+    completed_checkins = models.PositiveIntegerField(default=0, verbose_name="Выполнено отметок")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+    
+    class Meta:
+        verbose_name = "Строка таблицы лидеров"
+        verbose_name_plural = "Таблицы лидеров"
+        unique_together = ['user', 'category', 'period']
+        indexes = [
+            # По индексу на показатель: страница таблицы и место пользователя
+            # читаются по индексу без сортировки всей таблицы
+            models.Index(fields=['category', 'period', 'period_start', '-streak', 'user'], name='lb_streak_idx'),
+            models.Index(fields=['category', 'period', 'period_start', '-completion_rate', 'user'], name='lb_rate_idx'),
+            models.Index(fields=['category', 'period', 'period_start', '-completed_challenges', 'user'], name='lb_completed_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.period} {self.category or 'все'}"
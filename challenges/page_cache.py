@@ -0,0 +1,143 @@
+# page_cache.py
+"""
+Кеш страниц пользователя с версионированием.
+
+У каждого пользователя есть версия данных, которую сигналы меняют при
+любой записи отметок, челленджей и достижений. Версия входит в ключ
+страницы, поэтому после изменения старые записи просто перестают
+читаться и вытесняются по таймауту - удалять их не нужно.
+
+Версию меняют и другие процессы - воркеры gunicorn и run_jobs, поэтому
+кеш страниц работает только с бэкендом, общим для процессов (например,
+файловым - CHALLENGES_CACHE_DIR). С кешем в памяти процесса страницы
+не кешируются: иначе они оставались бы устаревшими до таймаута.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+VERSION_KEY = 'challenges:user-version:{}'
+PAGE_KEY = 'challenges:page:{user_id}:{version}:{digest}'
+HITS_KEY = 'challenges:page-cache:hits'
+MISSES_KEY = 'challenges:page-cache:misses'
+
+# Бэкенды, записи которых видны только в своем процессе
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def _new_version():
+    # Случайное значение, а не счетчик: версия, вытесненная из кеша,
+    # не совпадет ни с одной прежней
+    return uuid.uuid4().hex[:16]
+
+
+def get_user_version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_user_version(user_id):
+    """Делает недействительными все закешированные страницы пользователя"""
+    cache.set(VERSION_KEY.format(user_id), _new_version(), timeout=None)
+
+
+def invalidate_user_pages(user_id):
+    """
+    Меняет версию сразу (чтобы страницы в той же транзакции видели изменения)
+    и еще раз после коммита - на случай, если параллельный запрос успел
+    закешировать страницу со старыми данными до коммита.
+    """
+    bump_user_version(user_id)
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def page_cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 3) if total else 0.0,
+    }
+
+
+def reset_page_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def page_cache_enabled():
+    """Кеш страниц включен таймаутом и кеш по умолчанию общий для процессов"""
+    if not getattr(settings, 'CHALLENGES_PAGE_CACHE_TIMEOUT', 3600):
+        return False
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _page_key(request):
+    user = request.user
+    # Страницы содержат формы, поэтому ключ зависит от CSRF-секрета сессии;
+    # дата - потому что серии и календари считаются от сегодняшнего дня;
+    # дата регистрации - чтобы не спутать пользователя с новым с тем же id
+    parts = [
+        request.get_full_path(),
+        request.META.get('CSRF_COOKIE', ''),
+        timezone.now().date().isoformat(),
+        user.date_joined.isoformat(),
+    ]
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return PAGE_KEY.format(user_id=user.pk, version=get_user_version(user.pk), digest=digest)
+
+
+def cache_user_page(view):
+    """Кеширует GET-ответы представления до изменения данных пользователя"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            not page_cache_enabled()
+            or request.method != 'GET'
+            or not request.user.is_authenticated
+            or not request.META.get('CSRF_COOKIE')
+            # Страница с флеш-сообщениями одноразовая
+            or len(messages.get_messages(request))
+        ):
+            return view(request, *args, **kwargs)
+
+        key = _page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            _count(HITS_KEY)
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Page-Cache'] = 'hit'
+            return response
+
+        _count(MISSES_KEY)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not len(messages.get_messages(request)):
+            cache.set(key, (response.content, response['Content-Type']), getattr(settings, 'CHALLENGES_PAGE_CACHE_TIMEOUT', 3600))
+        response['X-Page-Cache'] = 'miss'
+        return response
+    return wrapper
@@ -0,0 +1,77 @@
+# pagination.py
+"""
+Постраничный вывод по ключу (keyset) вместо OFFSET.
+
+Следующая страница начинается после значений сортировки последней строки
+предыдущей: WHERE (a, b, id) "после" (va, vb, vid) ORDER BY a, b, id LIMIT n.
+База не перебирает пропущенные строки, поэтому цена страницы зависит от
+ее размера, а не от длины истории. Курсор - подписанные значения вместе
+с сортировкой; подделанный или чужой курсор просто открывает первую страницу.
+"""
+from dataclasses import dataclass
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+PAGE_SIZE = 20
+
+CURSOR_SALT = 'challenges.pagination'
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class _CursorSerializer(signing.JSONSerializer):
+    def dumps(self, obj):
+        return DjangoJSONEncoder(separators=(',', ':')).encode(obj).encode('latin-1')
+
+
+def encode_cursor(ordering, values):
+    return signing.dumps({'order': ordering, 'after': values}, salt=CURSOR_SALT, serializer=_CursorSerializer)
+
+
+def decode_cursor(cursor, ordering):
+    """Значения курсора; None, если курсор подделан или выдан для другой сортировки"""
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get('order') != list(ordering):
+        return None
+    return data.get('after')
+
+
+def _after(ordering, values):
+    """Условие "строка после values" для сортировки ordering ('-поле' - по убыванию)"""
+    condition = Q()
+    for position, name in enumerate(ordering):
+        step = Q(**{f"{name.lstrip('-')}__{'lt' if name.startswith('-') else 'gt'}": values[position]})
+        for previous, value in zip(ordering[:position], values[:position]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """
+    Страница queryset в порядке ordering. Последнее поле ordering должно
+    быть уникальным (обычно pk), а остальные - не NULL.
+    """
+    values = decode_cursor(cursor, ordering) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(_after(ordering, values))
+
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    if len(rows) <= page_size:
+        return KeysetPage(rows)
+    rows = rows[:page_size]
+    last = rows[-1]
+    return KeysetPage(rows, encode_cursor(ordering, [getattr(last, name.lstrip('-')) for name in ordering]))
@@ -0,0 +1,54 @@
+# routers.py
+"""
+Маршрутизация чтения тяжелых страниц на отдельное соединение только для чтения.
+
+Страницы статистики, достижений и списки в админке читают через алиас
+READ_ONLY_DB (SQLite, открытый с mode=ro), чтобы долгие запросы аналитики
+не делили соединение с путем записи. Все записи, в том числе сделанные
+внутри таких страниц, идут в default.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+READ_ONLY_DB = 'readonly'
+
+_use_read_only = ContextVar('use_read_only', default=False)
+
+
+@contextmanager
+def read_only_db():
+    """Направляет чтение внутри блока на READ_ONLY_DB"""
+    token = _use_read_only.set(True)
+    try:
+        yield
+    finally:
+        _use_read_only.reset(token)
+
+
+def read_only_view(view):
+    """Представление читает данные через READ_ONLY_DB"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with read_only_db():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReadOnlyRouter:
+    def db_for_read(self, model, **hints):
+        if _use_read_only.get() and READ_ONLY_DB in settings.DATABASES:
+            return READ_ONLY_DB
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Оба алиаса смотрят на одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ONLY_DB
@@ -0,0 +1,259 @@
+# search.py
+"""
+Полнотекстовый поиск по дневнику пользователя: заметкам отметок, названиям,
+описаниям и заметкам челленджей.
+
+В SQLite это виртуальная таблица FTS5 challenges_search, одна на оба вида
+записей, чтобы bm25 ранжировал их вместе: rowid = id * 2 для отметки и
+id * 2 + 1 для челленджа. Колонка owner хранит токен "u<id пользователя>":
+поиск фильтрует по ней внутри MATCH и не перебирает чужие совпадения.
+
+Индекс обновляют сигналы сохранения и удаления (signals.py), а массовые
+пути без сигналов - пакетные отметки, импорт, seed_demo - вызывают
+reindex_checkins/reindex_challenges сами. Триггеров нет, поэтому
+миграции моделей индекс не затрагивают. Команда
+`manage.py rebuild_search_index` строит индекс заново. Без FTS5 (другая
+база или SQLite без модуля) поиск работает через LIKE.
+"""
+import re
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import DailyCheckin, UserChallenge
+
+TABLE = 'challenges_search'
+
+CREATE_SQL = f"""
+CREATE VIRTUAL TABLE {TABLE} USING fts5(
+    owner, kind UNINDEXED, object_id UNINDEXED, challenge_id UNINDEXED, title, body,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+
+# {where} - дополнительное условие по id, пустое при полном заполнении
+CHECKIN_ROWS_SQL = f"""
+INSERT INTO {TABLE} (rowid, owner, kind, object_id, challenge_id, title, body)
+SELECT c.id * 2, 'u' || uc.user_id, 'checkin', c.id, c.user_challenge_id, '', c.notes
+FROM challenges_dailycheckin c JOIN challenges_userchallenge uc ON uc.id = c.user_challenge_id
+WHERE c.notes != '' {{where}}
+"""
+
+CHALLENGE_ROWS_SQL = f"""
+INSERT INTO {TABLE} (rowid, owner, kind, object_id, challenge_id, title, body)
+SELECT uc.id * 2 + 1, 'u' || uc.user_id, 'challenge', uc.id, uc.id,
+       COALESCE(t.title, uc.custom_title), uc.custom_description || char(10) || uc.notes
+FROM challenges_userchallenge uc LEFT JOIN challenges_challengetemplate t ON t.id = uc.template_id
+WHERE 1 {{where}}
+"""
+
+ROWIDS = {
+    'checkin': (CHECKIN_ROWS_SQL, 'c.id', lambda pk: pk * 2),
+    'challenge': (CHALLENGE_ROWS_SQL, 'uc.id', lambda pk: pk * 2 + 1),
+}
+
+# Маркеры подсветки: в заметках их не бывает, поэтому после escape() их
+# можно безопасно заменить на <mark>
+MARK_START, MARK_END = '\x02', '\x03'
+
+MAX_WORDS = 8
+
+# Колонки owner, kind, object_id, challenge_id, title, body: название весит
+# вдвое больше текста, служебные колонки в ранжировании не участвуют
+RANK_SQL = f'bm25({TABLE}, 0, 0, 0, 0, 2.0, 1.0)'
+
+# Сколько id подставлять в один запрос
+CHUNK_SIZE = 500
+
+_available = set()
+
+
+def fts5_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def install_search_index(connection):
+    """Пересоздает индекс и заполняет его по данным; False, если FTS5 нет"""
+    if not fts5_supported(connection):
+        return False
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        cursor.execute(CREATE_SQL)
+        cursor.execute(CHECKIN_ROWS_SQL.format(where=''))
+        cursor.execute(CHALLENGE_ROWS_SQL.format(where=''))
+    _available.discard(connection.alias)
+    return True
+
+
+def search_available(connection):
+    """Есть ли индекс в базе. Запоминается только положительный ответ"""
+    if connection.alias in _available:
+        return True
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+        found = cursor.fetchone() is not None
+    if found:
+        _available.add(connection.alias)
+    return found
+
+
+def index_ready():
+    """Есть ли индекс в базе, из которой сейчас читаются отметки"""
+    return search_available(connections[router.db_for_read(DailyCheckin) or 'default'])
+
+
+def _write_connection():
+    connection = connections[router.db_for_write(DailyCheckin) or 'default']
+    return connection if search_available(connection) else None
+
+
+def _reindex(kind, ids, insert):
+    connection = _write_connection()
+    if connection is None:
+        return
+    rows_sql, id_column, rowid = ROWIDS[kind]
+    ids = sorted(set(ids))
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', [rowid(pk) for pk in chunk])
+            if insert:
+                cursor.execute(rows_sql.format(where=f'AND {id_column} IN ({placeholders})'), chunk)
+
+
+def reindex_checkins(ids):
+    """Переписывает строки индекса отметок по их текущим данным"""
+    _reindex('checkin', ids, insert=True)
+
+
+def reindex_challenges(ids):
+    _reindex('challenge', ids, insert=True)
+
+
+def unindex(kind, ids):
+    """Удаляет строки индекса удаленных объектов ('checkin' или 'challenge')"""
+    _reindex(kind, ids, insert=False)
+
+
+def query_words(query):
+    return re.findall(r'\w+', query.lower())[:MAX_WORDS]
+
+
+def build_match(query, user_id=None):
+    """
+    Выражение MATCH: все слова запроса как префиксы в названии или тексте.
+    Слова берутся в кавычки, поэтому операторы FTS5 из ввода не действуют.
+    """
+    words = query_words(query)
+    if not words:
+        return None
+    expression = '{title body}:(' + ' AND '.join(f'"{word}"*' for word in words) + ')'
+    if user_id is not None:
+        expression = f'owner:u{user_id} AND {expression}'
+    return expression
+
+
+def _highlight(text):
+    return mark_safe(escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def _search_fts(connection, user, match, limit):
+    sql = (
+        f"SELECT kind, object_id, {RANK_SQL}, "
+        f"highlight({TABLE}, 4, %s, %s), snippet({TABLE}, 5, %s, %s, '…', 16) "
+        f"FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY 3 LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [MARK_START, MARK_END, MARK_START, MARK_END, match, limit])
+        rows = cursor.fetchall()
+
+    ids = {'checkin': [], 'challenge': []}
+    for kind, object_id, *_ in rows:
+        ids[kind].append(object_id)
+    checkins = DailyCheckin.objects.filter(user_challenge__user=user).select_related(
+        'user_challenge__template'
+    ).in_bulk(ids['checkin'])
+    challenges = UserChallenge.objects.filter(user=user).select_related('template').in_bulk(ids['challenge'])
+
+    results = []
+    # Сниппет берется из текста: при MATCH с фильтром по owner функция
+    # snippet() без номера колонки выбрала бы саму колонку owner
+    for kind, object_id, rank, title, snippet in rows:
+        if kind == 'checkin':
+            checkin = checkins.get(object_id)
+            if checkin is None:
+                continue
+            results.append({
+                'kind': kind, 'challenge': checkin.user_challenge, 'checkin': checkin,
+                'rank': rank, 'title': escape(checkin.user_challenge.title), 'snippet': _highlight(snippet),
+            })
+        elif object_id in challenges:
+            results.append({
+                'kind': kind, 'challenge': challenges[object_id], 'checkin': None,
+                'rank': rank, 'title': _highlight(title), 'snippet': _highlight(snippet),
+            })
+    return results
+
+
+def _search_like(user, words, limit):
+    """Запасной путь без FTS5: все слова встречаются хотя бы в одном из полей"""
+    challenge_filter = Q()
+    checkin_filter = Q()
+    for word in words:
+        challenge_filter &= (
+            Q(template__title__icontains=word) | Q(custom_title__icontains=word)
+            | Q(custom_description__icontains=word) | Q(notes__icontains=word)
+        )
+        checkin_filter &= Q(notes__icontains=word)
+
+    challenges = UserChallenge.objects.filter(challenge_filter, user=user).select_related('template')[:limit]
+    checkins = DailyCheckin.objects.filter(checkin_filter, user_challenge__user=user).select_related(
+        'user_challenge__template'
+    ).order_by('-date')[:limit]
+    results = [
+        {'kind': 'challenge', 'challenge': challenge, 'checkin': None, 'rank': None,
+         'title': escape(challenge.title), 'snippet': escape(challenge.notes or challenge.description)}
+        for challenge in challenges
+    ]
+    results += [
+        {'kind': 'checkin', 'challenge': checkin.user_challenge, 'checkin': checkin, 'rank': None,
+         'title': escape(checkin.user_challenge.title), 'snippet': escape(checkin.notes)}
+        for checkin in checkins
+    ]
+    return results[:limit]
+
+
+def search_user(user, query, limit=50):
+    """
+    Поиск по челленджам и отметкам пользователя, лучшие совпадения первыми.
+    Результат - словари kind ('challenge'/'checkin'), challenge, checkin,
+    rank, title и snippet (HTML с <mark> вокруг найденных слов).
+    """
+    words = query_words(query)
+    if not words:
+        return []
+    if index_ready():
+        connection = connections[router.db_for_read(DailyCheckin) or 'default']
+        return _search_fts(connection, user, build_match(query, user.pk), limit)
+    return _search_like(user, words, limit)
+
+
+def matching_ids(kind, query):
+    """
+    Подзапрос id объектов вида kind, подходящих под запрос, - для фильтра
+    pk__in в админке. None, если индекса нет или в запросе нет слов.
+    """
+    match = build_match(query)
+    if match is None or not index_ready():
+        return None
+    return RawSQL(f'SELECT object_id FROM {TABLE} WHERE {TABLE} MATCH %s AND kind = %s', [match, kind])
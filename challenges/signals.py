@@ -0,0 +1,233 @@
+# signals.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .activity import sync_activity_day
+from .leaderboard import adjust_entries, challenge_deltas, checkin_deltas, completion_deltas, last_day
+from .models import Achievement, ChallengeTemplate, DailyCheckin, UserChallenge
+from .page_cache import invalidate_user_pages
+from .search import reindex_challenges, reindex_checkins, unindex
+from .streaks import apply_checkin_change
+from .summary import adjust_user_stats, status_deltas, touch_stats, tracked_days_delta
+
+
+# Массовые операции отключают построчное обновление производных данных
+# и пересчитывают их один раз через summary.refresh_derived_data
+_suppressed = ContextVar('derived_updates_suppressed', default=False)
+
+
+@contextmanager
+def suppress_derived_updates():
+    """Отключает обработчики сигналов на время массовой операции"""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def _deleting_user(origin):
+    """Удаляется сам пользователь - его производные данные удалятся каскадом"""
+    if isinstance(origin, QuerySet):
+        return origin.model is User
+    return isinstance(origin, User)
+
+
+def _deleting_challenge(origin):
+    """Удаляется сам челлендж - его счетчики обновлять незачем"""
+    if isinstance(origin, QuerySet):
+        return origin.model is UserChallenge
+    return isinstance(origin, UserChallenge)
+
+
+def _update_streaks(checkin, previous, current):
+    """
+    Счетчики челленджа за O(1) и те же значения - в загруженный челлендж
+    отметки, чтобы его последующий save() не затер их старыми
+    """
+    fields = apply_checkin_change(checkin.user_challenge_id, previous, current)
+    if fields and DailyCheckin.user_challenge.is_cached(checkin):
+        for name, value in fields.items():
+            setattr(checkin.user_challenge, name, value)
+
+
+@receiver(post_save, sender=DailyCheckin)
+def checkin_saved(sender, instance, created, raw=False, **kwargs):
+    """Обновляет счетчики челленджа, индекс дней активности и сводку, если отметка переключилась"""
+    if raw:
+        return
+
+    previous = getattr(instance, '_loaded_state', None)
+    current = (instance.date, instance.is_completed)
+    instance._loaded_state = current
+    if previous == current or _suppressed.get():
+        return
+
+    was_completed = bool(previous and previous[1])
+    affected_days = set()
+    if was_completed:
+        affected_days.add(previous[0])
+    if instance.is_completed:
+        affected_days.add(instance.date)
+
+    user_id = instance.user_challenge.user_id
+    with transaction.atomic():
+        _update_streaks(instance, previous, current)
+        active_days = sum(sync_activity_day(user_id, day) for day in affected_days)
+        tracked_days = 0
+        if previous is None or previous[0] != instance.date:
+            tracked_days = tracked_days_delta(
+                user_id, [instance.date], [previous[0]] if previous else [], exclude=instance.pk
+            )
+        adjust_user_stats(
+            user_id,
+            total_checkins=1 if created else 0,
+            completed_checkins=int(instance.is_completed) - int(was_completed),
+            active_days=active_days,
+            tracked_days=tracked_days,
+        )
+        adjust_entries(user_id, {instance.user_challenge.category: checkin_deltas(previous, current)})
+
+
+@receiver(post_delete, sender=DailyCheckin)
+def checkin_deleted(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin) or _suppressed.get():
+        return
+
+    user_id = instance.user_challenge.user_id
+    with transaction.atomic():
+        if not _deleting_challenge(origin):
+            _update_streaks(instance, (instance.date, instance.is_completed), None)
+        active_days = sync_activity_day(user_id, instance.date) if instance.is_completed else 0
+        adjust_user_stats(
+            user_id,
+            total_checkins=-1,
+            completed_checkins=-int(instance.is_completed),
+            active_days=active_days,
+            tracked_days=tracked_days_delta(user_id, removed=[instance.date]),
+        )
+        if not _deleting_challenge(origin):
+            adjust_entries(user_id, {
+                instance.user_challenge.category: checkin_deltas((instance.date, instance.is_completed), None)
+            })
+
+
+@receiver(post_save, sender=UserChallenge)
+def challenge_saved(sender, instance, created, raw=False, **kwargs):
+    """Обновляет счетчики челленджей в сводке"""
+    if raw:
+        return
+
+    previous_status = None if created else getattr(instance, '_loaded_status', instance.status)
+    previous_category = getattr(instance, '_loaded_category', instance.custom_category)
+    instance._loaded_status = instance.status
+    instance._loaded_category = instance.custom_category
+    if _suppressed.get():
+        return
+    deltas = status_deltas(previous_status, instance.status)
+    if created:
+        deltas['total_challenges'] = 1
+    adjust_user_stats(instance.user_id, **deltas)
+
+    board = {}
+    if instance.template_id is None and not created and previous_category != instance.custom_category:
+        # Отметки челленджа переезжают в строки новой категории
+        board[previous_category] = challenge_deltas(instance, status=previous_status)
+        board[instance.custom_category] = challenge_deltas(instance, sign=1)
+    elif previous_status != instance.status and (not created or instance.status == 'completed'):
+        # Серия в строках зависит от статуса, поэтому обновляется при любой смене
+        board[instance.category] = completion_deltas(
+            last_day(instance.start_date, instance.duration_days), previous_status, instance.status
+        )
+    adjust_entries(instance.user_id, board)
+
+
+@receiver(pre_delete, sender=UserChallenge)
+def challenge_deleting(sender, instance, origin=None, **kwargs):
+    """Вклад челленджа в таблицы лидеров - пока его отметки еще в базе"""
+    if _deleting_user(origin) or _suppressed.get():
+        return
+    instance._leaderboard_deltas = {instance.category: challenge_deltas(instance)}
+
+
+@receiver(post_delete, sender=UserChallenge)
+def challenge_deleted(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin) or _suppressed.get():
+        return
+
+    deltas = status_deltas(instance.status, None)
+    deltas['total_challenges'] = -1
+    adjust_user_stats(instance.user_id, **deltas)
+    adjust_entries(instance.user_id, getattr(instance, '_leaderboard_deltas', None))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserChallenge)
+@receiver(post_delete, sender=UserChallenge)
+@receiver(post_save, sender=DailyCheckin)
+@receiver(post_delete, sender=DailyCheckin)
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def user_data_changed(sender, instance, raw=False, origin=None, **kwargs):
+    """
+    Сбрасывает кеш страниц пользователя после любого изменения его данных
+    и отмечает время изменения статистики
+    """
+    if raw or _deleting_user(origin) or _suppressed.get():
+        return
+
+    if sender is User:
+        user_id = instance.pk
+    elif sender is DailyCheckin:
+        user_id = instance.user_challenge.user_id
+    else:
+        user_id = instance.user_id
+    invalidate_user_pages(user_id)
+
+    # Оценки и заметки тоже в статистике, поэтому отмечается любая запись
+    if sender is DailyCheckin:
+        touch_stats([user_id], [] if _deleting_challenge(origin) else [instance.user_challenge_id])
+    elif sender is UserChallenge:
+        touch_stats([user_id], [] if kwargs.get('signal') is post_delete else [instance.pk])
+
+
+# Поисковый индекс (search.py) обновляется и при подавленных обработчиках:
+# массовые операции без сигналов переиндексируют свои строки сами, а
+# удаления с сигналами должны убрать строки удаленных объектов
+
+@receiver(post_save, sender=DailyCheckin)
+def checkin_indexed(sender, instance, created, raw=False, **kwargs):
+    # У новой отметки без заметок в индексе нечего писать
+    if raw or (created and not instance.notes):
+        return
+    reindex_checkins([instance.pk])
+
+
+@receiver(post_save, sender=UserChallenge)
+def challenge_indexed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reindex_challenges([instance.pk])
+
+
+@receiver(post_save, sender=ChallengeTemplate)
+def template_indexed(sender, instance, created, raw=False, **kwargs):
+    """Название челленджа по шаблону берется из шаблона"""
+    if raw or created:
+        return
+    reindex_challenges(UserChallenge.objects.filter(template=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=DailyCheckin)
+def checkin_unindexed(sender, instance, **kwargs):
+    unindex('checkin', [instance.pk])
+
+
+@receiver(post_delete, sender=UserChallenge)
+def challenge_unindexed(sender, instance, **kwargs):
+    unindex('challenge', [instance.pk])
@@ -0,0 +1,166 @@
+# stats_api.py
+"""
+Данные статистики для клиентских графиков (JSON API, версия API_VERSION).
+
+В отличие от analytics.py здесь нет pandas и plotly: клиенту отдаются
+только ряды по датам и сводные числа. Валидатор ответа (ETag и
+Last-Modified) - это stats_updated_at челленджа или сводки пользователя,
+которые отмечаются при каждой записи отметок (summary.touch_stats).
+Поэтому повторный запрос без изменений получает 304 после чтения одной
+строки, не обращаясь к таблице отметок.
+"""
+from collections import deque
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .activity import current_streak, longest_streak
+from .models import ActivityDay, UserChallenge, UserStats
+from .summary import get_user_stats
+
+API_VERSION = 1
+
+# Окно скользящих показателей, в днях
+ROLLING_DAYS = 7
+
+
+def validator(updated_at, today):
+    """
+    (ETag, Last-Modified) ответа. Серии и "сегодняшние" показатели зависят
+    от даты, поэтому с началом нового дня ответ считается измененным.
+    """
+    day_start = timezone.make_aware(datetime.combine(today, time.min))
+    etag = f'"v{API_VERSION}-{today:%Y%m%d}-{int(updated_at.timestamp() * 1_000_000)}"'
+    return etag, max(updated_at, day_start)
+
+
+def challenge_updated_at(user, challenge_id):
+    """Время изменения статистики челленджа пользователя; None, если челленджа нет"""
+    return UserChallenge.objects.filter(pk=challenge_id, user=user).values_list('stats_updated_at', flat=True).first()
+
+
+def user_updated_at(user):
+    updated_at = UserStats.objects.filter(user=user).values_list('stats_updated_at', flat=True).first()
+    if updated_at is None:
+        updated_at = get_user_stats(user).stats_updated_at
+    return updated_at
+
+
+def rolling(dates, values, days=ROLLING_DAYS, average=True):
+    """
+    Скользящее среднее (или сумма) values за days календарных дней,
+    заканчивая каждой датой. None в values не учитываются; в окне без
+    значений среднее - None.
+    """
+    window = deque()
+    total = count = 0
+    result = []
+    for day, value in zip(dates, values):
+        window.append((day, value))
+        if value is not None:
+            total += value
+            count += 1
+        while window[0][0] <= day - timedelta(days=days):
+            _, old = window.popleft()
+            if old is not None:
+                total -= old
+                count -= 1
+        if not average:
+            result.append(total)
+        else:
+            result.append(round(total / count, 2) if count else None)
+    return result
+
+
+def challenge_payload(user_challenge):
+    """Ряды отметок челленджа по датам и сводные числа - один запрос к отметкам"""
+    rows = list(user_challenge.checkins.order_by('date').values_list('date', 'is_completed', 'rating'))
+    dates = [day for day, _, _ in rows]
+    completed = [is_completed for _, is_completed, _ in rows]
+    ratings = [rating for _, _, rating in rows]
+
+    rated = [rating for rating in ratings if rating]
+    completed_days = sum(completed)
+    return {
+        'version': API_VERSION,
+        'challenge': {
+            'id': user_challenge.pk,
+            'title': user_challenge.title,
+            'category': user_challenge.category,
+            'status': user_challenge.status,
+            'start_date': user_challenge.start_date,
+            'duration': user_challenge.duration_days,
+        },
+        'series': {
+            'dates': dates,
+            'completed': completed,
+            'ratings': ratings,
+            f'completion_rate_{ROLLING_DAYS}d': rolling(dates, [100 if flag else 0 for flag in completed]),
+            f'rating_{ROLLING_DAYS}d': rolling(dates, ratings),
+        },
+        'summary': {
+            'total_days': len(rows),
+            'completed_days': completed_days,
+            'completion_rate': round(completed_days * 100 / len(rows), 1) if rows else 0,
+            'avg_rating': round(sum(rated) / len(rated), 2) if rated else None,
+            'current_streak': user_challenge.active_streak,
+            'max_streak': user_challenge.longest_streak,
+        },
+    }
+
+
+def overall_payload(user, today=None):
+    """
+    Ряд дней активности пользователя (из ActivityDay), показатели по
+    челленджам одним агрегирующим запросом и числа из сводки
+    """
+    today = today or timezone.now().date()
+    summary = get_user_stats(user)
+
+    days = list(ActivityDay.objects.filter(user=user).order_by('date').values_list('date', 'completed_checkins', 'streak'))
+    dates = [day for day, _, _ in days]
+    checkins = [completed for _, completed, _ in days]
+
+    challenges = UserChallenge.objects.with_progress(today).filter(user=user).annotate(
+        total_days=Count('checkins'),
+        completed_count=Count('checkins', filter=Q(checkins__is_completed=True)),
+    ).order_by('-start_date', '-pk').values(
+        'pk', 'effective_title', 'effective_category', 'status', 'start_date',
+        'current_streak', 'longest_streak', 'total_days', 'completed_count',
+    )
+    return {
+        'version': API_VERSION,
+        'series': {
+            'dates': dates,
+            'completed_checkins': checkins,
+            'streaks': [streak for _, _, streak in days],
+            f'completed_checkins_{ROLLING_DAYS}d': rolling(dates, checkins, average=False),
+        },
+        'challenges': [
+            {
+                'id': row['pk'],
+                'title': row['effective_title'],
+                'category': row['effective_category'],
+                'status': row['status'],
+                'start_date': row['start_date'],
+                'total_days': row['total_days'],
+                'completed_days': row['completed_count'],
+                'completion_rate': round(row['completed_count'] * 100 / row['total_days'], 1) if row['total_days'] else 0,
+                'current_streak': row['current_streak'],
+                'max_streak': row['longest_streak'],
+            }
+            for row in challenges
+        ],
+        'summary': {
+            'total_challenges': summary.total_challenges,
+            'active_challenges': summary.active_challenges,
+            'completed_challenges': summary.completed_challenges,
+            'failed_challenges': summary.failed_challenges,
+            'total_checkins': summary.total_checkins,
+            'completed_checkins': summary.completed_checkins,
+            'active_days': summary.active_days,
+            'current_streak': current_streak(user, today),
+            'longest_streak': longest_streak(user),
+        },
+    }
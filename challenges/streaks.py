@@ -0,0 +1,114 @@
+# streaks.py
+"""
+Серии выполненных дней челленджа.
+
+UserChallenge хранит completed_days, current_streak, longest_streak и
+last_completed_date. Сигналы отметок обновляют их за O(1): новый
+выполненный день после последнего продолжает или начинает серию, снятие
+отметки с последнего дня укорачивает ее. Только правка прошлого дня
+не по порядку требует полного пересчета по отметкам челленджа.
+"""
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from .models import DailyCheckin, UserChallenge
+
+STREAK_FIELDS = ['completed_days', 'current_streak', 'longest_streak', 'last_completed_date']
+
+ONE_DAY = timedelta(days=1)
+
+
+def compute_streaks(dates):
+    """Счетчики серий по возрастающим датам выполненных дней"""
+    completed = streak = longest = 0
+    last = None
+    for day in dates:
+        streak = streak + 1 if last is not None and day == last + ONE_DAY else 1
+        longest = max(longest, streak)
+        last = day
+        completed += 1
+    return {
+        'completed_days': completed,
+        'current_streak': streak,
+        'longest_streak': longest,
+        'last_completed_date': last,
+    }
+
+
+def rebuild_challenge_streaks(challenge_ids):
+    """Полный пересчет по отметкам - одним запросом на все челленджи"""
+    challenge_ids = list(challenge_ids)
+    if not challenge_ids:
+        return {}
+    values = {pk: compute_streaks([]) for pk in challenge_ids}
+    rows = DailyCheckin.objects.filter(
+        user_challenge_id__in=challenge_ids, is_completed=True
+    ).order_by('user_challenge_id', 'date').values_list('user_challenge_id', 'date')
+    for pk, group in groupby(rows.iterator(), key=itemgetter(0)):
+        values[pk] = compute_streaks(day for _, day in group)
+
+    UserChallenge.objects.bulk_update(
+        [UserChallenge(pk=pk, **fields) for pk, fields in values.items()],
+        STREAK_FIELDS,
+        batch_size=500,
+    )
+    return values
+
+
+def _step(current, day, completed):
+    """
+    Новые счетчики после того, как день day стал выполненным (completed)
+    или перестал им быть; None - изменение не по порядку, нужен пересчет.
+    """
+    streak, longest, last = current['current_streak'], current['longest_streak'], current['last_completed_date']
+    if completed:
+        if last is not None and day <= last:
+            return None
+        streak = streak + 1 if last is not None and day == last + ONE_DAY else 1
+        return {
+            'completed_days': current['completed_days'] + 1,
+            'current_streak': streak,
+            'longest_streak': max(longest, streak),
+            'last_completed_date': day,
+        }
+
+    # Снятие последнего дня длинной серии: предыдущий день тоже выполнен.
+    # Если серия была лучшей, неизвестно, нет ли другой такой же - пересчет.
+    if day != last or streak <= 1 or streak >= longest:
+        return None
+    return {
+        'completed_days': current['completed_days'] - 1,
+        'current_streak': streak - 1,
+        'longest_streak': longest,
+        'last_completed_date': day - ONE_DAY,
+    }
+
+
+def apply_checkin_change(challenge_id, previous, current):
+    """
+    Обновляет счетчики челленджа после изменения отметки. previous и
+    current - (дата, выполнено) до и после; None - отметки не было или
+    она удалена. Возвращает новые значения полей или None, если челлендж
+    не изменился.
+    """
+    was_completed = previous is not None and previous[1]
+    is_completed = current is not None and current[1]
+    if not was_completed and not is_completed:
+        return None
+
+    fields = None
+    if was_completed != is_completed:
+        day = current[0] if is_completed else previous[0]
+        counters = UserChallenge.objects.filter(pk=challenge_id).values(*STREAK_FIELDS).first()
+        if counters is None:
+            return None
+        fields = _step(counters, day, is_completed)
+    elif previous[0] == current[0]:
+        return None
+
+    if fields is None:
+        # Перенос выполненного дня на другую дату или правка прошлого дня
+        return rebuild_challenge_streaks([challenge_id])[challenge_id]
+    UserChallenge.objects.filter(pk=challenge_id).update(**fields)
+    return fields
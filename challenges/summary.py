@@ -0,0 +1,164 @@
+# summary.py
+"""
+Денормализованная сводка пользователя (UserStats).
+
+Счетчики меняются на дельту в той же транзакции, что и запись отметки
+или челленджа (см. signals.py). Если строки сводки еще нет, она
+строится с нуля по данным при первом чтении - этим же путем работает
+команда rebuild_user_stats для ремонта.
+"""
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .activity import rebuild_activity_days
+from .leaderboard import refresh_user_entries
+from .models import ActivityDay, DailyCheckin, UserChallenge, UserStats
+from .page_cache import invalidate_user_pages
+
+# Статусы челленджей, для которых в сводке есть отдельный счетчик
+STATUS_COUNTERS = {
+    'active': 'active_challenges',
+    'completed': 'completed_challenges',
+    'failed': 'failed_challenges',
+}
+
+SUMMARY_FIELDS = [
+    'total_challenges', 'active_challenges', 'completed_challenges', 'failed_challenges',
+    'total_checkins', 'completed_checkins', 'active_days', 'tracked_days',
+]
+
+
+def status_deltas(old_status, new_status):
+    """Изменения счетчиков при смене статуса челленджа"""
+    deltas = {}
+    if old_status in STATUS_COUNTERS:
+        deltas[STATUS_COUNTERS[old_status]] = -1
+    if new_status in STATUS_COUNTERS:
+        field = STATUS_COUNTERS[new_status]
+        deltas[field] = deltas.get(field, 0) + 1
+    return {field: delta for field, delta in deltas.items() if delta}
+
+
+def tracked_days_delta(user_id, added=(), removed=(), exclude=None):
+    """
+    Изменение числа дней с отметками: добавленный день новый, если других
+    отметок (кроме exclude) в нем нет, а удаленный день уходит, если в нем
+    отметок не осталось. Один запрос по дням изменения
+    """
+    field = DailyCheckin._meta.get_field('date')
+    added = {field.to_python(day) for day in added}
+    removed = {field.to_python(day) for day in removed}
+    if not added and not removed:
+        return 0
+    checkins = DailyCheckin.objects.filter(user_challenge__user_id=user_id, date__in=added | removed)
+    if exclude is not None:
+        checkins = checkins.exclude(pk=exclude)
+    present = set(checkins.order_by().values_list('date', flat=True).distinct())
+    return len(added - present) - len(removed - present)
+
+
+def adjust_user_stats(user_id, **deltas):
+    """
+    Атомарно применяет дельты к счетчикам сводки. Если строки сводки еще
+    нет, ничего не делает: get_user_stats построит ее по актуальным данным.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        UserStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+
+
+def touch_stats(user_ids, challenge_ids=()):
+    """
+    Отмечает запись отметок или челленджей: по stats_updated_at API
+    статистики отвечает 304 Not Modified, не читая отметки
+    """
+    when = timezone.now()
+    if challenge_ids:
+        UserChallenge.objects.filter(pk__in=list(challenge_ids)).update(stats_updated_at=when)
+    UserStats.objects.filter(user_id__in=list(user_ids)).update(stats_updated_at=when)
+    return when
+
+
+def rebuild_user_stats(user_ids=None):
+    """Пересчитывает сводки с нуля (все или для указанных пользователей)"""
+    challenges = UserChallenge.objects.all()
+    checkins = DailyCheckin.objects.all()
+    days = ActivityDay.objects.all()
+    if user_ids is not None:
+        challenges = challenges.filter(user_id__in=user_ids)
+        checkins = checkins.filter(user_challenge__user_id__in=user_ids)
+        days = days.filter(user_id__in=user_ids)
+
+    summaries = {}
+
+    def summary_for(user_id):
+        if user_id not in summaries:
+            summaries[user_id] = UserStats(user_id=user_id)
+        return summaries[user_id]
+
+    # Существующие строки пересчитываются всегда: сводка пользователя без
+    # челленджей и отметок обнуляется, а не сохраняет старые счетчики
+    if user_ids is None:
+        user_ids = UserStats.objects.values_list('user_id', flat=True)
+    for user_id in user_ids:
+        summary_for(user_id)
+
+    for row in challenges.values('user_id').annotate(
+        total=Count('id'),
+        **{field: Count('id', filter=Q(status=status)) for status, field in STATUS_COUNTERS.items()}
+    ).order_by():
+        summary = summary_for(row['user_id'])
+        summary.total_challenges = row['total']
+        for field in STATUS_COUNTERS.values():
+            setattr(summary, field, row[field])
+
+    for row in checkins.values('user_challenge__user_id').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(is_completed=True)),
+        days=Count('date', distinct=True),
+    ).order_by():
+        summary = summary_for(row['user_challenge__user_id'])
+        summary.total_checkins = row['total']
+        summary.completed_checkins = row['completed']
+        summary.tracked_days = row['days']
+
+    for row in days.values('user_id').annotate(total=Count('id')).order_by():
+        summary_for(row['user_id']).active_days = row['total']
+
+    UserStats.objects.bulk_create(
+        summaries.values(),
+        update_conflicts=True,
+        unique_fields=['user'],
+        # Пересчет - тоже изменение: у новых объектов stats_updated_at = сейчас
+        update_fields=SUMMARY_FIELDS + ['updated_at', 'stats_updated_at'],
+        batch_size=500,
+    )
+    return len(summaries)
+
+
+def get_user_stats(user):
+    """Сводка пользователя; при отсутствии строится по данным"""
+    summary = UserStats.objects.filter(user=user).first()
+    if summary is None:
+        rebuild_user_stats([user.pk])
+        summary = UserStats.objects.get(user=user)
+    summary.user = user
+    return summary
+
+
+def refresh_derived_data(user_ids):
+    """
+    Пересчитывает индекс дней активности, сводки и строки таблиц лидеров
+    указанных пользователей и сбрасывает их кеш страниц - после массовых
+    операций без сигналов.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    rebuild_activity_days(user_ids)
+    rebuild_user_stats(user_ids)
+    for user_id in user_ids:
+        refresh_user_entries(user_id)
+        invalidate_user_pages(user_id)
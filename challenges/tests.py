@@ -1,7 +1,44 @@
-from django.test import TestCase
+import gzip
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sqlite3
+import sys
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.crypto import get_random_string
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from unittest import mock, skipUnless
+
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.contrib.admin import site
+from django.contrib.staticfiles import finders
+from django.test.utils import CaptureQueriesContext
+from django.db import OperationalError, connection, connections, transaction
 from django.contrib.auth.models import User
-from .models import ChallengeTemplate, UserChallenge, DailyCheckin
+from .models import ChallengeTemplate, UserChallenge, DailyCheckin, Achievement, ActivityDay, UserStats, Job, LeaderboardEntry
+from .activity import current_streak, longest_streak, rebuild_activity_days
+from .summary import SUMMARY_FIELDS, get_user_stats, rebuild_user_stats
+from .routers import READ_ONLY_DB, read_only_db
+from .page_cache import VERSION_KEY, page_cache_stats
+from .metrics import store as metrics_store
+from .leaderboard import MAX_PAGE, compute_user_entries, leaderboard_page, user_rank
+from .search import build_match, fts5_supported, search_user
+from .imports import CheckinImporter
+from .jobs import JOB_HANDLERS, claim_next_job, enqueue, run_job
+from .checkins import save_checkins_batch
+from .achievements import METRICS, evaluate_achievements, EVENT_CHECKIN, EVENT_STATUS, EVENT_CHALLENGE
 from django.utils import timezone
+from datetime import timedelta
+from .management.commands.check_query_plans import full_scans
+from challengehub.sqlite.base import DatabaseWrapper as ProductionSQLiteWrapper
 
 class ChallengeModelTests(TestCase):
     def setUp(self):
@@ -44,4 +81,1300 @@ class ViewTests(TestCase):
     
     def test_challenge_list(self):
         response = self.client.get('/challenges/')
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+class AchievementEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='achiever', password='testpass123')
+        self.challenge = UserChallenge.objects.create(
+            user=self.user,
+            custom_title='Бег',
+            custom_category='sport',
+            custom_duration=30,
+            start_date=timezone.now().date()
+        )
+
+    def test_checkin_unlocks_first_step_once(self):
+        DailyCheckin.objects.create(
+            user_challenge=self.challenge,
+            date=timezone.now().date(),
+            is_completed=True
+        )
+
+        unlocked = evaluate_achievements(self.user, {EVENT_CHECKIN})
+        self.assertEqual([a.title for a in unlocked], ['Первый шаг'])
+
+        self.assertEqual(evaluate_achievements(self.user, {EVENT_CHECKIN}), [])
+        self.assertEqual(Achievement.objects.filter(user=self.user).count(), 1)
+
+    def test_only_rules_for_given_events_are_checked(self):
+        self.challenge.status = 'completed'
+        self.challenge.save()
+
+        self.assertEqual(evaluate_achievements(self.user, {EVENT_CHECKIN}), [])
+        unlocked = evaluate_achievements(self.user, {EVENT_STATUS})
+        self.assertIn('Первый успех', [a.title for a in unlocked])
+
+    def test_earned_achievements_are_not_recreated(self):
+        evaluate_achievements(self.user, {EVENT_CHALLENGE})
+        Achievement.objects.create(user=self.user, type='streak', title='Первый шаг', description='')
+        earned = Achievement.objects.get(user=self.user, title='Первый шаг')
+
+        DailyCheckin.objects.create(user_challenge=self.challenge, is_completed=True)
+        self.assertEqual(evaluate_achievements(self.user, {EVENT_CHECKIN}), [])
+        self.assertTrue(Achievement.objects.filter(pk=earned.pk).exists())
+
+    def test_concurrent_evaluation_does_not_duplicate(self):
+        DailyCheckin.objects.create(user_challenge=self.challenge, date=timezone.now().date(), is_completed=True)
+        has_checkins = METRICS['has_checkins']
+
+        def race(user, summary):
+            # Параллельная проверка успела записать то же достижение после чтения полученных
+            Achievement.objects.create(user=user, type='streak', title='Первый шаг', description='')
+            return has_checkins(user, summary)
+
+        with mock.patch.dict(METRICS, {'has_checkins': race}):
+            unlocked = evaluate_achievements(self.user, {EVENT_CHECKIN})
+        self.assertEqual(Achievement.objects.filter(user=self.user, title='Первый шаг').count(), 1)
+        # Выданное параллельной проверкой достижение не сообщается как новое
+        self.assertEqual(unlocked, [])
+
+    def test_daily_checkin_view_reports_only_new_achievements(self):
+        self.client.force_login(self.user)
+        url = f'/my-challenges/{self.challenge.pk}/checkin/'
+
+        response = self.client.post(url, {'is_completed': 'true', 'rating': '4'}, follow=True)
+        self.assertContains(response, 'Новое достижение: &quot;Первый шаг&quot;')
+
+        response = self.client.post(url, {'is_completed': 'true', 'rating': '5'}, follow=True)
+        self.assertNotContains(response, 'Новое достижение')
+        self.assertEqual(Achievement.objects.filter(user=self.user).count(), 1)
+
+
+class ActivityDayTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='streaker', password='testpass123')
+        self.today = timezone.now().date()
+        self.first = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=30)
+        self.second = UserChallenge.objects.create(user=self.user, custom_title='Чтение', custom_duration=30)
+
+    def checkin(self, challenge, days_ago, is_completed=True):
+        return DailyCheckin.objects.create(
+            user_challenge=challenge,
+            date=self.today - timedelta(days=days_ago),
+            is_completed=is_completed
+        )
+
+    def test_streaks_follow_out_of_order_checkins(self):
+        self.checkin(self.first, 0)
+        self.checkin(self.first, 2)
+        self.assertEqual(current_streak(self.user), 1)
+
+        self.checkin(self.second, 1)
+        self.assertEqual(current_streak(self.user), 3)
+        self.assertEqual(longest_streak(self.user), 3)
+
+    def test_toggle_and_delete_break_the_streak(self):
+        self.checkin(self.first, 0)
+        middle = self.checkin(self.first, 1)
+        self.checkin(self.first, 2)
+        self.assertEqual(current_streak(self.user), 3)
+
+        middle.is_completed = False
+        middle.save()
+        self.assertEqual(current_streak(self.user), 1)
+        self.assertEqual(longest_streak(self.user), 1)
+
+        middle.is_completed = True
+        middle.save()
+        self.assertEqual(current_streak(self.user), 3)
+
+        self.second.delete()
+        self.first.checkins.get(date=self.today).delete()
+        self.assertEqual(current_streak(self.user), 0)
+        self.assertEqual(longest_streak(self.user), 2)
+
+    def test_day_with_two_challenges_counts_once(self):
+        self.checkin(self.first, 0)
+        self.checkin(self.second, 0)
+        self.first.checkins.get().delete()
+        self.assertEqual(ActivityDay.objects.get(user=self.user).completed_checkins, 1)
+        self.assertEqual(current_streak(self.user), 1)
+
+    def test_rebuild_matches_incremental_index(self):
+        for days_ago in (0, 1, 2, 5, 6):
+            self.checkin(self.first, days_ago)
+        expected = list(ActivityDay.objects.values_list('date', 'streak'))
+
+        rebuild_activity_days([self.user.pk])
+        self.assertEqual(list(ActivityDay.objects.values_list('date', 'streak')), expected)
+
+
+# Счетчики запросов меряют само представление, без кеша страниц
+@override_settings(CHALLENGES_PAGE_CACHE_TIMEOUT=0)
+class CalendarViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='planner', password='testpass123')
+        self.client.force_login(self.user)
+        self.today = timezone.now().date()
+
+    def create_challenge(self, days, completed_days):
+        challenge = UserChallenge.objects.create(
+            user=self.user,
+            custom_title=f'Челлендж на {days} дней',
+            custom_duration=days,
+            start_date=self.today - timedelta(days=days - 1)
+        )
+        DailyCheckin.objects.bulk_create([
+            DailyCheckin(user_challenge=challenge, date=challenge.start_date + timedelta(days=i), is_completed=True)
+            for i in range(completed_days)
+        ])
+        return challenge
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_challenge_calendar_shows_one_month(self):
+        challenge = self.create_challenge(365, 365)
+        response = self.client.get(f'/my-challenges/{challenge.pk}/calendar/')
+        self.assertLessEqual(len(response.context['calendar_data']), 31)
+        self.assertTrue(all(day['is_completed'] for day in response.context['calendar_data']))
+
+        month = challenge.start_date.strftime('%Y-%m')
+        response = self.client.get(f'/my-challenges/{challenge.pk}/calendar/?month={month}')
+        self.assertEqual(response.context['calendar_data'][0]['date'], challenge.start_date)
+        self.assertIsNone(response.context['previous_month'])
+
+    def test_calendar_query_count_does_not_depend_on_length(self):
+        short = self.create_challenge(7, 3)
+        long = self.create_challenge(365, 200)
+        self.assertEqual(
+            self.count_queries(f'/my-challenges/{short.pk}/calendar/'),
+            self.count_queries(f'/my-challenges/{long.pk}/calendar/')
+        )
+
+    def test_combined_calendar_query_count_is_constant(self):
+        self.create_challenge(30, 10)
+        few = self.count_queries('/my-calendar/')
+
+        for days in (60, 90, 120):
+            self.create_challenge(days, days)
+        response = self.client.get('/my-calendar/')
+        self.assertEqual(len(response.context['active_challenges']), 4)
+        self.assertEqual(self.count_queries('/my-calendar/'), few)
+
+
+# Зеркало readonly в TestCase - отдельное соединение, которое не видит данные
+# незакоммиченной транзакции теста, поэтому здесь чтение идет без маршрутизации
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    DATABASE_ROUTERS=[],
+    CHALLENGES_PAGE_CACHE_TIMEOUT=0,
+)
+class StatisticsViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='analyst', password='testpass123')
+        self.client.force_login(self.user)
+        today = timezone.now().date()
+        self.challenge = UserChallenge.objects.create(
+            user=self.user,
+            custom_title='Йога',
+            custom_category='health',
+            custom_duration=10,
+            start_date=today - timedelta(days=4)
+        )
+        for days_ago in range(5):
+            DailyCheckin.objects.create(
+                user_challenge=self.challenge,
+                date=today - timedelta(days=days_ago),
+                is_completed=days_ago != 2,
+                rating=4
+            )
+
+    def test_charts_reference_static_plotly_bundle(self):
+        for url in (f'/my-challenges/{self.challenge.pk}/stats/', '/my-stats/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, '/static/js/plotly.min.js', count=1)
+            self.assertContains(response, 'Plotly.newPlot')
+            # Библиотека не встраивается в страницу
+            self.assertLess(len(response.content), 200_000)
+
+    def test_plotly_bundle_is_found_by_staticfiles(self):
+        self.assertTrue(finders.find('js/plotly.min.js'))
+
+    def test_overall_statistics_numbers(self):
+        other = UserChallenge.objects.create(user=self.user, custom_title='Книги', custom_category='study', custom_duration=5)
+        DailyCheckin.objects.create(user_challenge=other, date=timezone.now().date(), is_completed=True)
+
+        statistics = self.client.get('/my-stats/').context['statistics']
+        self.assertEqual(statistics['total_challenges'], 2)
+        self.assertEqual(statistics['active_challenges'], 2)
+        self.assertEqual(statistics['total_checkins'], 6)
+        self.assertEqual(statistics['total_completed'], 5)
+        # Дни с любыми отметками, в том числе невыполненными
+        self.assertEqual(statistics['total_days_tracked'], 5)
+        self.assertEqual(statistics['avg_completion_rate'], 90.0)
+
+    def test_overall_statistics_query_count_is_constant(self):
+        get_user_stats(self.user)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/my-stats/')
+
+        for i in range(5):
+            challenge = UserChallenge.objects.create(user=self.user, custom_title=f'Челлендж {i}', custom_duration=10)
+            DailyCheckin.objects.bulk_create([
+                DailyCheckin(user_challenge=challenge, date=timezone.now().date() - timedelta(days=d), is_completed=True)
+                for d in range(5)
+            ])
+        with CaptureQueriesContext(connection) as many:
+            self.client.get('/my-stats/')
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_views_do_not_import_pandas_or_plotly(self):
+        script = (
+            'import sys, django\n'
+            'django.setup()\n'
+            'import challengehub.wsgi, challengehub.urls, challenges.views\n'
+            'print(",".join(m for m in ("pandas", "plotly") if m in sys.modules))\n'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='challengehub.settings'),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='counter', password='testpass123')
+        self.today = timezone.now().date()
+
+    def assertSummaryMatchesRebuild(self):
+        summary = UserStats.objects.get(user=self.user)
+        expected = {field: getattr(summary, field) for field in SUMMARY_FIELDS}
+        rebuild_user_stats([self.user.pk])
+        summary.refresh_from_db()
+        self.assertEqual({field: getattr(summary, field) for field in SUMMARY_FIELDS}, expected)
+        return summary
+
+    def test_counters_follow_writes(self):
+        get_user_stats(self.user)
+        challenge = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=10)
+        checkin = DailyCheckin.objects.create(user_challenge=challenge, date=self.today, is_completed=True)
+        DailyCheckin.objects.create(user_challenge=challenge, date=self.today - timedelta(days=1))
+
+        summary = self.assertSummaryMatchesRebuild()
+        self.assertEqual(summary.total_challenges, 1)
+        self.assertEqual(summary.active_challenges, 1)
+        self.assertEqual(summary.total_checkins, 2)
+        self.assertEqual(summary.completed_checkins, 1)
+        self.assertEqual(summary.active_days, 1)
+
+        checkin.is_completed = False
+        checkin.save()
+        challenge.status = 'failed'
+        challenge.save()
+        summary = self.assertSummaryMatchesRebuild()
+        self.assertEqual((summary.active_challenges, summary.failed_challenges), (0, 1))
+        self.assertEqual((summary.completed_checkins, summary.active_days), (0, 0))
+
+        challenge.delete()
+        summary = self.assertSummaryMatchesRebuild()
+        self.assertEqual(summary.total_challenges, 0)
+        self.assertEqual(summary.total_checkins, 0)
+
+    def test_tracked_days_count_days_with_any_checkin(self):
+        get_user_stats(self.user)
+        start = self.today - timedelta(days=5)
+        run = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=10, start_date=start)
+        read = UserChallenge.objects.create(user=self.user, custom_title='Чтение', custom_duration=10, start_date=start)
+        checkin = DailyCheckin.objects.create(user_challenge=run, date=self.today, is_completed=False)
+        DailyCheckin.objects.create(user_challenge=read, date=self.today, is_completed=False)
+        save_checkins_batch(self.user, [(read.pk, self.today - timedelta(days=1), False, None, '')])
+        self.assertEqual(self.assertSummaryMatchesRebuild().tracked_days, 2)
+
+        checkin.date = self.today - timedelta(days=2)
+        checkin.save()
+        self.assertEqual(self.assertSummaryMatchesRebuild().tracked_days, 3)
+        read.delete()
+        self.assertEqual(self.assertSummaryMatchesRebuild().tracked_days, 1)
+
+    def test_summary_is_built_on_first_read(self):
+        challenge = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=10)
+        DailyCheckin.objects.create(user_challenge=challenge, date=self.today, is_completed=True)
+        self.assertFalse(UserStats.objects.filter(user=self.user).exists())
+
+        summary = get_user_stats(self.user)
+        self.assertEqual((summary.total_checkins, summary.active_days), (1, 1))
+
+    def test_deleting_user_removes_everything(self):
+        challenge = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=10)
+        DailyCheckin.objects.create(user_challenge=challenge, date=self.today, is_completed=True)
+        DailyCheckin.objects.create(user_challenge=challenge, date=self.today - timedelta(days=1), is_completed=True)
+        get_user_stats(self.user)
+
+        self.user.delete()
+        self.assertFalse(UserStats.objects.exists())
+        self.assertFalse(ActivityDay.objects.exists())
+
+    def test_rebuild_command(self):
+        UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=10)
+        UserStats.objects.update_or_create(user=self.user, defaults={'total_challenges': 42})
+
+        call_command('rebuild_user_stats', '--user', 'counter', '--activity', stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.user).total_challenges, 1)
+
+    def test_full_rebuild_resets_users_without_data(self):
+        UserStats.objects.create(user=self.user, total_challenges=3, total_checkins=7, active_days=2)
+
+        rebuild_user_stats()
+        summary = UserStats.objects.get(user=self.user)
+        self.assertEqual({field: getattr(summary, field) for field in SUMMARY_FIELDS}, dict.fromkeys(SUMMARY_FIELDS, 0))
+
+
+class UserChallengeProgressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='progress', password='testpass123')
+        self.today = timezone.now().date()
+        self.template = ChallengeTemplate.objects.create(
+            title='Шаблон', description='', category='study', duration_days=20
+        )
+
+    def test_annotations_match_python_properties(self):
+        UserChallenge.objects.create(user=self.user, template=self.template, start_date=self.today - timedelta(days=4), completed_days=3)
+        UserChallenge.objects.create(user=self.user, custom_title='Долгий', custom_category='sport', custom_duration=7,
+                                     start_date=self.today - timedelta(days=30), completed_days=7)
+        UserChallenge.objects.create(user=self.user, custom_title='Будущий', custom_duration=3,
+                                     start_date=self.today + timedelta(days=2))
+        UserChallenge.objects.create(user=self.user, custom_title='Без срока', start_date=self.today - timedelta(days=2))
+
+        fields = ['title', 'category', 'duration_days', 'days_passed', 'progress_percentage',
+                  'completion_percentage', 'display_progress_percentage']
+        for annotated in UserChallenge.objects.with_progress().filter(user=self.user):
+            plain = UserChallenge.objects.get(pk=annotated.pk)
+            for field in fields:
+                self.assertEqual(getattr(annotated, field), getattr(plain, field), f'{plain.custom_title or plain.title}: {field}')
+
+    def test_sorting_and_filtering_on_computed_values(self):
+        UserChallenge.objects.create(user=self.user, template=self.template)
+        UserChallenge.objects.create(user=self.user, custom_title='Альфа', custom_category='study', custom_duration=5)
+        UserChallenge.objects.create(user=self.user, custom_title='Бета', custom_category='sport', custom_duration=50)
+
+        challenges = UserChallenge.objects.with_progress().filter(user=self.user)
+        self.assertEqual([c.title for c in challenges.order_by('effective_title')], ['Альфа', 'Бета', 'Шаблон'])
+        self.assertEqual([c.title for c in challenges.filter(effective_category='study').order_by('-effective_duration')],
+                         ['Шаблон', 'Альфа'])
+
+    def test_profile_query_count_does_not_grow_with_rows(self):
+        self.client.force_login(self.user)
+        UserChallenge.objects.create(user=self.user, template=self.template)
+        self.client.get('/profile/')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/profile/')
+
+        for i in range(5):
+            UserChallenge.objects.create(user=self.user, template=self.template)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/profile/')
+        self.assertContains(response, 'Шаблон')
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+
+@override_settings(CHALLENGES_ASYNC_JOBS=True)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queued', password='testpass123')
+        self.challenge = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=30)
+        self.client.force_login(self.user)
+
+    def test_enqueue_deduplicates_by_user_and_kind(self):
+        enqueue(self.user, 'post_checkin', {'events': [EVENT_CHECKIN], 'challenge_ids': [1]})
+        enqueue(self.user, 'post_checkin', {'events': [EVENT_STATUS, EVENT_CHECKIN], 'challenge_ids': [2]})
+
+        job = Job.objects.get(user=self.user)
+        self.assertEqual(job.payload, {'events': [EVENT_CHECKIN, EVENT_STATUS], 'challenge_ids': [1, 2]})
+
+    def test_checkin_enqueues_work_and_shows_result_on_next_page(self):
+        response = self.client.post(f'/my-challenges/{self.challenge.pk}/checkin/', {'is_completed': 'true'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Achievement.objects.exists())
+        self.assertEqual(Job.objects.get().status, 'pending')
+
+        call_command('run_jobs', '--once', stdout=StringIO())
+        self.assertEqual(Job.objects.get().status, 'done')
+
+        response = self.client.get('/profile/')
+        self.assertContains(response, 'Новое достижение: &quot;Первый шаг&quot;')
+        response = self.client.get('/profile/')
+        self.assertNotContains(response, 'Новое достижение')
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        JOB_HANDLERS['broken'] = lambda user, payload: 1 / 0
+        self.addCleanup(JOB_HANDLERS.pop, 'broken')
+        job = enqueue(self.user, 'broken')
+
+        self.assertFalse(run_job(claim_next_job()))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertIn('ZeroDivisionError', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now(), max_attempts=2)
+        self.assertFalse(run_job(claim_next_job()))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(claim_next_job())
+
+    @override_settings(CHALLENGES_ASYNC_JOBS=False)
+    def test_sync_handler_db_error_keeps_checkin(self):
+        def broken(user, payload):
+            # Ошибка без своей точки сохранения помечает внешнюю транзакцию на откат
+            with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+                cursor.execute('SELECT * FROM no_such_table')
+        original = JOB_HANDLERS['post_checkin']
+        JOB_HANDLERS['post_checkin'] = broken
+        self.addCleanup(JOB_HANDLERS.__setitem__, 'post_checkin', original)
+
+        with self.assertLogs('challenges.jobs', 'ERROR'):
+            response = self.client.post(f'/my-challenges/{self.challenge.pk}/checkin/', {'is_completed': 'true'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(DailyCheckin.objects.filter(user_challenge=self.challenge, is_completed=True).exists())
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    DATABASE_ROUTERS=[],
+)
+class BenchmarkCommandTests(TestCase):
+    def test_seed_demo_builds_consistent_derived_data(self):
+        call_command('seed_demo', '--users', '3', '--challenges', '2', '--days', '20', stdout=StringIO())
+
+        self.assertEqual(User.objects.filter(username__startswith='demo_').count(), 3)
+        self.assertEqual(UserChallenge.objects.count(), 6)
+        for user in User.objects.all():
+            stats = UserStats.objects.get(user=user)
+            completed = DailyCheckin.objects.filter(user_challenge__user=user, is_completed=True)
+            self.assertEqual(stats.completed_checkins, completed.count())
+            self.assertEqual(stats.active_days, ActivityDay.objects.filter(user=user).count())
+
+    def test_bench_views_reports_every_page(self):
+        call_command('seed_demo', '--users', '2', '--challenges', '2', '--days', '10', stdout=StringIO())
+        path = os.path.join(tempfile.mkdtemp(), 'bench.json')
+
+        call_command('bench_views', '--repeat', '2', '--warmup', '1', '--json', path, stdout=StringIO())
+
+        with open(path, encoding='utf-8') as f:
+            views = json.load(f)['views']
+        self.assertIn('overall_stats', views)
+        self.assertNotIn('logout', views)
+        self.assertEqual(views['profile']['status'], 200)
+        self.assertGreater(views['profile']['queries'], 0)
+        self.assertGreater(views['profile']['bytes'], 0)
+
+
+class QueryPlanTests(TestCase):
+    def test_key_queries_use_indexes(self):
+        output = StringIO()
+        call_command('check_query_plans', stdout=output)
+        self.assertIn('Все ключевые запросы используют индексы', output.getvalue())
+
+    def test_full_scan_of_growing_table_is_detected(self):
+        plan = '2 0 0 SCAN challenges_dailycheckin\n5 0 0 SCAN auth_user'
+        self.assertEqual(full_scans(plan), ['challenges_dailycheckin'])
+        self.assertEqual(full_scans('3 0 0 SEARCH challenges_dailycheckin USING INDEX challenges_dailycheckin_user_challenge_id_date_472eea39_uniq'), [])
+
+
+class ProductionSQLiteTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'production.sqlite3')
+        self.wrapper = ProductionSQLiteWrapper({
+            **connection.settings_dict,
+            'ENGINE': 'challengehub.sqlite',
+            'NAME': self.path,
+            'OPTIONS': {'pragmas': {'cache_size': -1000}},
+        }, alias='production')
+        self.addCleanup(self.wrapper.close)
+
+    def test_pragmas_applied_on_connect(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1000)
+
+    def test_immediate_transaction_takes_write_lock_at_begin(self):
+        self.wrapper.immediate_transactions = True
+        self.wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        self.addCleanup(self.wrapper.set_autocommit, True)
+        self.addCleanup(self.wrapper.rollback)
+
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+
+
+class ReadOnlyRoutingTests(TestCase):
+    def test_reads_inside_block_go_to_readonly_alias(self):
+        self.assertEqual(UserChallenge.objects.all().db, 'default')
+        with read_only_db():
+            self.assertEqual(UserChallenge.objects.all().db, READ_ONLY_DB)
+        self.assertEqual(UserChallenge.objects.all().db, 'default')
+
+    def test_writes_stay_on_default(self):
+        user = User.objects.create_user(username='router', password='testpass123')
+        with read_only_db():
+            challenge = UserChallenge(user=user, custom_title='Бег', custom_duration=10)
+            challenge.save()
+        self.assertEqual(challenge._state.db, 'default')
+        self.assertTrue(UserChallenge.objects.filter(pk=challenge.pk).exists())
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    CHALLENGES_PAGE_CACHE_TIMEOUT=0,
+)
+class ReadOnlyViewTests(TransactionTestCase):
+    """
+    Страницы с read_only_view при включенном маршрутизаторе. Данные
+    коммитятся, чтобы их видело отдельное соединение только для чтения.
+    """
+    databases = {'default', READ_ONLY_DB}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='firstvisit', password='testpass123')
+        challenge = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=10)
+        DailyCheckin.objects.create(user_challenge=challenge, date=timezone.now().date(), is_completed=True)
+        # Первый визит: сводки еще нет, страница построит ее сама
+        UserStats.objects.filter(user=self.user).delete()
+        self.client.force_login(self.user)
+
+    def test_first_visit_builds_summary_and_reads_from_readonly(self):
+        with CaptureQueriesContext(connections[READ_ONLY_DB]) as readonly_queries:
+            response = self.client.get('/my-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['statistics']['total_checkins'], 1)
+        self.assertTrue(readonly_queries.captured_queries)
+        self.assertEqual(UserStats.objects.using('default').get(user=self.user).total_checkins, 1)
+
+    def test_achievements_and_json_api_on_first_visit(self):
+        self.assertEqual(self.client.get('/achievements/').status_code, 200)
+        UserStats.objects.filter(user=self.user).delete()
+        response = self.client.get('/api/v1/my-stats/')
+        self.assertEqual(response.json()['summary']['total_checkins'], 1)
+
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class PageCacheTests(TestCase):
+    def setUp(self):
+        # Кеш страниц работает только с кешем, общим для процессов
+        self.cache_settings = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.mkdtemp(),
+        }}
+        shared_cache = override_settings(CACHES=self.cache_settings)
+        shared_cache.enable()
+        self.addCleanup(shutil.rmtree, self.cache_settings['default']['LOCATION'], ignore_errors=True)
+        self.addCleanup(shared_cache.disable)
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='testpass123')
+        self.challenge = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=30)
+        self.client.force_login(self.user)
+        self.client.cookies['csrftoken'] = get_random_string(32)
+
+    def test_second_request_is_served_from_cache(self):
+        self.assertEqual(self.client.get('/achievements/')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get('/achievements/')['X-Page-Cache'], 'hit')
+        self.assertEqual(page_cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_checkin_invalidates_user_pages(self):
+        self.client.get('/profile/')
+        self.assertEqual(self.client.get('/profile/')['X-Page-Cache'], 'hit')
+
+        DailyCheckin.objects.create(user_challenge=self.challenge, date=timezone.now().date(), is_completed=True)
+        self.assertEqual(self.client.get('/profile/')['X-Page-Cache'], 'miss')
+
+        self.client.get('/profile/')
+        self.challenge.custom_title = 'Плавание'
+        self.challenge.save()
+        response = self.client.get('/profile/')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Плавание')
+
+    def test_pages_are_not_shared_between_users(self):
+        self.client.get('/achievements/')
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_login(other)
+        self.client.cookies['csrftoken'] = get_random_string(32)
+        response = self.client.get('/achievements/')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'other')
+
+    def test_version_bumped_by_another_process(self):
+        self.assertEqual(self.client.get('/achievements/')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get('/achievements/')['X-Page-Cache'], 'hit')
+        self.assertTrue(os.listdir(self.cache_settings['default']['LOCATION']))
+
+        # Другой экземпляр кеша с тем же каталогом - как воркер run_jobs
+        other_process = FileBasedCache(self.cache_settings['default']['LOCATION'], {})
+        other_process.set(VERSION_KEY.format(self.user.pk), 'from-worker', timeout=None)
+        self.assertEqual(self.client.get('/achievements/')['X-Page-Cache'], 'miss')
+
+    def test_process_local_cache_is_not_used(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.client.get('/achievements/')
+            self.assertNotIn('X-Page-Cache', self.client.get('/achievements/'))
+
+
+class CleanupChallengesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cleaner', password='testpass123')
+        old_start = timezone.now().date() - timedelta(days=60)
+        self.old = []
+        for status in ('completed', 'failed', 'completed'):
+            challenge = UserChallenge.objects.create(
+                user=self.user, custom_title='Старый', custom_duration=10, start_date=old_start, status=status
+            )
+            for offset in range(3):
+                DailyCheckin.objects.create(
+                    user_challenge=challenge, date=old_start + timedelta(days=offset), is_completed=True
+                )
+            self.old.append(challenge)
+        self.recent = UserChallenge.objects.create(user=self.user, custom_title='Новый', custom_duration=10)
+        DailyCheckin.objects.create(user_challenge=self.recent, date=timezone.now().date(), is_completed=True)
+        get_user_stats(self.user)
+
+    def test_dry_run_deletes_nothing(self):
+        output = StringIO()
+        call_command('cleanup_challenges', '--dry-run', '--batch-size', '2', stdout=output)
+        self.assertIn('Будет удалено 3 челленджей и 9 отметок за 2 пакетов', output.getvalue())
+        self.assertEqual(UserChallenge.objects.count(), 4)
+
+    def test_deletes_in_batches_and_archives(self):
+        path = os.path.join(tempfile.mkdtemp(), 'archive.jsonl.gz')
+        output = StringIO()
+        call_command('cleanup_challenges', '--batch-size', '2', '--sleep', '0', '--archive', path, stdout=output)
+
+        self.assertIn('Пакет 2: удалено 1 челленджей и 3 отметок', output.getvalue())
+        self.assertEqual(list(UserChallenge.objects.all()), [self.recent])
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(sum(row['type'] == 'challenge' for row in rows), 3)
+        self.assertEqual(sum(row['type'] == 'checkin' for row in rows), 9)
+
+        # Производные данные пересчитаны так же, как при построчном удалении
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.total_challenges, stats.total_checkins, stats.active_days), (1, 1, 1))
+        self.assertEqual(ActivityDay.objects.filter(user=self.user).count(), 1)
+
+
+class BatchCheckinTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='batcher', password='testpass123')
+        self.client.force_login(self.user)
+        self.today = timezone.now().date()
+        start = self.today - timedelta(days=5)
+        self.run = UserChallenge.objects.create(user=self.user, custom_title='Бег', custom_duration=30, start_date=start)
+        self.read = UserChallenge.objects.create(user=self.user, custom_title='Чтение', custom_duration=30, start_date=start)
+        get_user_stats(self.user)
+
+    def post(self, items):
+        return self.client.post('/my-challenges/checkins/', json.dumps({'items': items}), content_type='application/json')
+
+    def test_upserts_many_challenges_and_days(self):
+        DailyCheckin.objects.create(user_challenge=self.run, date=self.today, is_completed=False)
+        yesterday = (self.today - timedelta(days=1)).isoformat()
+        response = self.post([
+            {'challenge': self.run.pk, 'date': self.today.isoformat(), 'is_completed': True, 'rating': 5},
+            {'challenge': self.run.pk, 'date': yesterday, 'is_completed': True},
+            {'challenge': self.read.pk, 'is_completed': True, 'notes': 'Глава 3'},
+        ])
+
+        self.assertEqual(response.json(), {'created': 2, 'updated': 1})
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.completed_days, 2)
+        self.assertEqual(DailyCheckin.objects.get(user_challenge=self.read).notes, 'Глава 3')
+
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.total_checkins, stats.completed_checkins, stats.active_days), (3, 3, 2))
+        self.assertEqual(current_streak(self.user), 2)
+        self.assertTrue(Achievement.objects.filter(user=self.user, title='Первый шаг').exists())
+
+    def test_foreign_challenge_rejects_whole_batch(self):
+        other = User.objects.create_user(username='stranger', password='testpass123')
+        foreign = UserChallenge.objects.create(user=other, custom_title='Чужой', custom_duration=30)
+        response = self.post([
+            {'challenge': self.run.pk, 'is_completed': True},
+            {'challenge': foreign.pk, 'is_completed': True},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'Челлендж {foreign.pk} не найден или не активен', response.json()['errors'])
+        self.assertFalse(DailyCheckin.objects.exists())
+
+    def test_invalid_items_are_reported(self):
+        tomorrow = (self.today + timedelta(days=1)).isoformat()
+        response = self.post([
+            {'challenge': self.run.pk, 'date': tomorrow},
+            {'challenge': self.run.pk, 'rating': 9},
+            {'challenge': self.run.pk},
+            {'challenge': self.run.pk},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 3)
+
+    def test_booleans_are_not_ids_or_ratings(self):
+        response = self.post([{'challenge': True}, {'challenge': self.run.pk, 'rating': True}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 2)
+
+    def test_unhashable_rating_is_a_validation_error(self):
+        response = self.post([{'challenge': self.run.pk, 'rating': [4]}, {'challenge': self.run.pk, 'rating': {}}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], ['#0: rating должен быть от 1 до 5', '#1: rating должен быть от 1 до 5'])
+
+    def test_save_errors_are_not_reported_as_bad_json(self):
+        with mock.patch('challenges.views.save_checkins_batch', side_effect=ValueError('сбой записи')):
+            with self.assertRaisesMessage(ValueError, 'сбой записи'):
+                self.post([{'challenge': self.run.pk}])
+
+    def test_concurrent_insert_returns_conflict(self):
+        def race(objs, **kwargs):
+            # Параллельный запрос вставил ту же отметку между проверкой и вставкой
+            DailyCheckin.objects.create(user_challenge=self.run, date=self.today, is_completed=False)
+            return original(objs, **kwargs)
+        original = DailyCheckin.objects.bulk_create
+        with mock.patch.object(DailyCheckin.objects, 'bulk_create', race):
+            response = self.post([{'challenge': self.run.pk, 'is_completed': True}])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(DailyCheckin.objects.exists())
+
+
+class ExpireChallengesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='expiring', password='testpass123')
+        today = timezone.now().date()
+        self.done = UserChallenge.objects.create(
+            user=self.user, custom_title='Готово', custom_duration=3,
+            start_date=today - timedelta(days=5), completed_days=3
+        )
+        self.missed = UserChallenge.objects.create(
+            user=self.user, custom_title='Пропуски', custom_duration=3,
+            start_date=today - timedelta(days=5), completed_days=1
+        )
+        self.last_day = UserChallenge.objects.create(
+            user=self.user, custom_title='Последний день', custom_duration=3,
+            start_date=today - timedelta(days=2)
+        )
+        get_user_stats(self.user)
+
+    def test_expires_only_challenges_past_their_end_date(self):
+        call_command('expire_challenges', '--batch-size', '1', stdout=StringIO())
+
+        statuses = dict(UserChallenge.objects.values_list('custom_title', 'status'))
+        self.assertEqual(statuses, {'Готово': 'completed', 'Пропуски': 'failed', 'Последний день': 'active'})
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.active_challenges, stats.completed_challenges, stats.failed_challenges), (1, 1, 1)
+        )
+        self.assertTrue(Achievement.objects.filter(user=self.user, title='Первый успех').exists())
+        self.assertEqual(
+            LeaderboardEntry.objects.get(user=self.user, category='other', period='all').completed_challenges, 1
+        )
+
+    def test_failing_user_does_not_stop_the_run(self):
+        other = User.objects.create_user(username='second', password='testpass123')
+        UserChallenge.objects.create(
+            user=other, custom_title='Готово', custom_duration=1,
+            start_date=timezone.now().date() - timedelta(days=3), completed_days=1
+        )
+        handler = JOB_HANDLERS['post_checkin']
+        handled = []
+
+        def flaky(user, payload):
+            handled.append(user.username)
+            if user == self.user:
+                Achievement.objects.create(user=user, type='streak', title='Откатится', description='')
+                raise RuntimeError('сбой')
+            return handler(user, payload)
+
+        with mock.patch.dict(JOB_HANDLERS, {'post_checkin': flaky}), self.assertLogs(
+            'challenges.management.commands.expire_challenges', 'ERROR'
+        ):
+            call_command('expire_challenges', stdout=StringIO())
+        self.assertEqual(sorted(handled), ['expiring', 'second'])
+        self.assertFalse(Achievement.objects.filter(user=self.user).exists())
+        self.assertTrue(Achievement.objects.filter(user=other, title='Первый успех').exists())
+
+    @override_settings(CHALLENGES_ASYNC_JOBS=True)
+    def test_enqueues_achievement_jobs_for_affected_users(self):
+        User.objects.create_user(username='untouched', password='testpass123')
+        call_command('expire_challenges', stdout=StringIO())
+
+        job = Job.objects.get()
+        self.assertEqual((job.user, job.payload), (self.user, {'events': [EVENT_STATUS]}))
+        self.assertFalse(Achievement.objects.exists())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='testpass123')
+        self.client.force_login(self.user)
+        today = timezone.now().date()
+        self.challenge = UserChallenge.objects.create(
+            user=self.user, custom_title='Бег', custom_category='sport', custom_duration=30,
+            start_date=today - timedelta(days=2)
+        )
+        for offset in range(3):
+            DailyCheckin.objects.create(
+                user_challenge=self.challenge, date=today - timedelta(days=offset),
+                is_completed=offset != 1, rating=4 if offset != 1 else None
+            )
+        UserChallenge.objects.create(user=self.user, custom_title='Пустой', custom_duration=10)
+        other = User.objects.create_user(username='other', password='testpass123')
+        UserChallenge.objects.create(user=other, custom_title='Чужой', custom_duration=10)
+
+    def test_csv_export_streams_own_rows(self):
+        response = self.client.get('/my-export/')
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['title'] for row in rows}, {'Бег', 'Пустой'})
+        self.assertEqual(rows[0]['category'], 'sport')
+        self.assertEqual(rows[-1]['date'], '')
+
+    def test_gzipped_ndjson_export(self):
+        response = self.client.get('/my-export/?format=ndjson&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(sum(row['is_completed'] is True for row in rows), 2)
+
+    def test_command_exports_all_users(self):
+        path = os.path.join(tempfile.mkdtemp(), 'all.csv')
+        call_command('export_challenges', '--output', path)
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 5)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='testpass123')
+        self.client.force_login(self.user)
+        self.today = timezone.now().date()
+
+    def csv_upload(self, rows, name='history.csv'):
+        lines = ['title,category,duration_days,date,is_completed,rating'] + rows
+        return SimpleUploadedFile(name, '\n'.join(lines).encode('utf-8'), content_type='text/csv')
+
+    def test_upload_creates_challenge_and_recounts_once(self):
+        rows = [f'Чтение,study,10,{self.today - timedelta(days=offset)},True,5' for offset in range(4)]
+        rows.append(f'Чтение,study,10,{self.today - timedelta(days=4)},false,')
+        response = self.client.post('/my-import/', {'file': self.csv_upload(rows)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imported'], 5)
+        self.assertEqual(response.json()['challenges_created'], 1)
+        challenge = UserChallenge.objects.get(user=self.user)
+        self.assertEqual((challenge.custom_category, challenge.custom_duration), ('study', 10))
+        self.assertEqual(challenge.start_date, self.today - timedelta(days=4))
+        self.assertEqual(challenge.completed_days, 4)
+        self.assertEqual(get_user_stats(self.user).completed_checkins, 4)
+        self.assertEqual(ActivityDay.objects.filter(user=self.user).count(), 4)
+
+    def test_read_error_keeps_saved_batches_consistent(self):
+        def rows():
+            for offset in range(3):
+                yield {'title': 'Чтение', 'date': str(self.today - timedelta(days=offset)), 'is_completed': 'true'}
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        importer = CheckinImporter(self.user, today=self.today, batch_size=2)
+        with self.assertRaises(UnicodeDecodeError):
+            importer.run(rows())
+        # Первый пакет сохранен своей транзакцией, производные данные пересчитаны
+        self.assertEqual(importer.result()['imported'], 2)
+        self.assertEqual(UserChallenge.objects.get(user=self.user).completed_days, 2)
+        self.assertEqual(get_user_stats(self.user).completed_checkins, 2)
+
+    def test_database_error_keeps_saved_batches_consistent(self):
+        save_batch = CheckinImporter.save_batch
+        calls = []
+
+        def failing(importer, rows):
+            calls.append(len(rows))
+            if len(calls) > 1:
+                raise OperationalError('database is locked')
+            return save_batch(importer, rows)
+
+        rows = [{'title': 'Чтение', 'date': str(self.today - timedelta(days=offset)), 'is_completed': 'true'} for offset in range(3)]
+        importer = CheckinImporter(self.user, today=self.today, batch_size=2)
+        with mock.patch.object(CheckinImporter, 'save_batch', failing), self.assertRaises(OperationalError):
+            importer.run(rows)
+        self.assertEqual(UserChallenge.objects.get(user=self.user).completed_days, 2)
+        self.assertEqual(get_user_stats(self.user).completed_checkins, 2)
+
+    def test_reimport_skips_existing_checkins(self):
+        challenge = UserChallenge.objects.create(
+            user=self.user, custom_title='Бег', custom_duration=30, start_date=self.today - timedelta(days=5)
+        )
+        DailyCheckin.objects.create(user_challenge=challenge, date=self.today, is_completed=True)
+        rows = [f'бег,,,{self.today},True,', f'Бег,,,{self.today - timedelta(days=1)},True,', 'Бег,,,not-a-date,True,']
+        result = self.client.post('/my-import/', {'file': self.csv_upload(rows)}).json()
+
+        self.assertEqual((result['imported'], result['duplicates'], result['skipped']), (1, 1, 1))
+        self.assertEqual(result['challenges_created'], 0)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertEqual(challenge.checkins.count(), 2)
+
+    def test_command_restores_gzipped_export(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        source = UserChallenge.objects.create(
+            user=other, custom_title='Йога', custom_duration=7, start_date=self.today - timedelta(days=2)
+        )
+        for offset in range(3):
+            DailyCheckin.objects.create(user_challenge=source, date=self.today - timedelta(days=offset))
+        path = os.path.join(tempfile.mkdtemp(), 'dump.ndjson.gz')
+        call_command('export_challenges', '--format', 'ndjson', '--gzip', '--output', path)
+
+        out = StringIO()
+        call_command('import_checkins', path, '--user', 'importer', '--batch-size', '2', stdout=out)
+        self.assertIn('импортировано отметок: 3', out.getvalue())
+        restored = UserChallenge.objects.get(user=self.user)
+        self.assertEqual((restored.title, restored.start_date), ('Йога', source.start_date))
+        self.assertEqual(restored.checkins.count(), 3)
+
+
+@override_settings(DATABASE_ROUTERS=[], CHALLENGES_METRICS_DIR=None, CHALLENGES_METRICS_TOKEN='scrape-token')
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics_store.clear()
+        self.staff = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+
+    def test_records_views_and_queries(self):
+        self.client.force_login(self.staff)
+        self.client.get('/profile/')
+        self.client.get('/no-such-page/')
+        text = self.client.get('/metrics').content.decode()
+
+        self.assertIn('challenges_http_requests_total{view="profile",method="GET",status="200"} 1', text)
+        self.assertIn('challenges_http_requests_total{view="unresolved",method="GET",status="404"} 1', text)
+        self.assertIn('challenges_http_request_duration_seconds_bucket{view="profile",le="+Inf"} 1', text)
+        queries = [line for line in text.splitlines() if line.startswith('challenges_db_queries_total{view="profile"}')]
+        self.assertGreater(int(queries[0].split()[-1]), 0)
+
+    def test_requires_staff_or_token(self):
+        User.objects.create_user(username='regular', password='testpass123')
+        self.client.login(username='regular', password='testpass123')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer токен')
+        self.assertEqual(response.status_code, 403)
+
+    def test_sums_worker_files(self):
+        directory = tempfile.mkdtemp()
+        other_worker = {'requests': {'home\tGET\t200': 5}, 'views': {}}
+        with open(os.path.join(directory, 'metrics-1-abc.json'), 'w') as f:
+            json.dump(other_worker, f)
+
+        with self.settings(CHALLENGES_METRICS_DIR=directory):
+            self.client.get('/')
+            text = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+        self.assertIn('challenges_http_requests_total{view="home",method="GET",status="200"} 6', text)
+
+
+class StreakTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='streaker', password='testpass123')
+        self.today = timezone.now().date()
+        self.challenge = UserChallenge.objects.create(
+            user=self.user, custom_title='Бег', custom_duration=30, start_date=self.today - timedelta(days=10)
+        )
+
+    def checkin(self, days_ago, is_completed=True):
+        return DailyCheckin.objects.create(
+            user_challenge=self.challenge, date=self.today - timedelta(days=days_ago), is_completed=is_completed
+        )
+
+    def counters(self):
+        self.challenge.refresh_from_db()
+        return (self.challenge.completed_days, self.challenge.current_streak,
+                self.challenge.longest_streak, self.challenge.last_completed_date)
+
+    def test_consecutive_days_extend_streak(self):
+        for days_ago in (5, 2, 1, 0):
+            self.checkin(days_ago)
+        self.assertEqual(self.counters(), (4, 3, 3, self.today))
+        self.assertEqual(self.challenge.active_streak, 3)
+
+    def test_toggle_and_delete_last_day(self):
+        for days_ago in (6, 5, 4, 3, 1, 0):
+            self.checkin(days_ago)
+        today = self.challenge.checkins.get(date=self.today)
+        today.is_completed = False
+        today.save()
+        self.assertEqual(self.counters(), (5, 1, 4, self.today - timedelta(days=1)))
+
+        self.challenge.checkins.get(date=self.today - timedelta(days=1)).delete()
+        self.assertEqual(self.counters(), (4, 4, 4, self.today - timedelta(days=3)))
+        self.assertEqual(self.challenge.active_streak, 0)
+
+    def test_past_day_out_of_order_rebuilds(self):
+        self.checkin(4)
+        self.checkin(2)
+        self.checkin(3)
+        self.assertEqual(self.counters(), (3, 3, 3, self.today - timedelta(days=2)))
+
+    def test_batch_checkins_rebuild_streaks(self):
+        self.client.force_login(self.user)
+        items = [{'challenge': self.challenge.pk, 'date': str(self.today - timedelta(days=offset))} for offset in (3, 1, 0)]
+        self.client.post('/my-challenges/checkins/', json.dumps({'items': items}), content_type='application/json')
+        self.assertEqual(self.counters(), (3, 2, 2, self.today))
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.users = []
+        for number, days in enumerate((3, 5, 1)):
+            user = User.objects.create_user(username=f'runner{number}', password='testpass123')
+            challenge = UserChallenge.objects.create(
+                user=user, custom_title='Бег', custom_category='sport', custom_duration=30,
+                start_date=self.today - timedelta(days=10)
+            )
+            for offset in range(days):
+                DailyCheckin.objects.create(user_challenge=challenge, date=self.today - timedelta(days=offset), is_completed=True)
+            JOB_HANDLERS['post_checkin'](user, {'challenge_ids': [challenge.pk], 'events': [EVENT_CHECKIN]})
+            self.users.append(user)
+
+    def test_streak_board_and_rank(self):
+        entries, has_next = leaderboard_page('streak', 'all', 'sport')
+        self.assertEqual([(rank, entry.user.username, entry.streak) for rank, entry in entries],
+                         [(1, 'runner1', 5), (2, 'runner0', 3), (3, 'runner2', 1)])
+        self.assertFalse(has_next)
+        self.assertEqual(user_rank(self.users[0], 'streak', 'all'), {'rank': 2, 'value': 3})
+        self.assertIsNone(user_rank(self.users[2], 'completion_rate', 'all'))
+
+    def test_page_and_rank_are_single_queries(self):
+        with self.assertNumQueries(1):
+            leaderboard_page('streak', 'week')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/leaderboard/?page=100000')
+        self.assertEqual(response.context['page'], MAX_PAGE)
+        self.assertTrue(any(f'OFFSET {(MAX_PAGE - 1) * 50}' in query['sql'] for query in queries.captured_queries))
+        with self.assertNumQueries(1):
+            user_rank(self.users[1], 'streak', 'week')
+
+    def assertEntriesMatchRebuild(self, user):
+        fields = ['category', 'period', 'period_start', 'streak', 'completion_rate',
+                  'completed_challenges', 'total_checkins', 'completed_checkins']
+        # Строки с нулевыми показателями пересчет не создает
+        stored = {
+            tuple(getattr(entry, name) for name in fields)
+            for entry in LeaderboardEntry.objects.filter(user=user)
+            if entry.total_checkins or entry.completed_challenges or entry.streak
+        }
+        expected = {tuple(getattr(entry, name) for name in fields) for entry in compute_user_entries(user.pk)}
+        self.assertEqual(stored, expected)
+
+    def test_events_update_rows_by_deltas(self):
+        user = self.users[0]
+        challenge = UserChallenge.objects.get(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            checkin = DailyCheckin.objects.create(
+                user_challenge=challenge, date=self.today - timedelta(days=5), is_completed=False
+            )
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertFalse(any(q.startswith('DELETE') and 'leaderboardentry' in q for q in sql))
+        self.assertFalse(any('COUNT' in q and 'challenges_dailycheckin' in q for q in sql))
+        self.assertEntriesMatchRebuild(user)
+
+        checkin.is_completed = True
+        checkin.save()
+        DailyCheckin.objects.create(user_challenge=challenge, date=self.today - timedelta(days=8), is_completed=False)
+        save_checkins_batch(user, [(challenge.pk, self.today - timedelta(days=7), True, 4, '')])
+        self.assertEntriesMatchRebuild(user)
+        self.assertEqual(LeaderboardEntry.objects.get(user=user, category='sport', period='all').total_checkins, 6)
+
+        challenge.custom_category = 'health'
+        challenge.save()
+        challenge.status = 'completed'
+        challenge.save()
+        self.assertEntriesMatchRebuild(user)
+
+        UserChallenge.objects.create(user=user, custom_title='Чтение', custom_category='study', custom_duration=5)
+        challenge.delete()
+        self.assertEntriesMatchRebuild(user)
+        self.assertIsNone(user_rank(user, 'streak', 'all'))
+
+    def test_view_and_compaction(self):
+        self.client.force_login(self.users[0])
+        response = self.client.get('/leaderboard/?metric=streak&period=all')
+        self.assertContains(response, 'Ваше место: <strong>2</strong>')
+
+        next_week = self.today + timedelta(days=7)
+        call_command('rebuild_leaderboards', '--today', next_week.isoformat(), stdout=StringIO())
+        self.assertFalse(LeaderboardEntry.objects.filter(period='week', period_start__lt=next_week - timedelta(days=6)).exists())
+        self.assertFalse(LeaderboardEntry.objects.filter(streak__gt=0).exists())
+
+
+@override_settings(DATABASE_ROUTERS=[], CHALLENGES_PAGE_CACHE_TIMEOUT=0)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='archivist', password='testpass123')
+        self.client.force_login(self.user)
+        today = timezone.now().date()
+        for number in range(25):
+            UserChallenge.objects.create(
+                user=self.user, custom_title=f'Архив {number:02}', custom_duration=10, status='completed',
+                custom_difficulty=number % 3 + 1, start_date=today - timedelta(days=100 - number // 2)
+            )
+        UserChallenge.objects.create(user=self.user, custom_title='Текущий', custom_duration=10)
+
+    def test_profile_filters_by_status_and_follows_cursor(self):
+        response = self.client.get('/profile/')
+        self.assertEqual([c.title for c in response.context['user_challenges']], ['Текущий'])
+
+        first = self.client.get('/profile/?status=completed').context
+        self.assertEqual(len(first['user_challenges']), 20)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(f"/profile/?status=completed&after={first['page'].next_cursor}").context
+        self.assertEqual(len(second['user_challenges']), 5)
+        self.assertFalse(second['page'].has_next)
+        titles = [c.title for c in first['user_challenges']] + [c.title for c in second['user_challenges']]
+        self.assertEqual(len(set(titles)), 25)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+    def test_list_sorts_by_difficulty_in_sql(self):
+        context = self.client.get('/challenges/?status=completed&sort=difficulty').context
+        difficulties = [c.custom_difficulty for c in context['challenges']]
+        self.assertEqual(difficulties, sorted(difficulties))
+
+        # Курсор другой сортировки не применяется - открывается первая страница
+        response = self.client.get(f"/challenges/?status=completed&sort=title&after={context['page'].next_cursor}")
+        self.assertEqual(response.context['challenges'][0].title, 'Архив 00')
+
+
+@skipUnless(fts5_supported(connection), 'SQLite без FTS5')
+@override_settings(DATABASE_ROUTERS=[], CHALLENGES_PAGE_CACHE_TIMEOUT=0)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='testpass123')
+        self.challenge = UserChallenge.objects.create(
+            user=self.user, custom_title='Утренний бег', custom_description='Бегать каждое утро', custom_duration=30
+        )
+        self.checkin = DailyCheckin.objects.create(
+            user_challenge=self.challenge, date=timezone.now().date(), notes='Пробежал <5> километров по парку'
+        )
+        other = User.objects.create_user(username='stranger', password='testpass123')
+        UserChallenge.objects.create(user=other, custom_title='Бег в парке', notes='километров много', custom_duration=5)
+
+    def test_signals_keep_index_in_sync(self):
+        results = search_user(self.user, 'киломе')
+        self.assertEqual([(r['kind'], r['checkin']) for r in results], [('checkin', self.checkin)])
+        self.assertEqual(results[0]['snippet'], 'Пробежал &lt;5&gt; <mark>километров</mark> по парку')
+
+        self.checkin.notes = 'Отдыхал'
+        self.checkin.save()
+        self.assertEqual(search_user(self.user, 'километров'), [])
+        # Пакетное сохранение идет в обход сигналов и переиндексирует отметки само
+        save_checkins_batch(self.user, [(self.challenge.pk, self.checkin.date, True, None, 'Плавал в бассейне')])
+        self.assertEqual([r['kind'] for r in search_user(self.user, 'бассейне')], ['checkin'])
+        self.challenge.delete()
+        self.assertEqual(search_user(self.user, 'бег'), [])
+
+    def test_title_ranks_above_body_and_operators_are_quoted(self):
+        DailyCheckin.objects.create(
+            user_challenge=self.challenge, date=timezone.now().date() - timedelta(days=1), notes='бег трусцой'
+        )
+        results = search_user(self.user, 'бег')
+        self.assertEqual(results[0]['kind'], 'challenge')
+        self.assertEqual(results[0]['title'], 'Утренний <mark>бег</mark>')
+        self.assertEqual(build_match('бег OR "NEAR(', 7), 'owner:u7 AND {title body}:("бег"* AND "or"* AND "near"*)')
+
+    def test_view_and_admin_use_index(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/search/?q=парку')
+        self.assertContains(response, '<mark>парку</mark>')
+        self.assertNotContains(response, 'Бег в парке')
+
+        self.assertTrue(site.is_registered(ChallengeTemplate))
+        request = RequestFactory().get('/admin/')
+        checkin_admin = site._registry[DailyCheckin]
+        found, _ = checkin_admin.get_search_results(request, DailyCheckin.objects.all(), 'километров')
+        self.assertEqual(list(found), [self.checkin])
+        challenge_admin = site._registry[UserChallenge]
+        found, _ = challenge_admin.get_search_results(request, UserChallenge.objects.all(), 'бегать')
+        self.assertEqual(list(found), [self.challenge])
+
+
+@override_settings(DATABASE_ROUTERS=[], CHALLENGES_PAGE_CACHE_TIMEOUT=0)
+class StatsApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='charts', password='testpass123')
+        self.client.force_login(self.user)
+        self.today = timezone.now().date()
+        self.challenge = UserChallenge.objects.create(
+            user=self.user, custom_title='Чтение', custom_duration=30, start_date=self.today - timedelta(days=9)
+        )
+        for offset, (done, rating) in enumerate([(True, 4), (False, None), (True, 2)]):
+            DailyCheckin.objects.create(
+                user_challenge=self.challenge, date=self.today - timedelta(days=2 - offset), is_completed=done, rating=rating
+            )
+        self.url = f'/api/v1/my-challenges/{self.challenge.pk}/stats/'
+
+    def test_challenge_series_and_summary(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['version'], 1)
+        self.assertEqual(data['series']['completed'], [True, False, True])
+        self.assertEqual(data['series']['ratings'], [4, None, 2])
+        self.assertEqual(data['series']['rating_7d'], [4.0, 4.0, 3.0])
+        self.assertEqual(data['series']['completion_rate_7d'], [100.0, 50.0, 66.67])
+        self.assertEqual(data['summary']['completed_days'], 2)
+        self.assertEqual(data['summary']['current_streak'], 1)
+
+        overall = self.client.get('/api/v1/my-stats/').json()
+        self.assertEqual(overall['summary']['total_checkins'], 3)
+        self.assertEqual(overall['series']['completed_checkins_7d'], [1, 2])
+        self.assertEqual(overall['challenges'][0]['completion_rate'], 66.7)
+        self.assertEqual(self.client.get('/api/v1/my-challenges/999/stats/').status_code, 404)
+
+    def test_not_modified_without_reading_checkins(self):
+        for url in (self.url, '/api/v1/my-stats/'):
+            etag = self.client.get(url)['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse(any('challenges_dailycheckin' in query['sql'] for query in queries.captured_queries))
+
+        etag = self.client.get(self.url)['ETag']
+        overall_etag = self.client.get('/api/v1/my-stats/')['ETag']
+        # Оценка меняет статистику, но не счетчики
+        checkin = DailyCheckin.objects.get(user_challenge=self.challenge, date=self.today)
+        checkin.rating = 5
+        checkin.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/my-stats/', HTTP_IF_NONE_MATCH=overall_etag).status_code, 200)
+
+    def test_batch_checkin_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.post('/my-challenges/checkins/', json.dumps({'items': [
+            {'challenge': self.challenge.pk, 'date': (self.today - timedelta(days=5)).isoformat(), 'is_completed': True},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['series']['dates']), 4)
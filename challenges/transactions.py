@@ -0,0 +1,39 @@
+# transactions.py
+"""
+Транзакции для путей записи.
+
+С боевым SQLite-профилем (challengehub.sqlite) внешняя транзакция
+immediate_atomic начинается с BEGIN IMMEDIATE. Со стандартным бэкендом
+это обычный transaction.atomic.
+"""
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import transaction
+
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    """transaction.atomic, который сразу берет блокировку на запись"""
+    connection = transaction.get_connection(using)
+    previous = getattr(connection, 'immediate_transactions', False)
+    if not connection.in_atomic_block:
+        connection.immediate_transactions = True
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        connection.immediate_transactions = previous
+
+
+def write_transaction(view):
+    """Выполняет изменяющие запросы к представлению в одной immediate-транзакции"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in WRITE_METHODS:
+            return view(request, *args, **kwargs)
+        with immediate_atomic():
+            return view(request, *args, **kwargs)
+    return wrapper
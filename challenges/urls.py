@@ -17,11 +17,20 @@ urlpatterns = [
     path('challenges/create-custom/', views.create_custom_challenge, name='create_custom'),
     
     path('my-challenges/<int:challenge_id>/checkin/', views.daily_checkin, name='daily_checkin'),
+    path('my-challenges/checkins/', views.batch_checkin, name='batch_checkin'),
     path('my-challenges/<int:challenge_id>/complete/', views.complete_challenge, name='complete_challenge'),
     path('my-challenges/<int:challenge_id>/calendar/', views.challenge_calendar, name='challenge_calendar'),
+    path('my-calendar/', views.combined_calendar, name='combined_calendar'),
     
     path('my-challenges/<int:challenge_id>/stats/', views.challenge_statistics, name='challenge_stats'),
     path('my-stats/', views.overall_statistics, name='overall_stats'),
+    path('api/v1/my-stats/', views.api_overall_statistics, name='api_overall_stats'),
+    path('api/v1/my-challenges/<int:challenge_id>/stats/', views.api_challenge_statistics, name='api_challenge_stats'),
+    path('my-export/', views.export_data, name='export_data'),
+    path('my-import/', views.import_data, name='import_data'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('search/', views.search, name='search'),
+    path('metrics', views.metrics, name='metrics'),
     
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(
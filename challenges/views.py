@@ -2,17 +2,45 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import login, logout
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.utils.timezone import now
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.offline as opy
+from django.views.decorators.http import condition, require_POST
+import calendar
+import hmac
+import json
 import random
-from datetime import datetime, timedelta
-from django.db import models
+from datetime import date, datetime, timedelta
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 
 from .models import ChallengeTemplate, UserChallenge, DailyCheckin, Achievement
 from .forms import UserRegisterForm, UserUpdateForm, StartChallengeForm, CustomChallengeForm
-from .achievements import check_and_create_achievements
+from .summary import get_user_stats
+from .achievements import EVENT_CHECKIN, EVENT_STATUS, EVENT_CHALLENGE
+from .jobs import dispatch
+from .transactions import write_transaction
+from .routers import read_only_view
+from .page_cache import cache_user_page
+from .checkins import BatchConflict, BatchError, parse_batch_items, save_checkins_batch
+from .export import FORMATS, export_stream
+from .imports import READ_ERRORS, CheckinImporter, open_upload, read_rows
+from .metrics import render_metrics
+from .leaderboard import MAX_PAGE, METRICS, PERIODS, leaderboard_page, user_rank
+from .pagination import keyset_page
+from .search import search_user
+from .stats_api import challenge_payload, challenge_updated_at, overall_payload, user_updated_at, validator
+
+STATUS_FILTERS = dict(UserChallenge.STATUS_CHOICES)
+
+PROFILE_ORDERING = ['status', '-start_date', '-pk']
+
+LIST_SORTS = {
+    'date': ['-start_date', '-pk'],
+    'title': ['effective_title', 'pk'],
+    'difficulty': ['custom_difficulty', '-start_date', '-pk'],
+    'duration': ['duration_key', 'pk'],
+}
 
 def logout_view(request):
     logout(request)
@@ -23,35 +51,40 @@ def home(request):
     return render(request, 'challenges/home.html')    
     
 def challenge_list(request):
-    """Список созданных пользователем челленджей с фильтрацией"""
+    """Список созданных пользователем челленджей с фильтрацией и постраничным выводом"""
+    page = status = sort = None
     if request.user.is_authenticated:
-        challenges = UserChallenge.objects.filter(user=request.user)
+        challenges = UserChallenge.objects.with_progress().filter(user=request.user)
         
         # Фильтрация по категории
         category = request.GET.get('category')
         if category:
-            challenges = challenges.filter(custom_category=category)
+            challenges = challenges.filter(effective_category=category)
         
-        # Сортировка
-        sort = request.GET.get('sort', 'date')
-        if sort == 'title':
-            challenges = challenges.order_by('custom_title')
-        elif sort == 'difficulty':
-            # Для кастомных челленджей сложность не хранится, можно добавить поле
-            challenges = challenges.order_by('custom_title')
-        elif sort == 'duration':
-            challenges = challenges.order_by('custom_duration')
-        elif sort == 'date':
-            challenges = challenges.order_by('-start_date')
+        status = request.GET.get('status', 'active')
+        if status in STATUS_FILTERS:
+            challenges = challenges.filter(status=status)
+        else:
+            status = 'all'
         
-        # Добавляем поле difficulty для шаблона (если нет в модели)
-        for challenge in challenges:
-            challenge.difficulty = 2  # Средняя сложность по умолчанию
+        # Сортировка - по колонкам в SQL, с id в конце для однозначного курсора
+        sort = request.GET.get('sort', 'date')
+        if sort not in LIST_SORTS:
+            sort = 'date'
+        if sort == 'duration':
+            # Курсор не умеет сравнивать с NULL
+            challenges = challenges.annotate(duration_key=Coalesce('effective_duration', Value(0)))
+        page = keyset_page(challenges, LIST_SORTS[sort], request.GET.get('after'))
+        challenges = page.items
     else:
         challenges = None
     
     return render(request, 'challenges/challenge_list.html', {
         'challenges': challenges,
+        'page': page,
+        'status': status,
+        'sort': sort,
+        'statuses': UserChallenge.STATUS_CHOICES,
         'user': request.user
     })
 
@@ -59,6 +92,7 @@ def challenge_detail(request, pk):
     """Готовых шаблонов больше нет - редирект"""
     return redirect('create_custom')
 
+@write_transaction
 def register(request):
     """Регистрация пользователя"""
     if request.method == 'POST':
@@ -75,6 +109,8 @@ def register(request):
     return render(request, 'challenges/register.html', {'form': form})
 
 @login_required
+@cache_user_page
+@write_transaction
 def profile(request):
     """Личный кабинет пользователя"""
     if request.method == 'POST':
@@ -86,19 +122,26 @@ def profile(request):
     else:
         user_form = UserUpdateForm(instance=request.user)
     
-    user_challenges = UserChallenge.objects.filter(user=request.user).order_by(
-        '-status',
-        '-start_date'
-    )
+    # Страница челленджей одного статуса по индексу (user, status, start_date)
+    status = request.GET.get('status', 'active')
+    user_challenges = UserChallenge.objects.with_progress().filter(user=request.user)
+    if status in STATUS_FILTERS:
+        user_challenges = user_challenges.filter(status=status)
+    else:
+        status = 'all'
+    page = keyset_page(user_challenges, PROFILE_ORDERING, request.GET.get('after'))
     
-    active_challenges = user_challenges.filter(status='active').count()
-    successful_completed = user_challenges.filter(status='completed').count()
+    summary = get_user_stats(request.user)
     
     return render(request, 'challenges/profile.html', {
         'user_form': user_form,
-        'user_challenges': user_challenges,
-        'active_challenges': active_challenges,
-        'completed_challenges': successful_completed,
+        'user_challenges': page.items,
+        'page': page,
+        'status': status,
+        'statuses': UserChallenge.STATUS_CHOICES,
+        'summary': summary,
+        'active_challenges': summary.active_challenges,
+        'completed_challenges': summary.completed_challenges,
     })
 
 @login_required
@@ -107,6 +150,7 @@ def start_challenge(request, pk):
     return redirect('create_custom')
 
 @login_required
+@write_transaction
 def create_custom_challenge(request):
     """Создать свой челлендж"""
     if request.method == 'POST':
@@ -120,6 +164,8 @@ def create_custom_challenge(request):
             user_challenge.start_date = now().date()
             user_challenge.save()
             
+            dispatch(request, 'post_checkin', {'events': [EVENT_CHALLENGE]})
+            
             messages.success(request, 'Ваш челлендж создан!')
             return redirect('profile')
     else:
@@ -128,6 +174,7 @@ def create_custom_challenge(request):
     return render(request, 'challenges/create_custom.html', {'form': form})
 
 @login_required
+@write_transaction
 def daily_checkin(request, challenge_id):
     """Ежедневная отметка"""
     user_challenge = get_object_or_404(UserChallenge, pk=challenge_id, user=request.user)
@@ -150,80 +197,27 @@ def daily_checkin(request, challenge_id):
         rating = request.POST.get('rating')
         notes = request.POST.get('notes', '')
         
-        was_completed_before = existing_checkin.is_completed if existing_checkin else False
-        
+        # Счетчики и серии челленджа обновляют сигналы отметки (streaks.py)
         if existing_checkin:
             existing_checkin.is_completed = is_completed
             existing_checkin.rating = int(rating) if rating else None
             existing_checkin.notes = notes
             existing_checkin.save()
-            
-            if is_completed and not was_completed_before:
-                user_challenge.completed_days += 1
-            elif not is_completed and was_completed_before:
-                user_challenge.completed_days -= 1
         else:
-            checkin = DailyCheckin.objects.create(
+            DailyCheckin.objects.create(
                 user_challenge=user_challenge,
                 date=today,
                 is_completed=is_completed,
                 rating=int(rating) if rating else None,
                 notes=notes
             )
-            
-            if is_completed:
-                user_challenge.completed_days += 1
-        
-        # Пересчитываем текущую серию
-        streak = 0
-        checkins = user_challenge.checkins.filter(is_completed=True).order_by('-date')
-        for checkin_day in checkins:
-            streak += 1
-        user_challenge.current_streak = streak
         
-        # Сохраняем изменения в челлендже
-        user_challenge.save()
-        
-        # Проверяем, не завершился ли челлендж
-        user_challenge.check_and_complete()
-        
-        # ✅ ВАЖНОЕ ИЗМЕНЕНИЕ: Пересчитываем ВСЕ достижения
-        try:
-            # Импортируем новую функцию
-            from .achievements import recalculate_all_achievements
-            
-            # Пересоздаем все достижения
-            new_achievements = recalculate_all_achievements(request.user)
-            
-            # Показываем только действительно НОВЫЕ достижения
-            # (те, которые только что созданы после пересчета)
-            if new_achievements:
-                for achievement in new_achievements:
-                    messages.success(
-                        request, 
-                        f'🎉 Новое достижение: "{achievement.title}"! '
-                        f'{achievement.description}'
-                    )
-            else:
-                # Если достижения были, но все старые
-                existing_achievements_count = Achievement.objects.filter(user=request.user).count()
-                if existing_achievements_count > 0:
-                    messages.info(request, f'У вас {existing_achievements_count} достижений. Продолжайте в том же духе!')
-                    
-        except Exception as e:
-            print(f"Ошибка при создании достижений: {e}")
-            # Если что-то пошло не так, пробуем старый метод как fallback
-            try:
-                from .achievements import check_and_create_achievements
-                new_achievements = check_and_create_achievements(request.user)
-                if new_achievements:
-                    for achievement in new_achievements:
-                        messages.success(
-                            request, 
-                            f'🎉 Новое достижение: "{achievement.title}"!'
-                        )
-            except Exception as e2:
-                print(f"Fallback тоже не сработал: {e2}")
+        # Завершение челленджа и достижения проверяются после ответа (или сразу,
+        # если фоновая очередь выключена); результат придет сообщением
+        dispatch(request, 'post_checkin', {
+            'challenge_ids': [user_challenge.pk],
+            'events': [EVENT_CHECKIN],
+        })
         
         messages.success(request, 'Отметка сохранена!')
         return redirect('profile')
@@ -235,6 +229,32 @@ def daily_checkin(request, challenge_id):
     })
 
 @login_required
+@require_POST
+@write_transaction
+def batch_checkin(request):
+    """Пакетная отметка: JSON {"items": [{"challenge", "date", "is_completed", "rating", "notes"}, ...]}"""
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'errors': ['Тело запроса должно быть JSON']}, status=400)
+    try:
+        items = parse_batch_items(payload.get('items') if isinstance(payload, dict) else None, now().date())
+        created, updated, challenge_ids = save_checkins_batch(request.user, items)
+    except BatchConflict as e:
+        return JsonResponse({'errors': e.errors}, status=409)
+    except BatchError as e:
+        return JsonResponse({'errors': e.errors}, status=400)
+    
+    # Завершение челленджей и достижения проверяются один раз на весь пакет
+    dispatch(request, 'post_checkin', {
+        'challenge_ids': challenge_ids,
+        'events': [EVENT_CHECKIN],
+    })
+    
+    return JsonResponse({'created': created, 'updated': updated})
+
+@login_required
+@write_transaction
 def complete_challenge(request, challenge_id):
     """Завершить челлендж досрочно"""
     user_challenge = get_object_or_404(UserChallenge, pk=challenge_id, user=request.user)
@@ -249,13 +269,7 @@ def complete_challenge(request, challenge_id):
             user_challenge.status = 'completed'
             user_challenge.save()
             
-            try:
-                new_achievements = check_and_create_achievements(request.user)
-                if new_achievements:
-                    for achievement in new_achievements:
-                        messages.info(request, f'🏆 Достижение: {achievement.title}!')
-            except Exception as e:
-                print(f"Ошибка при создании достижений: {e}")
+            dispatch(request, 'post_checkin', {'events': [EVENT_STATUS]})
             
             messages.success(request, f'Челлендж "{user_challenge.title}" завершен! Прогресс: {user_challenge.completion_percentage}%')
             return redirect('profile')
@@ -267,20 +281,54 @@ def complete_challenge(request, challenge_id):
         'user_challenge': user_challenge
     })
 
+MONTH_NAMES = [
+    'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+    'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь',
+]
+
+def _month_bounds(month_start):
+    """Первый и последний день месяца"""
+    last_day = calendar.monthrange(month_start.year, month_start.month)[1]
+    return month_start, month_start.replace(day=last_day)
+
+def _shift_month(month_start, delta):
+    month_index = month_start.year * 12 + month_start.month - 1 + delta
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def _requested_month(request, default):
+    """Месяц из параметра ?month=ГГГГ-ММ или месяц даты default"""
+    try:
+        return datetime.strptime(request.GET.get('month', ''), '%Y-%m').date()
+    except ValueError:
+        return default.replace(day=1)
+
 @login_required
+@cache_user_page
 def challenge_calendar(request, challenge_id):
-    """Календарь прогресса челленджа"""
+    """Календарь прогресса челленджа (по месяцам)"""
     user_challenge = get_object_or_404(UserChallenge, pk=challenge_id, user=request.user)
     
-    calendar_data = []
     start_date = user_challenge.start_date
-    end_date = user_challenge.end_date or (start_date + timedelta(days=user_challenge.duration_days))
-    
-    current_date = start_date
+    end_date = user_challenge.end_date or (start_date + timedelta(days=user_challenge.duration_days or 0))
     today = now().date()
     
-    while current_date <= end_date:
-        checkin = user_challenge.checkins.filter(date=current_date).first()
+    # По умолчанию показываем текущий месяц, если он попадает в челлендж
+    default_month = min(max(today, start_date), end_date)
+    month_start, month_end = _month_bounds(_requested_month(request, default_month))
+    
+    window_start = max(month_start, start_date)
+    window_end = min(month_end, end_date)
+    
+    # Все отметки видимого диапазона одним запросом
+    checkins_by_date = {
+        checkin.date: checkin
+        for checkin in user_challenge.checkins.filter(date__range=(window_start, window_end))
+    }
+    
+    calendar_data = []
+    current_date = window_start
+    while current_date <= window_end:
+        checkin = checkins_by_date.get(current_date)
         calendar_data.append({
             'date': current_date,
             'is_completed': checkin.is_completed if checkin else False,
@@ -289,10 +337,69 @@ def challenge_calendar(request, challenge_id):
         })
         current_date += timedelta(days=1)
     
+    previous_month = _shift_month(month_start, -1)
+    next_month = _shift_month(month_start, 1)
+    
     return render(request, 'challenges/challenge_calendar.html', {
         'user_challenge': user_challenge,
         'calendar_data': calendar_data,
-        'today': today
+        'today': today,
+        'month_title': f'{MONTH_NAMES[month_start.month - 1]} {month_start.year}',
+        'previous_month': previous_month if previous_month >= start_date.replace(day=1) else None,
+        'next_month': next_month if next_month <= end_date else None,
+    })
+
+@login_required
+@cache_user_page
+def combined_calendar(request):
+    """Общий календарь всех активных челленджей пользователя за месяц"""
+    today = now().date()
+    month_start, month_end = _month_bounds(_requested_month(request, today))
+    
+    active_challenges = list(
+        UserChallenge.objects.filter(user=request.user, status='active')
+        .select_related('template')
+        .order_by('start_date', 'id')
+    )
+    
+    # Отметки всех активных челленджей за месяц - один запрос
+    checkins = DailyCheckin.objects.filter(
+        user_challenge__user=request.user,
+        user_challenge__status='active',
+        date__range=(month_start, month_end)
+    ).only('user_challenge_id', 'date', 'is_completed', 'rating')
+    checkins_by_key = {(checkin.user_challenge_id, checkin.date): checkin for checkin in checkins}
+    
+    weeks = []
+    for week in calendar.Calendar().monthdatescalendar(month_start.year, month_start.month):
+        week_data = []
+        for day in week:
+            entries = []
+            if day.month == month_start.month:
+                for challenge in active_challenges:
+                    end_date = challenge.end_date
+                    if day < challenge.start_date or (end_date and day > end_date):
+                        continue
+                    checkin = checkins_by_key.get((challenge.id, day))
+                    entries.append({
+                        'challenge': challenge,
+                        'is_completed': checkin.is_completed if checkin else False,
+                        'has_checkin': checkin is not None,
+                    })
+            week_data.append({
+                'date': day,
+                'in_month': day.month == month_start.month,
+                'entries': entries,
+            })
+        weeks.append(week_data)
+    
+    return render(request, 'challenges/combined_calendar.html', {
+        'weeks': weeks,
+        'active_challenges': active_challenges,
+        'today': today,
+        'month_title': f'{MONTH_NAMES[month_start.month - 1]} {month_start.year}',
+        'previous_month': _shift_month(month_start, -1),
+        'next_month': _shift_month(month_start, 1),
     })
 
 def get_motivational_quote():
@@ -371,6 +478,8 @@ def get_category_recommendation(category):
     })
 
 @login_required
+@cache_user_page
+@read_only_view
 def challenge_statistics(request, challenge_id):
     """Статистика конкретного челленджа с графиками"""
     user_challenge = get_object_or_404(UserChallenge, pk=challenge_id, user=request.user)
@@ -384,85 +493,9 @@ def challenge_statistics(request, challenge_id):
             'message': 'Нет данных для анализа. Сделайте первую отметку!'
         })
     
-    dates = []
-    ratings = []
-    completed = []
-    notes_lengths = []
-    
-    for checkin in checkins:
-        dates.append(checkin.date)
-        ratings.append(checkin.rating if checkin.rating else 0)
-        completed.append(1 if checkin.is_completed else 0)
-        notes_lengths.append(len(checkin.notes) if checkin.notes else 0)
-    
-    graphs = []
-    
-    fig1 = go.Figure()
-    fig1.add_trace(go.Scatter(
-        x=dates, 
-        y=ratings,
-        mode='lines+markers',
-        name='Оценка дня',
-        line=dict(color='blue', width=2),
-        marker=dict(size=8)
-    ))
-    fig1.update_layout(
-        title='Динамика оценок',
-        xaxis_title='Дата',
-        yaxis_title='Оценка (1-5)',
-        template='plotly_white',
-        height=350
-    )
-    graphs.append(('Оценки', opy.plot(fig1, auto_open=False, output_type='div')))
-    
-    fig2 = go.Figure(data=[
-        go.Bar(
-            x=dates,
-            y=completed,
-            name='Выполнено',
-            marker_color=['#28a745' if x == 1 else '#dc3545' for x in completed]
-        )
-    ])
-    fig2.update_layout(
-        title='✅ Выполнение по дням',
-        xaxis_title='Дата',
-        yaxis_title='Выполнено (1) / Не выполнено (0)',
-        template='plotly_white',
-        height=350
-    )
-    graphs.append(('📅 Выполнение', opy.plot(fig2, auto_open=False, output_type='div')))
-    
-    total_days = len(completed)
-    completed_days = sum(completed)
-    completion_rate = (completed_days / total_days * 100) if total_days > 0 else 0
-    
-    ratings_with_values = [r for r in ratings if r > 0]
-    avg_rating = sum(ratings_with_values) / len(ratings_with_values) if ratings_with_values else 0
-    
-    current_streak = 0
-    max_streak = 0
-    temp_streak = 0
-    
-    for comp in reversed(completed):
-        if comp == 1:
-            temp_streak += 1
-            if temp_streak > max_streak:
-                max_streak = temp_streak
-        else:
-            break
-    
-    current_streak = temp_streak
-    
-    statistics = {
-        'total_days': total_days,
-        'completed_days': completed_days,
-        'completion_rate': round(completion_rate, 1),
-        'avg_rating': round(avg_rating, 2),
-        'current_streak': current_streak,
-        'max_streak': max_streak,
-        'total_notes_chars': sum(notes_lengths),
-        'avg_notes_length': round(sum(notes_lengths) / len([x for x in notes_lengths if x > 0]), 1) if any(notes_lengths) else 0,
-    }
+    # pandas и plotly загружаются только при первом открытии статистики
+    from . import analytics
+    graphs, statistics = analytics.challenge_statistics(user_challenge, checkins)
     
     category_recommendation = get_category_recommendation(user_challenge.category)
     motivational_quote = get_motivational_quote()
@@ -477,125 +510,178 @@ def challenge_statistics(request, challenge_id):
     })
 
 @login_required
+@cache_user_page
+@read_only_view
 def overall_statistics(request):
     """Общая статистика пользователя"""
-    user_challenges = UserChallenge.objects.filter(user=request.user)
-    
-    if not user_challenges:
+    if not UserChallenge.objects.filter(user=request.user).exists():
         return render(request, 'challenges/overall_stats.html', {
             'has_data': False,
             'message': 'У вас пока нет челленджей для анализа.'
         })
     
-    data = []
-    total_unique_days = set()
-    
-    for challenge in user_challenges:
-        checkins = challenge.checkins.all()
-        if checkins:
-            completed_days = checkins.filter(is_completed=True).count()
-            total_days = checkins.count()
-            completion_rate = (completed_days / total_days * 100) if total_days > 0 else 0
-            
-            for checkin in checkins:
-                total_unique_days.add(checkin.date)
-            
-            data.append({
-                'title': challenge.title,
-                'category': challenge.category,
-                'completion_rate': completion_rate,
-                'duration': challenge.duration_days,
-                'status': challenge.status,
-                'start_date': challenge.start_date,
-                'streak': challenge.current_streak,
-                'actual_days': total_days,
-                'completed_days': completed_days,
-            })
+    from . import analytics
+    result = analytics.overall_statistics(request.user)
     
-    if not data:
+    if result is None:
         return render(request, 'challenges/overall_stats.html', {
             'has_data': False,
             'message': 'Нет данных по челленджам для анализа.'
         })
     
-    df = pd.DataFrame(data)
-    
-    graphs = []
-    
-    fig1 = go.Figure(data=[
-        go.Bar(
-            x=df['title'].str[:20],
-            y=df['completion_rate'],
-            marker_color='lightblue',
-            text=df['completion_rate'].round(1).astype(str) + '%',
-            textposition='auto',
-            width=0.6
-        )
-    ])
-    fig1.update_layout(
-        title='📊 Процент выполнения по челленджам',
-        xaxis_title='Челлендж',
-        yaxis_title='Процент выполнения (%)',
-        template='plotly_white',
-        height=450,
-        margin=dict(l=50, r=50, t=80, b=150),
-        xaxis_tickangle=-45
-    )
-    graphs.append(('Процент выполнения', opy.plot(fig1, auto_open=False, output_type='div')))
-    
-    category_counts = df['category'].value_counts()
-    fig2 = go.Figure(data=[
-        go.Pie(
-            labels=[dict(ChallengeTemplate.CATEGORY_CHOICES).get(cat, cat) for cat in category_counts.index],
-            values=category_counts.values,
-            hole=.3,
-            textinfo='label+percent',
-            marker=dict(colors=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD']),
-            textfont=dict(size=14)
-        )
-    ])
-    fig2.update_layout(
-        title='🏷️ Распределение по категориям',
-        template='plotly_white',
-        height=500,
-        margin=dict(l=20, r=20, t=80, b=20),
-        showlegend=True,
-        legend=dict(
-            font=dict(size=12),
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1
-        )
-    )
-    graphs.append(('Категории', opy.plot(fig2, auto_open=False, output_type='div')))
-    
-    total_challenges = len(df)
-    active_challenges = len(df[df['status'] == 'active'])
-    completed_challenges = len(df[df['status'] == 'completed'])
-    avg_completion_rate = df['completion_rate'].mean()
-    
-    statistics = {
-        'total_challenges': total_challenges,
-        'active_challenges': active_challenges,
-        'completed_challenges': completed_challenges,
-        'avg_completion_rate': round(avg_completion_rate, 1),
-        'total_days_tracked': len(total_unique_days),
-        'total_checkins': df['actual_days'].sum(),
-        'total_completed': df['completed_days'].sum(),
-    }
-    
+    graphs, statistics = result
     return render(request, 'challenges/overall_stats.html', {
         'graphs': graphs,
         'statistics': statistics,
         'has_data': True
     })
 
+def _stats_validator(request, challenge_id=None):
+    """
+    (ETag, Last-Modified) API статистики - один запрос к строке челленджа
+    или сводки; запоминается в запросе, чтобы condition() не читал дважды
+    """
+    if not hasattr(request, '_stats_validator'):
+        if challenge_id is None:
+            updated_at = user_updated_at(request.user)
+        else:
+            updated_at = challenge_updated_at(request.user, challenge_id)
+        request._stats_validator = updated_at and validator(updated_at, now().date())
+    return request._stats_validator
+
+def _stats_etag(request, challenge_id=None):
+    result = _stats_validator(request, challenge_id)
+    return result and result[0]
+
+def _stats_last_modified(request, challenge_id=None):
+    result = _stats_validator(request, challenge_id)
+    return result and result[1]
+
+@login_required
+@read_only_view
+@condition(etag_func=_stats_etag, last_modified_func=_stats_last_modified)
+def api_challenge_statistics(request, challenge_id):
+    """Статистика челленджа в JSON: ряды по датам и сводные числа; 304, если отметки не менялись"""
+    user_challenge = get_object_or_404(UserChallenge.objects.select_related('template'), pk=challenge_id, user=request.user)
+    return JsonResponse(challenge_payload(user_challenge))
+
+@login_required
+@read_only_view
+@condition(etag_func=_stats_etag, last_modified_func=_stats_last_modified)
+def api_overall_statistics(request):
+    """Общая статистика пользователя в JSON; 304, если отметки и челленджи не менялись"""
+    return JsonResponse(overall_payload(request.user, now().date()))
+
+@login_required
+def export_data(request):
+    """Выгрузка своих челленджей и отметок: ?format=csv|ndjson&gzip=1"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return JsonResponse({'errors': [f'Формат должен быть одним из: {", ".join(FORMATS)}']}, status=400)
+    compress = request.GET.get('gzip') == '1'
+    
+    filename = f'challenges-{request.user.username}.{fmt}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        export_stream(fmt, [request.user], compress),
+        content_type='application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson') + '; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+@require_POST
+def import_data(request):
+    """Импорт истории отметок: multipart-поле file в формате выгрузки (CSV или NDJSON, можно .gz)"""
+    upload = request.FILES.get('file')
+    fmt = request.POST.get('format') or None
+    if upload is None:
+        return JsonResponse({'errors': ['Нужен файл в поле file']}, status=400)
+    if fmt is not None and fmt not in FORMATS:
+        return JsonResponse({'errors': [f'Формат должен быть одним из: {", ".join(FORMATS)}']}, status=400)
+    
+    # Без общей транзакции запроса: импортер пишет короткими транзакциями
+    # по пакетам и не держит блокировку записи на все время загрузки
+    stream, fmt = open_upload(upload, upload.name, fmt)
+    importer = CheckinImporter(request.user, today=now().date())
+    read_error = None
+    try:
+        importer.run(read_rows(stream, fmt))
+    except READ_ERRORS:
+        # Пакеты до ошибки уже сохранены - сообщаем, сколько их
+        read_error = 'Не удалось прочитать файл: нужен CSV или NDJSON в UTF-8 (можно gzip)'
+    result = importer.result()
+    
+    payload = importer.post_checkin_payloads().get(request.user.pk)
+    if payload:
+        dispatch(request, 'post_checkin', payload)
+    
+    if read_error:
+        result['errors'] = [read_error] + result['errors']
+        return JsonResponse(result, status=400)
+    return JsonResponse(result)
+
+@read_only_view
+def leaderboard(request):
+    """Таблица лидеров: ?metric=streak|completion_rate|completed_challenges&period=week|month|all&category=&page="""
+    metric = request.GET.get('metric', 'streak')
+    period = request.GET.get('period', 'week')
+    category = request.GET.get('category', '')
+    if metric not in METRICS:
+        metric = 'streak'
+    if period not in PERIODS:
+        period = 'week'
+    if category not in dict(ChallengeTemplate.CATEGORY_CHOICES):
+        category = ''
+    try:
+        page = min(max(1, int(request.GET.get('page', 1))), MAX_PAGE)
+    except ValueError:
+        page = 1
+    
+    entries, has_next = leaderboard_page(metric, period, category, page)
+    my_rank = user_rank(request.user, metric, period, category) if request.user.is_authenticated else None
+    
+    return render(request, 'challenges/leaderboard.html', {
+        'entries': entries,
+        'metric': metric,
+        'period': period,
+        'category': category,
+        'page': page,
+        'has_next': has_next,
+        'my_rank': my_rank,
+        'metrics': METRICS,
+        'periods': PERIODS,
+        'categories': ChallengeTemplate.CATEGORY_CHOICES,
+    })
+
+@login_required
+@cache_user_page
+@read_only_view
+def search(request):
+    """Поиск по своим челленджам и заметкам: ?q="""
+    query = request.GET.get('q', '').strip()
+    results = search_user(request.user, query) if query else []
+    return render(request, 'challenges/search.html', {
+        'query': query,
+        'results': results,
+    })
+
+def metrics(request):
+    """Метрики в формате Prometheus: для staff или по токену CHALLENGES_METRICS_TOKEN"""
+    token = getattr(settings, 'CHALLENGES_METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    # Байты, а не str: compare_digest не принимает строки с не-ASCII символами
+    has_token = token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not has_token and not request.user.is_staff:
+        return HttpResponseForbidden('Метрики доступны только персоналу')
+    
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
+@cache_user_page
+@read_only_view
 def achievements(request):
     """Страница достижений пользователя"""
-    user_achievements = Achievement.objects.filter(user=request.user).order_by('-earned_date')
+    user_achievements = list(Achievement.objects.filter(user=request.user).order_by('-earned_date'))
     
     achievements_by_type = {}
     for achievement in user_achievements:
@@ -603,8 +689,8 @@ def achievements(request):
             achievements_by_type[achievement.type] = []
         achievements_by_type[achievement.type].append(achievement)
     
-    total_achievements = user_achievements.count()
-    completed_achievements = user_achievements.filter(progress__gte=models.F('target')).count()
+    total_achievements = len(user_achievements)
+    completed_achievements = sum(1 for achievement in user_achievements if achievement.is_completed)
     
     return render(request, 'challenges/achievements.html', {
         'achievements': user_achievements,